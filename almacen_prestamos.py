@@ -0,0 +1,286 @@
+"""Módulo de almacenamiento del historial de préstamos cerrados
+
+Los préstamos devueltos ya no cambian, así que se guardan como registros
+binarios de ancho fijo añadidos al final de ``<ruta>`` y se leen con
+``mmap``: recorrer el historial no obliga a tenerlo en memoria como
+diccionarios, y buscar por libro o usuario solo decodifica los registros
+que coinciden.
+
+Cada registro tiene, en este orden:
+
+- ``id_prestamo``, ``fecha_prestamo``, ``fecha_devolucion`` y
+  ``fecha_vencimiento``: 32 bytes de texto UTF-8 rellenos con ceros.
+- ``isbn_libro`` e ``id_usuario``: índice de 4 bytes en la tabla de textos.
+- Los campos adicionales, si los hay, como índice del JSON que los reúne.
+
+Los ISBN e identificadores de usuario se repiten en miles de préstamos y
+se internan en ``<ruta>.textos``, un texto JSON por línea. Un texto que
+no cabe en su campo también va a esa tabla y el campo guarda su índice.
+
+Los archivos de la versión 1, sin ``fecha_vencimiento``, se siguen
+leyendo y ampliando con su formato; el vencimiento de los préstamos que
+se les añadan va entre los campos adicionales.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CABECERA = b'HISTPRST'
+VERSION = 2
+_CABECERA = struct.Struct('<8sII')
+
+# (campo, tipo): 'texto' va en línea y 'tabla' siempre en la tabla de textos
+CAMPOS = (
+    ('id_prestamo', 'texto'),
+    ('isbn_libro', 'tabla'),
+    ('id_usuario', 'tabla'),
+    ('fecha_prestamo', 'texto'),
+    ('fecha_devolucion', 'texto'),
+    ('fecha_vencimiento', 'texto'),
+)
+# Campos de los registros de cada versión del formato
+CAMPOS_POR_VERSION = {1: CAMPOS[:5], 2: CAMPOS}
+ANCHO_TEXTO = 32
+
+def _registro(campos: tuple) -> struct.Struct:
+    """Estructura de un registro con esos campos y el de adicionales"""
+    return struct.Struct('<' + ''.join(f'{ANCHO_TEXTO}s' if tipo == 'texto' else 'I'
+                                       for _, tipo in campos) + 'I')
+
+# Índice que representa None en los campos de tabla y en los adicionales
+NINGUNO = 0xFFFFFFFF
+# Primer byte de un campo de texto que vale None o que remite a la tabla;
+# ninguno de los dos aparece nunca en UTF-8
+_NULO = 0xFE
+_EN_TABLA = 0xFF
+
+# Registros que se copian del mapa de una vez al recorrerlo
+REGISTROS_POR_BLOQUE = 4096
+
+def _en_linea(valor: Any) -> Optional[bytes]:
+    """Contenido de un campo de texto, o None si el valor no cabe en él"""
+    if valor is None:
+        return bytes((_NULO,))
+    if not isinstance(valor, str):
+        return None
+    crudo = valor.encode('utf-8')
+    if len(crudo) > ANCHO_TEXTO or b'\x00' in crudo:
+        return None
+    return crudo
+
+def _remite(indice: int) -> bytes:
+    """Contenido de un campo de texto que remite a la tabla de textos"""
+    return bytes((_EN_TABLA,)) + indice.to_bytes(4, 'little')
+
+class AlmacenPrestamos:
+    """Registros de préstamos cerrados de solo añadir, leídos con mmap
+    
+    La cantidad de registros válidos la decide quien lo usa (ver
+    ``abrir``), de modo que los añadidos de una escritura que no llegó a
+    confirmarse se descartan al volver a abrirlo. Un campo de ``CAMPOS``
+    que falte en un préstamo se lee como None.
+    """
+    
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.ruta_textos = ruta + '.textos'
+        self.cantidad = 0
+        self._textos: List[str] = []
+        self._indice_textos: Dict[str, int] = {}
+        self._leido_textos = 0
+        self._mapa: Optional[mmap.mmap] = None
+        self._formato(VERSION)
+    
+    def _formato(self, version: int):
+        """Fija los campos y el tamaño de registro de una versión"""
+        self.version = version
+        self.campos = CAMPOS_POR_VERSION[version]
+        self._registro = _registro(self.campos)
+        self._posiciones = {campo: i for i, (campo, _) in enumerate(self.campos)}
+    
+    def __len__(self) -> int:
+        return self.cantidad
+    
+    def abrir(self, cantidad: int):
+        """Lee los textos nuevos y deja válidos los primeros ``cantidad`` registros
+        
+        Los registros que sobren, de una escritura interrumpida, se
+        descartan del archivo.
+        """
+        self._leer_textos()
+        self._mapa = None
+        if not os.path.exists(self.ruta):
+            with open(self.ruta, 'wb') as f:
+                f.write(_CABECERA.pack(CABECERA, VERSION, _registro(CAMPOS).size))
+        with open(self.ruta, 'r+b') as f:
+            cabecera, version, tamano = _CABECERA.unpack(f.read(_CABECERA.size))
+            if (cabecera != CABECERA or version not in CAMPOS_POR_VERSION
+                    or tamano != _registro(CAMPOS_POR_VERSION[version]).size):
+                raise ValueError(f"Formato de historial desconocido: {self.ruta}")
+            self._formato(version)
+            disponibles = (os.fstat(f.fileno()).st_size - _CABECERA.size) // tamano
+            if disponibles < cantidad:
+                logger.warning("%s tiene %d registros y se esperaban %d",
+                               self.ruta, disponibles, cantidad)
+                cantidad = disponibles
+            f.truncate(_CABECERA.size + cantidad * tamano)
+        self.cantidad = cantidad
+    
+    def _leer_textos(self):
+        """Añade a la tabla los textos escritos desde la última lectura"""
+        if not os.path.exists(self.ruta_textos):
+            return
+        with open(self.ruta_textos, 'r+b') as f:
+            f.seek(self._leido_textos)
+            for linea in f:
+                try:
+                    texto = json.loads(linea)
+                except ValueError:
+                    # Línea incompleta de una escritura interrumpida
+                    f.truncate(self._leido_textos)
+                    break
+                self._leido_textos += len(linea)
+                self._indice_textos.setdefault(texto, len(self._textos))
+                self._textos.append(texto)
+    
+    @property
+    def rutas(self) -> List[str]:
+        """Archivos del almacén"""
+        return [self.ruta, self.ruta_textos]
+    
+    def anadir(self, prestamos: List[Dict[str, Any]]) -> bool:
+        """Añade préstamos al final del historial y los lleva al disco"""
+        nuevos: List[str] = []
+        indice_nuevos: Dict[str, int] = {}
+        
+        def internar(texto: str) -> int:
+            indice = self._indice_textos.get(texto)
+            if indice is None:
+                indice = indice_nuevos.get(texto)
+            if indice is None:
+                indice = indice_nuevos[texto] = len(self._textos) + len(nuevos)
+                nuevos.append(texto)
+            return indice
+        
+        bloque = b''.join(self._codificar(p, internar) for p in prestamos)
+        try:
+            # Los textos primero: un registro nunca remite a uno que falte
+            if nuevos:
+                lineas = ''.join(json.dumps(t, ensure_ascii=False) + '\n' for t in nuevos)
+                with open(self.ruta_textos, 'ab') as f:
+                    escrito = f.write(lineas.encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(self.ruta, 'ab') as f:
+                f.write(bloque)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            logger.exception("Error al guardar %s", self.ruta)
+            return False
+        
+        if nuevos:
+            self._leido_textos += escrito
+            self._textos.extend(nuevos)
+            self._indice_textos.update(indice_nuevos)
+        self.cantidad += len(prestamos)
+        self._mapa = None
+        return True
+    
+    def _codificar(self, prestamo: Dict[str, Any], internar) -> bytes:
+        """Registro binario de un préstamo"""
+        valores = []
+        for campo, tipo in self.campos:
+            valor = prestamo.get(campo)
+            if tipo == 'tabla':
+                valores.append(NINGUNO if valor is None else internar(valor))
+            else:
+                crudo = _en_linea(valor)
+                valores.append(crudo if crudo is not None else _remite(internar(valor)))
+        
+        adicionales = {k: v for k, v in prestamo.items() if k not in self._posiciones}
+        valores.append(internar(json.dumps(adicionales, ensure_ascii=False, sort_keys=True))
+                       if adicionales else NINGUNO)
+        return self._registro.pack(*valores)
+    
+    def _decodificar(self, valores: tuple) -> Dict[str, Any]:
+        """Préstamo a partir de los valores de un registro"""
+        textos = self._textos
+        prestamo = {}
+        for (campo, tipo), valor in zip(self.campos, valores):
+            if tipo == 'tabla':
+                prestamo[campo] = None if valor == NINGUNO else textos[valor]
+            elif valor[0] == _NULO:
+                prestamo[campo] = None
+            elif valor[0] == _EN_TABLA:
+                prestamo[campo] = textos[int.from_bytes(valor[1:5], 'little')]
+            else:
+                prestamo[campo] = valor.rstrip(b'\x00').decode('utf-8')
+        if valores[-1] != NINGUNO:
+            prestamo.update(json.loads(textos[valores[-1]]))
+        return prestamo
+    
+    def _registros(self) -> Iterator[tuple]:
+        """Recorre los valores de los registros sin decodificarlos
+        
+        Copia bloques del mapa en lugar de exponerlo, así que añadir
+        registros mientras se recorre no invalida el recorrido.
+        """
+        cantidad = self.cantidad
+        if not cantidad:
+            return
+        if self._mapa is None:
+            with open(self.ruta, 'rb') as f:
+                self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mapa = self._mapa
+        registro = self._registro
+        fin = _CABECERA.size + cantidad * registro.size
+        paso = REGISTROS_POR_BLOQUE * registro.size
+        for inicio in range(_CABECERA.size, fin, paso):
+            yield from registro.iter_unpack(mapa[inicio:min(inicio + paso, fin)])
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Recorre el historial en el orden en que se cerraron los préstamos"""
+        for valores in self._registros():
+            yield self._decodificar(valores)
+    
+    def buscar(self, campo: str, valor: Any) -> Iterator[Dict[str, Any]]:
+        """Préstamos cuyo campo vale ``valor``, decodificando solo esos
+        
+        Los campos adicionales no tienen posición fija y se comparan
+        decodificando cada registro.
+        """
+        posicion = self._posiciones.get(campo)
+        if posicion is None:
+            for prestamo in self:
+                if prestamo.get(campo) == valor:
+                    yield prestamo
+            return
+        crudo = self._crudo(campo, valor)
+        if crudo is None:
+            return
+        for valores in self._registros():
+            if valores[posicion] == crudo:
+                yield self._decodificar(valores)
+    
+    def _crudo(self, campo: str, valor: Any) -> Any:
+        """Cómo aparece ``valor`` en el campo de un registro, o None si no aparece"""
+        indice = self._indice_textos.get(valor) if valor is not None else NINGUNO
+        if self.campos[self._posiciones[campo]][1] == 'tabla':
+            return indice
+        crudo = _en_linea(valor)
+        if crudo is None and indice is not None:
+            crudo = _remite(indice)
+        # Así es como lo devuelve struct al leer el registro
+        return None if crudo is None else crudo.ljust(ANCHO_TEXTO, b'\x00')
+    
+    def cerrar(self):
+        """Libera el mapa del archivo"""
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = None
@@ -0,0 +1,74 @@
+"""Benchmark de arranque con carga completa frente a carga perezosa
+
+Uso: python benchmarks/bench_arranque.py [prestamos]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+
+PRESTAMOS = 1_000_000
+LIBROS = 10_000
+USUARIOS = 5_000
+
+def generar_archivo(ruta: str, prestamos: int):
+    """Escribe un biblioteca.json sintético sin construirlo entero en memoria"""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('{"libros": [')
+        f.write(','.join(json.dumps({
+            'isbn': f'978-{i}', 'titulo': f'Libro {i}', 'autor': f'Autor {i % 500}',
+            'disponible': True}) for i in range(LIBROS)))
+        f.write('], "usuarios": [')
+        f.write(','.join(json.dumps({
+            'id_usuario': f'U{i}', 'nombre': f'Usuario {i}', 'email': f'u{i}@email.com',
+            'activo': True}) for i in range(USUARIOS)))
+        f.write('], "prestamos": [')
+        for i in range(prestamos):
+            if i:
+                f.write(',')
+            f.write(json.dumps({
+                'id_prestamo': f'P-{i}', 'isbn_libro': f'978-{i % LIBROS}',
+                'id_usuario': f'U{i % USUARIOS}',
+                'fecha_prestamo': '2025-10-12T22:21:25.681838',
+                'fecha_devolucion': '2025-10-20T10:00:00.000000'}))
+        f.write(']}')
+
+def memoria_maxima_mb() -> float:
+    """Memoria residente máxima del proceso, si el sistema la informa"""
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def medir(ruta: str, modo: str):
+    """Abre la base y obtiene los libros, como hace la primera pantalla"""
+    inicio = time.perf_counter()
+    db = Database(ruta, perezoso=(modo == 'perezoso'))
+    libros = db.obtener_todos('libros')
+    total = time.perf_counter() - inicio
+    print(f"{modo:<10} {total:>10.3f} {memoria_maxima_mb():>12.1f}   ({len(libros)} libros)")
+
+def main():
+    """Compara el arranque de ambos modos, cada uno en un proceso nuevo"""
+    if len(sys.argv) > 2:
+        medir(sys.argv[1], sys.argv[2])
+        return
+    
+    prestamos = int(sys.argv[1]) if len(sys.argv) > 1 else PRESTAMOS
+    ruta = os.path.join(tempfile.mkdtemp(), 'bench.json')
+    generar_archivo(ruta, prestamos)
+    print(f"{prestamos} préstamos, {os.path.getsize(ruta) / 1e6:.1f} MB")
+    print(f"{'modo':<10} {'segundos':>10} {'memoria (MB)':>12}")
+    for modo in ('completo', 'perezoso'):
+        subprocess.run([sys.executable, __file__, ruta, modo], check=True)
+    os.remove(ruta)
+
+if __name__ == '__main__':
+    main()
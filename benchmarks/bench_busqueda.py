@@ -0,0 +1,56 @@
+"""Benchmark del índice de búsqueda de texto sobre un catálogo grande
+
+Uso: python benchmarks/bench_busqueda.py [libros]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from busqueda import IndiceTexto
+
+LIBROS = 500_000
+REPETICIONES = 20
+
+PALABRAS = ['Cálculo', 'Álgebra', 'Historia', 'Química', 'Física', 'Introducción',
+            'Avanzada', 'Moderna', 'Teoría', 'Práctica', 'Manual', 'Guía', 'Análisis',
+            'Lineal', 'Numérico', 'Orgánica', 'Estadística', 'Probabilidad',
+            'Geometría', 'Diferencial', 'Economía', 'Filosofía', 'Derecho', 'Biología']
+
+CONSULTAS = ['calculo 4711', 'autor123 quim', 'apellido12 lineal', 'historia moderna guia',
+             'calc', 'algebra']
+
+def generar_libros(n: int):
+    """Títulos y autores sintéticos con tildes y palabras repetidas"""
+    aleatorio = random.Random(1)
+    autores = [f'Autor{i} Apellido{i % 700}' for i in range(5000)]
+    for i in range(n):
+        titulo = ' de '.join(aleatorio.sample(PALABRAS, 3)) + f' {i}'
+        yield f'978-{i}', {'titulo': titulo, 'autor': aleatorio.choice(autores)}
+
+def main():
+    """Construye el índice y mide la mediana de cada consulta"""
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else LIBROS
+    libros = list(generar_libros(n))
+    
+    indice = IndiceTexto()
+    inicio = time.perf_counter()
+    for isbn, campos in libros:
+        indice.agregar(isbn, campos)
+    print(f"{n} libros indexados en {time.perf_counter() - inicio:.1f} s")
+    indice.buscar('zz')  # ordena el vocabulario antes de medir
+    
+    print(f"{'consulta':<24} {'resultados':>10} {'mediana (ms)':>14}")
+    for consulta in CONSULTAS:
+        tiempos = []
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            resultados = indice.buscar(consulta, limite=50)
+            tiempos.append(time.perf_counter() - inicio)
+        print(f"{consulta:<24} {len(resultados):>10} {statistics.median(tiempos) * 1000:>14.3f}")
+
+if __name__ == '__main__':
+    main()
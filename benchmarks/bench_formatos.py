@@ -0,0 +1,70 @@
+"""Benchmark de tamaño y tiempos de guardado y carga por formato
+
+Uso: python benchmarks/bench_formatos.py [prestamos]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import formatos
+from database import Database
+
+PRESTAMOS = 300_000
+LIBROS = 20_000
+USUARIOS = 5_000
+
+def generar_datos(prestamos: int) -> dict:
+    """Construye un conjunto de datos sintético"""
+    return {
+        'libros': [
+            {'isbn': f'978-{i}', 'titulo': f'Cálculo {i}', 'autor': f'Autor {i % 500}',
+             'disponible': i % 3 != 0}
+            for i in range(LIBROS)
+        ],
+        'usuarios': [
+            {'id_usuario': f'U{i}', 'nombre': f'Usuario {i}', 'email': f'u{i}@email.com',
+             'activo': True}
+            for i in range(USUARIOS)
+        ],
+        'prestamos': [
+            {'id_prestamo': f'P-{i}', 'isbn_libro': f'978-{i % LIBROS}',
+             'id_usuario': f'U{i % USUARIOS}',
+             'fecha_prestamo': '2025-10-12T22:21:25.681838',
+             'fecha_devolucion': '2025-10-20T10:00:00.000000' if i % 10 else None}
+            for i in range(prestamos)
+        ]
+    }
+
+def main():
+    """Guarda y carga los mismos datos en cada formato disponible"""
+    prestamos = int(sys.argv[1]) if len(sys.argv) > 1 else PRESTAMOS
+    datos = generar_datos(prestamos)
+    directorio = tempfile.mkdtemp()
+    
+    print(f"{LIBROS} libros, {USUARIOS} usuarios, {prestamos} préstamos")
+    print(f"{'formato':<14} {'tamaño (MB)':>12} {'guardar (s)':>12} {'cargar (s)':>12}")
+    for formato in formatos.FORMATOS:
+        if formato == 'msgpack' and formatos.msgpack is None:
+            print(f"{formato:<14} {'(no instalado)':>12}")
+            continue
+        ruta = os.path.join(directorio, f'bench.{formato}')
+        db = Database(ruta, formato=formato)
+        db.datos = datos
+        
+        inicio = time.perf_counter()
+        db.guardar_datos()
+        guardar = time.perf_counter() - inicio
+        
+        inicio = time.perf_counter()
+        Database(ruta)
+        cargar = time.perf_counter() - inicio
+        
+        print(f"{formato:<14} {os.path.getsize(ruta) / 1e6:>12.1f} "
+              f"{guardar:>12.2f} {cargar:>12.2f}")
+        os.remove(ruta)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Micro-benchmark de búsqueda por clave primaria en Database"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+
+TAMANOS = [1_000, 10_000, 100_000, 300_000]
+REPETICIONES = 200
+
+def crear_database(n: int) -> Database:
+    """Crea una base de datos en memoria con n libros"""
+    archivo = os.path.join(tempfile.mkdtemp(), 'bench.json')
+    db = Database(archivo)
+    db.datos['libros'] = [
+        {'isbn': f'978-{i}', 'titulo': f'Libro {i}', 'autor': 'Autor', 'disponible': True}
+        for i in range(n)
+    ]
+    db._reconstruir_indices()
+    return db
+
+def main():
+    """Mide la latencia de búsqueda con índice y con recorrido lineal"""
+    print(f"{'libros':>10} {'indice (us)':>14} {'lineal (us)':>14}")
+    for n in TAMANOS:
+        db = crear_database(n)
+        objetivo = f'978-{n - 1}'
+        elementos = db.datos['libros']
+        
+        t_indice = timeit.timeit(
+            lambda: db.buscar('libros', 'isbn', objetivo), number=REPETICIONES)
+        t_lineal = timeit.timeit(
+            lambda: [e for e in elementos if e.get('isbn') == objetivo],
+            number=max(1, REPETICIONES // 20)) * 20
+        
+        print(f"{n:>10} {t_indice / REPETICIONES * 1e6:>14.2f} "
+              f"{t_lineal / REPETICIONES * 1e6:>14.2f}")
+
+if __name__ == '__main__':
+    main()
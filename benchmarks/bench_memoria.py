@@ -0,0 +1,77 @@
+"""Benchmark de memoria por registro de los modelos
+
+Uso: python benchmarks/bench_memoria.py [registros]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import Prestamo
+from database import Database
+from biblioteca import GestorBiblioteca
+
+REGISTROS = 200_000
+
+@dataclass
+class PrestamoSinSlots:
+    """Préstamo como dataclass convencional, tal como era antes"""
+    id_prestamo: str
+    isbn_libro: str
+    id_usuario: str
+    fecha_prestamo: str
+    fecha_devolucion: Optional[str] = None
+
+def generar_filas(n: int) -> list:
+    """Filas de préstamos activos como las guarda Database"""
+    return [
+        {'id_prestamo': f'P-{i}', 'isbn_libro': f'978-{i}', 'id_usuario': f'U{i % 5000}',
+         'fecha_prestamo': '2025-10-12T22:21:25.681838', 'fecha_devolucion': None}
+        for i in range(n)
+    ]
+
+def bytes_por_registro(filas: list, modelo) -> float:
+    """Memoria que ocupan los objetos creados, sin contar las cadenas compartidas"""
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objetos = [modelo(**f) for f in filas]
+    despues = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objetos
+    return (despues - antes) / len(filas)
+
+def medir_listado(n: int):
+    """Tiempo de obtener_prestamos_activos la primera vez y las siguientes"""
+    db = Database(os.path.join(tempfile.mkdtemp(), 'bench.json'))
+    db.datos['prestamos'] = generar_filas(n)
+    db._reconstruir_indices()
+    gestor = GestorBiblioteca(db)
+    
+    inicio = time.perf_counter()
+    gestor.obtener_prestamos_activos()
+    primera = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    gestor.obtener_prestamos_activos()
+    repetida = time.perf_counter() - inicio
+    print(f"obtener_prestamos_activos: {primera * 1000:.1f} ms la primera vez, "
+          f"{repetida * 1000:.1f} ms al repetir")
+
+def main():
+    """Compara bytes por registro de cada representación"""
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else REGISTROS
+    filas = generar_filas(n)
+    print(f"{n} préstamos")
+    print(f"{'representación':<24} {'bytes por registro':>20}")
+    print(f"{'dict':<24} {bytes_por_registro(filas, dict):>20.1f}")
+    print(f"{'dataclass':<24} {bytes_por_registro(filas, PrestamoSinSlots):>20.1f}")
+    print(f"{'dataclass(slots=True)':<24} {bytes_por_registro(filas, Prestamo):>20.1f}")
+    medir_listado(n)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Prueba de carga del servicio HTTP en el camino de préstamo y devolución
+
+Arranca ``servidor.py`` en otro proceso y lanza clientes concurrentes que
+prestan y devuelven libros sin parar.
+
+Uso: python benchmarks/bench_servidor.py [clientes] [ciclos por cliente]
+"""
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CLIENTES = 16
+CICLOS = 100
+
+class Cliente:
+    """Conexión persistente al servicio"""
+    
+    def __init__(self, puerto: int):
+        self.conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=60)
+    
+    def post(self, ruta: str, cuerpo: dict) -> int:
+        """Envía un POST con cuerpo JSON y devuelve el código de estado"""
+        self.conexion.request('POST', ruta, body=json.dumps(cuerpo),
+                              headers={'Content-Type': 'application/json'})
+        respuesta = self.conexion.getresponse()
+        respuesta.read()
+        return respuesta.status
+
+def arrancar_servidor(archivo: str):
+    """Lanza el servicio en un puerto libre y espera a que escuche"""
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, 'servidor.py'), '--archivo', archivo,
+         '--puerto', '0'],
+        stdout=subprocess.PIPE, text=True)
+    linea = proceso.stdout.readline()
+    return proceso, int(linea.rsplit(':', 1)[1])
+
+def trabajar(puerto: int, numero: int, ciclos: int, latencias: list, errores: list):
+    """Presta y devuelve el libro propio del cliente ``ciclos`` veces"""
+    cliente = Cliente(puerto)
+    isbn, id_usuario = f'978-{numero}', f'U{numero}'
+    for _ in range(ciclos):
+        inicio = time.perf_counter()
+        estado = cliente.post('/prestamos', {'isbn': isbn, 'id_usuario': id_usuario})
+        latencias.append(time.perf_counter() - inicio)
+        if estado != 201:
+            errores.append(estado)
+        estado = cliente.post('/devoluciones', {'isbn': isbn})
+        if estado != 200:
+            errores.append(estado)
+
+def main():
+    """Prepara los datos, lanza los clientes y resume los resultados"""
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else CLIENTES
+    ciclos = int(sys.argv[2]) if len(sys.argv) > 2 else CICLOS
+    archivo = os.path.join(tempfile.mkdtemp(), 'bench.json')
+    proceso, puerto = arrancar_servidor(archivo)
+    try:
+        preparacion = Cliente(puerto)
+        for i in range(clientes):
+            preparacion.post('/libros', {'isbn': f'978-{i}', 'titulo': f'Libro {i}',
+                                         'autor': 'Autor'})
+            preparacion.post('/usuarios', {'id_usuario': f'U{i}', 'nombre': f'Usuario {i}',
+                                           'email': f'u{i}@email.com'})
+        
+        latencias, errores = [], []
+        hilos = [threading.Thread(target=trabajar,
+                                  args=(puerto, i, ciclos, latencias, errores))
+                 for i in range(clientes)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        total = time.perf_counter() - inicio
+        
+        peticiones = 2 * clientes * ciclos
+        latencias.sort()
+        p99 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]
+        print(f"{clientes} clientes, {ciclos} préstamos y devoluciones cada uno")
+        print(f"peticiones/s:        {peticiones / total:>10.0f}")
+        print(f"préstamo p50 (ms):   {statistics.median(latencias) * 1000:>10.2f}")
+        print(f"préstamo p99 (ms):   {p99 * 1000:>10.2f}")
+        print(f"errores:             {len(errores):>10}")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark de escrituras por préstamo con y sin transacción"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+from biblioteca import GestorBiblioteca
+
+LIBROS = 20_000
+USUARIOS = 2_000
+PRESTAMOS = 100
+
+def crear_database() -> Database:
+    """Crea una base de datos con libros y usuarios sintéticos"""
+    archivo = os.path.join(tempfile.mkdtemp(), 'bench.json')
+    db = Database(archivo)
+    db.datos['libros'] = [
+        {'isbn': f'978-{i}', 'titulo': f'Libro {i}', 'autor': f'Autor {i % 500}',
+         'disponible': True}
+        for i in range(LIBROS)
+    ]
+    db.datos['usuarios'] = [
+        {'id_usuario': f'U{i}', 'nombre': f'Usuario {i}', 'email': f'u{i}@email.com',
+         'activo': True}
+        for i in range(USUARIOS)
+    ]
+    db._reconstruir_indices()
+    db.guardar_datos()
+    return db
+
+def contar_escrituras(db: Database) -> list:
+    """Envuelve guardar_datos para contar cuántas veces se llama"""
+    escrituras = []
+    guardar_original = db.guardar_datos
+    db.guardar_datos = lambda: escrituras.append(1) or guardar_original()
+    return escrituras
+
+def prestar_sin_transaccion(db: Database, isbn: str, id_usuario: str):
+    """Reproduce el préstamo anterior: dos escrituras independientes"""
+    db.actualizar('libros', 'isbn', isbn, {'disponible': False})
+    db.agregar('prestamos', {
+        'id_prestamo': f'P-{isbn}', 'isbn_libro': isbn, 'id_usuario': id_usuario,
+        'fecha_prestamo': datetime.now().isoformat(), 'fecha_devolucion': None
+    })
+
+def medir(nombre: str, prestar):
+    """Mide el coste por préstamo de una estrategia"""
+    db = crear_database()
+    escrituras = contar_escrituras(db)
+    inicio = time.perf_counter()
+    for i in range(PRESTAMOS):
+        prestar(db, f'978-{i}', f'U{i % USUARIOS}')
+    total = time.perf_counter() - inicio
+    print(f"{nombre:<18} {len(escrituras) / PRESTAMOS:>12.1f} "
+          f"{total / PRESTAMOS * 1000:>16.2f}")
+
+def main():
+    """Compara el préstamo con dos escrituras frente al transaccional"""
+    print(f"{LIBROS} libros, {USUARIOS} usuarios, {PRESTAMOS} préstamos")
+    print(f"{'estrategia':<18} {'escrituras':>12} {'ms por préstamo':>16}")
+    medir('sin transacción', prestar_sin_transaccion)
+    medir('con transacción',
+          lambda db, isbn, id_usuario: GestorBiblioteca(db).prestar_libro(isbn, id_usuario))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Generador de bibliotecas sintéticas para los benchmarks
+
+Uso: python benchmarks/datos_sinteticos.py archivo.json [libros] [usuarios] [prestamos]
+"""
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+# Parte de los libros que está prestada en cada momento
+PROPORCION_PRESTADOS = 0.1
+
+def generar_datos(libros: int, usuarios: int, prestamos: int,
+                  semilla: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+    """Construye libros, usuarios y un historial de préstamos coherentes
+    
+    Los préstamos son en su mayoría devoluciones ya cerradas; el último
+    préstamo de un ``PROPORCION_PRESTADOS`` de los libros queda activo y
+    esos libros figuran como no disponibles.
+    """
+    aleatorio = random.Random(semilla)
+    activos = min(prestamos, int(libros * PROPORCION_PRESTADOS)) if usuarios else 0
+    datos = {
+        'libros': [
+            {'isbn': f'978-{i}', 'titulo': f'Libro {i}', 'autor': f'Autor {i % 500}',
+             'disponible': i >= activos}
+            for i in range(libros)
+        ],
+        'usuarios': [
+            {'id_usuario': f'U{i}', 'nombre': f'Usuario {i}', 'email': f'u{i}@email.com',
+             'activo': True}
+            for i in range(usuarios)
+        ],
+        'prestamos': []
+    }
+    if not libros or not usuarios:
+        return datos
+    
+    inicio = datetime(2020, 1, 1)
+    historial = datos['prestamos']
+    for n in range(prestamos - activos):
+        # Los cerrados no tocan los libros que siguen prestados
+        isbn = f'978-{aleatorio.randrange(activos, libros)}'
+        fecha = inicio + timedelta(minutes=n)
+        historial.append({
+            'id_prestamo': f'H-{n}', 'isbn_libro': isbn,
+            'id_usuario': f'U{aleatorio.randrange(usuarios)}',
+            'fecha_prestamo': fecha.isoformat(),
+            'fecha_devolucion': (fecha + timedelta(days=14)).isoformat()
+        })
+    for i in range(activos):
+        historial.append({
+            'id_prestamo': f'A-{i}', 'isbn_libro': f'978-{i}',
+            'id_usuario': f'U{aleatorio.randrange(usuarios)}',
+            'fecha_prestamo': datetime.now().isoformat(), 'fecha_devolucion': None
+        })
+    return datos
+
+def escribir(ruta: str, libros: int, usuarios: int, prestamos: int, semilla: int = 1):
+    """Escribe una biblioteca sintética como JSON compacto"""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(generar_datos(libros, usuarios, prestamos, semilla), f,
+                  ensure_ascii=False, separators=(',', ':'))
+
+def main():
+    """Genera un archivo desde la línea de comandos"""
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    libros = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    usuarios = int(sys.argv[3]) if len(sys.argv) > 3 else libros // 2
+    prestamos = int(sys.argv[4]) if len(sys.argv) > 4 else libros * 5
+    escribir(sys.argv[1], libros, usuarios, prestamos)
+
+if __name__ == '__main__':
+    main()
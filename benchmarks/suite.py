@@ -0,0 +1,191 @@
+"""Suite de benchmarks de las operaciones principales de la biblioteca
+
+Mide el tiempo y la memoria de las operaciones más usadas de
+``GestorBiblioteca`` y ``Database`` con bibliotecas sintéticas de varios
+tamaños, y puede guardar los resultados en JSON. Con ``--comparar``
+contrasta dos ejecuciones y señala las regresiones.
+
+Uso:
+    python benchmarks/suite.py [--tamanos 1000 10000] [--almacen json] [--salida r.json]
+    python benchmarks/suite.py --comparar base.json nuevo.json [--umbral 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from biblioteca import GestorBiblioteca
+from database import Database, DatabaseDiario, DatabaseHistorial
+from database_sqlite import SQLiteDatabase
+import datos_sinteticos
+
+TAMANOS = [1_000, 10_000, 50_000]
+USUARIOS_POR_LIBRO = 0.5
+PRESTAMOS_POR_LIBRO = 5
+REPETICIONES = 20
+# Cuánto más lenta (o con más memoria) puede salir una operación sin
+# considerarse una regresión
+UMBRAL = 0.2
+
+ALMACENES = {
+    'json': Database,
+    'diario': DatabaseDiario,
+    'historial': DatabaseHistorial,
+    'sqlite': SQLiteDatabase,
+}
+
+def abrir(almacen: str, directorio: str, libros: int, usuarios: int,
+          prestamos: int) -> GestorBiblioteca:
+    """Genera una biblioteca sintética y la abre con el almacenamiento elegido"""
+    ruta_json = os.path.join(directorio, 'biblioteca.json')
+    datos_sinteticos.escribir(ruta_json, libros, usuarios, prestamos)
+    if almacen == 'sqlite':
+        db = SQLiteDatabase(os.path.join(directorio, 'biblioteca.db'))
+        db.migrar_desde_json(ruta_json)
+    else:
+        db = ALMACENES[almacen](ruta_json)
+    if almacen == 'historial':
+        # Traslada los préstamos cerrados antes de medir nada
+        db.guardar_datos()
+    return GestorBiblioteca(db)
+
+def operaciones(gestor: GestorBiblioteca, libros: int,
+                usuarios: int) -> List[Tuple[str, Callable[[int], Any]]]:
+    """Operaciones a medir; cada una recibe el número de repetición
+    
+    Se ejecutan en este orden, de modo que ``devolver_libro`` devuelve los
+    libros que prestó ``prestar_libro``. Los últimos libros del catálogo
+    sintético están disponibles.
+    """
+    def libre(i: int) -> str:
+        return f'978-{libros - 1 - i}'
+    
+    return [
+        ('agregar_libro', lambda i: gestor.agregar_libro(f'979-{i}', f'Nuevo {i}', 'Autor')),
+        ('prestar_libro', lambda i: gestor.prestar_libro(libre(i), f'U{i % usuarios}')),
+        ('devolver_libro', lambda i: gestor.devolver_libro(libre(i))),
+        ('obtener_prestamos_activos', lambda i: gestor.obtener_prestamos_activos()),
+        ('guardar_datos', lambda i: gestor.db.guardar_datos()),
+    ]
+
+def medir(operacion: Callable[[int], Any], repeticiones: int) -> Dict[str, float]:
+    """Tiempos de ``repeticiones`` llamadas y memoria de una llamada más
+    
+    La memoria se mide aparte, con ``tracemalloc`` activo solo durante la
+    primera llamada, porque el rastreo ralentiza todo lo que se ejecuta.
+    """
+    tracemalloc.start()
+    operacion(0)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    tiempos = []
+    for i in range(1, repeticiones + 1):
+        inicio = time.perf_counter()
+        operacion(i)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        'mediana_ms': statistics.median(tiempos),
+        'p95_ms': tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))],
+        'min_ms': tiempos[0],
+        'memoria_kb': pico / 1024,
+    }
+
+def ejecutar(tamanos: List[int], almacen: str, repeticiones: int) -> Dict[str, Any]:
+    """Mide todas las operaciones en cada tamaño con bases nuevas"""
+    resultados = []
+    for libros in tamanos:
+        usuarios = max(1, int(libros * USUARIOS_POR_LIBRO))
+        prestamos = int(libros * PRESTAMOS_POR_LIBRO)
+        with tempfile.TemporaryDirectory() as directorio:
+            gestor = abrir(almacen, directorio, libros, usuarios, prestamos)
+            try:
+                for nombre, operacion in operaciones(gestor, libros, usuarios):
+                    medida = medir(operacion, repeticiones)
+                    resultados.append({'operacion': nombre, 'almacen': almacen,
+                                       'libros': libros, 'usuarios': usuarios,
+                                       'prestamos': prestamos, **medida})
+                    imprimir_resultado(resultados[-1])
+            finally:
+                gestor.db.cerrar()
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'repeticiones': repeticiones,
+        'resultados': resultados,
+    }
+
+def imprimir_resultado(r: Dict[str, Any]):
+    """Una línea de la tabla de resultados"""
+    print(f"{r['operacion']:<27} {r['libros']:>9} {r['mediana_ms']:>12.3f} "
+          f"{r['p95_ms']:>10.3f} {r['memoria_kb']:>12.1f}")
+
+def _clave(r: Dict[str, Any]) -> tuple:
+    """Identifica una medida para emparejarla entre ejecuciones"""
+    return (r['almacen'], r['operacion'], r['libros'], r['usuarios'], r['prestamos'])
+
+def comparar(ruta_base: str, ruta_nueva: str, umbral: float) -> int:
+    """Compara dos ejecuciones y devuelve cuántas regresiones hay"""
+    with open(ruta_base, encoding='utf-8') as f:
+        base = {_clave(r): r for r in json.load(f)['resultados']}
+    with open(ruta_nueva, encoding='utf-8') as f:
+        nuevas = json.load(f)['resultados']
+    
+    print(f"{'operacion':<27} {'libros':>9} {'tiempo':>9} {'memoria':>9}")
+    regresiones = 0
+    for nueva in nuevas:
+        anterior = base.get(_clave(nueva))
+        if anterior is None:
+            continue
+        marcas = []
+        cambios = []
+        for campo, nombre in (('mediana_ms', 'tiempo'), ('memoria_kb', 'memoria')):
+            # Un valor base nulo no permite calcular la proporción
+            proporcion = nueva[campo] / anterior[campo] if anterior[campo] else 1.0
+            cambios.append(proporcion)
+            if proporcion > 1 + umbral:
+                marcas.append(f'REGRESIÓN de {nombre}')
+        regresiones += len(marcas)
+        print(f"{nueva['operacion']:<27} {nueva['libros']:>9} {cambios[0]:>8.2f}x "
+              f"{cambios[1]:>8.2f}x  {', '.join(marcas)}")
+    return regresiones
+
+def main():
+    """Ejecuta la suite o compara dos resultados"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS,
+                        help='cantidades de libros a probar')
+    parser.add_argument('--almacen', choices=sorted(ALMACENES), default='json')
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--salida', help='archivo JSON donde guardar los resultados')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVO'),
+                        help='compara dos archivos de resultados')
+    parser.add_argument('--umbral', type=float, default=UMBRAL,
+                        help='empeoramiento relativo tolerado al comparar')
+    args = parser.parse_args()
+    
+    if args.comparar:
+        regresiones = comparar(*args.comparar, args.umbral)
+        print(f"{regresiones} regresiones")
+        sys.exit(1 if regresiones else 0)
+    
+    print(f"{'operacion':<27} {'libros':>9} {'mediana ms':>12} {'p95 ms':>10} "
+          f"{'memoria KB':>12}")
+    informe = ejecutar(args.tamanos, args.almacen, args.repeticiones)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
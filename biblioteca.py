@@ -1,39 +1,227 @@
 """Módulo de lógica de negocio de la biblioteca"""
-from datetime import datetime
-from typing import List, Optional
-from models import Libro, Usuario, Prestamo
-from database import Database
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+from models import DIAS_PRESTAMO, Libro, Usuario, Prestamo, Reserva
+from busqueda import IndiceTexto
+from cache import CacheLRU
+from identificadores import nuevo_id
+from metricas import instrumentar, registro
+from reportes import Reportes
+from database import CLAVES, Database, Evento
+from database_sqlite import SQLiteDatabase
+
+# Libros y usuarios ya convertidos a modelos que se conservan de cada tipo
+TAMANO_CACHE_MODELOS = 10_000
+
+@dataclass
+class ResultadoImportacion:
+    """Resumen de una importación masiva"""
+    insertados: int = 0
+    errores: List[Tuple[int, str]] = field(default_factory=list)
+
+T = TypeVar('T')
+
+@dataclass
+class Pagina(Generic[T]):
+    """Una página de un listado y el total de elementos que cumplen el filtro"""
+    elementos: List[T]
+    total: int
+
+def _campo(fila: Dict[str, Any], nombre: str) -> str:
+    """Obtiene un campo de una fila importada como texto sin espacios"""
+    valor = fila.get(nombre)
+    return str(valor).strip() if valor is not None else ''
+
+def _campos_busqueda(libro: Dict[str, Any]) -> Dict[str, str]:
+    """Campos de un libro que se indexan para la búsqueda de texto"""
+    return {'titulo': libro.get('titulo'), 'autor': libro.get('autor')}
 
 class GestorBiblioteca:
     """Maneja la lógica de negocio de la biblioteca"""
     
-    def __init__(self, db: Database):
+    def __init__(self, db: Union[Database, SQLiteDatabase],
+                 tamano_cache: int = TAMANO_CACHE_MODELOS):
         self.db = db
+        # Listados ya convertidos a modelos, con la versión de la que salieron
+        self._listados: Dict[str, Tuple[tuple, list]] = {}
+        # Libros y usuarios sueltos ya convertidos a modelos. Los eventos
+        # descartan justo los que cambian; la versión con la que se
+        # sincronizó cada caché detecta los cambios que llegan sin evento
+        self._modelos = {'libros': CacheLRU(tamano_cache),
+                         'usuarios': CacheLRU(tamano_cache)}
+        self._version_modelos: Dict[str, tuple] = {}
+        self.db.suscribir(self._invalidar_modelo)
+        # Índice de títulos y autores; se construye en la primera búsqueda
+        self._indice_libros: Optional[IndiceTexto] = None
+        self._version_indice: Optional[tuple] = None
+        # Varias búsquedas simultáneas construyen y suscriben el índice una vez
+        self._cerrojo_indice = threading.Lock()
+        # Informes del historial de préstamos (requieren numpy)
+        self.reportes = Reportes(db)
+    
+    def _listado(self, nombre: str, coleccion: str,
+                 obtener: Callable[[], List[Dict[str, Any]]], modelo) -> list:
+        """Convierte un listado a modelos, reutilizándolo mientras no cambie
+        
+        Los objetos devueltos se comparten entre llamadas, así que no
+        deben modificarse.
+        """
+        version = self.db.version(coleccion)
+        guardado = self._listados.get(nombre)
+        if guardado is None or guardado[0] != version:
+            guardado = (version, [modelo.from_dict(d) for d in obtener()])
+            self._listados[nombre] = guardado
+        return list(guardado[1])
+    
+    def _modelo(self, coleccion: str, clave: str, modelo):
+        """Obtiene un elemento por su clave como modelo, pasando por la caché
+        
+        Igual que en los listados, el objeto devuelto se comparte entre
+        llamadas y no debe modificarse.
+        """
+        cache = self._modelos[coleccion]
+        version = self.db.version(coleccion)
+        if self._version_modelos.get(coleccion) != version:
+            # Algo cambió sin evento (una transacción revertida, otro
+            # proceso...) y no se sabe qué
+            cache.vaciar()
+            self._version_modelos[coleccion] = version
+        
+        objeto = cache.obtener(clave)
+        if registro.activo:
+            registro.contar('cache_fallos_total' if objeto is None
+                            else 'cache_aciertos_total', coleccion)
+        if objeto is None:
+            resultados = self.db.buscar(coleccion, CLAVES[coleccion], clave)
+            if not resultados:
+                return None
+            objeto = modelo.from_dict(resultados[0])
+            cache.guardar(clave, objeto)
+        return objeto
+    
+    def _invalidar_modelo(self, evento: Evento):
+        """Descarta de la caché de modelos el elemento que cambió"""
+        cache = self._modelos.get(evento.coleccion)
+        if cache is None:
+            return
+        cache.descartar(evento.clave)
+        sincronizada = self._version_modelos.get(evento.coleccion)
+        if sincronizada is not None:
+            # Cada cambio confirmado suma uno al contador de la versión y
+            # llega con su evento; si algo cambió sin evento la versión
+            # queda descuadrada y la siguiente lectura vacía la caché
+            self._version_modelos[evento.coleccion] = (
+                sincronizada[:-1] + (sincronizada[-1] + 1,))
+    
+    def estadisticas_cache(self) -> Dict[str, Dict[str, int]]:
+        """Tamaño, aciertos y fallos de la caché de libros y usuarios"""
+        return {coleccion: cache.estadisticas() for coleccion, cache in self._modelos.items()}
+    
+    def suscribir(self, callback: Callable[[Evento], Any]):
+        """Recibe los cambios confirmados en la base de datos (ver ``Evento``)"""
+        self.db.suscribir(callback)
     
     # Gestión de Libros
+    @instrumentar()
     def agregar_libro(self, isbn: str, titulo: str, autor: str) -> bool:
         """Agrega un nuevo libro a la biblioteca"""
         if not isbn or not titulo or not autor:
             raise ValueError("Todos los campos son obligatorios")
         
-        # Verificar que el ISBN no exista
-        if self.db.buscar('libros', 'isbn', isbn):
-            raise ValueError("El ISBN ya existe")
+        # La comprobación y el alta van juntas para que otro proceso no
+        # agregue el mismo ISBN entre medias
+        with self.db.transaction():
+            if self.db.buscar('libros', 'isbn', isbn):
+                raise ValueError("El ISBN ya existe")
+            
+            libro = Libro(isbn, titulo, autor)
+            return self.db.agregar('libros', libro.to_dict())
+    
+    @instrumentar()
+    def agregar_libros_bulk(self, filas: Iterable[Dict[str, Any]],
+                            cada: Optional[int] = None) -> ResultadoImportacion:
+        """Agrega libros en bloque a partir de filas con isbn, titulo y autor
         
-        libro = Libro(isbn, titulo, autor)
-        return self.db.agregar('libros', libro.to_dict())
+        Las filas inválidas o duplicadas se anotan en el resultado sin
+        detener la importación. Los cambios se guardan una sola vez al
+        final, o cada ``cada`` filas si se indica.
+        """
+        def importar(fila):
+            self.agregar_libro(_campo(fila, 'isbn'), _campo(fila, 'titulo'),
+                               _campo(fila, 'autor'))
+        return self._importar(filas, cada, importar)
     
+    @instrumentar()
     def obtener_libros(self) -> List[Libro]:
         """Obtiene todos los libros"""
-        libros_data = self.db.obtener_todos('libros')
-        return [Libro.from_dict(l) for l in libros_data]
+        return self._listado('libros', 'libros',
+                             lambda: self.db.obtener_todos('libros'), Libro)
+    
+    @instrumentar()
+    def listar_libros(self, offset: int = 0, limite: Optional[int] = None,
+                      filtro: Optional[Dict[str, Any]] = None,
+                      orden: Optional[str] = None) -> Pagina[Libro]:
+        """Obtiene una página de libros
+        
+        ``filtro`` exige igualdad en cada campo (p. ej. ``{'disponible': True}``)
+        y ``orden`` es un campo, con ``-`` delante para orden descendente.
+        """
+        return self._pagina('libros', offset, limite, filtro, orden, Libro)
+    
+    def iterar_libros(self) -> Iterator[Libro]:
+        """Recorre todos los libros sin construir la lista completa"""
+        return (Libro.from_dict(d) for d in self.db.iterar('libros'))
+    
+    @instrumentar()
+    def buscar_libros(self, texto: str, limite: Optional[int] = 50) -> List[Libro]:
+        """Busca libros por palabras del título o del autor
+        
+        No distingue tildes ni mayúsculas y cada palabra puede ser el
+        principio de una palabra del libro ("calc" encuentra "Cálculo").
+        Los resultados se ordenan por relevancia.
+        """
+        indice = self._indice_actualizado()
+        libros = []
+        for isbn in indice.buscar(texto, limite):
+            resultados = self.db.buscar('libros', 'isbn', isbn)
+            if resultados:
+                libros.append(Libro.from_dict(resultados[0]))
+        return libros
     
+    def _indice_actualizado(self) -> IndiceTexto:
+        """Devuelve el índice de búsqueda, reconstruyéndolo si quedó desfasado
+        
+        Los eventos de la base de datos lo mantienen al día; solo se
+        reconstruye la primera vez o si los libros cambiaron sin eventos,
+        por ejemplo al revertir una transacción.
+        """
+        with self._cerrojo_indice:
+            if self._indice_libros is None:
+                self.db.suscribir(self._indexar_evento)
+            if self._indice_libros is None or self._version_indice != self.db.version('libros'):
+                indice = IndiceTexto()
+                for libro in self.db.iterar('libros'):
+                    indice.agregar(libro['isbn'], _campos_busqueda(libro))
+                self._indice_libros = indice
+                self._version_indice = self.db.version('libros')
+            return self._indice_libros
+    
+    def _indexar_evento(self, evento: Evento):
+        """Aplica al índice de búsqueda un cambio en los libros"""
+        if evento.coleccion != 'libros' or self._indice_libros is None:
+            return
+        self._indice_libros.agregar(evento.clave, _campos_busqueda(evento.elemento))
+        self._version_indice = self.db.version('libros')
+    
+    @instrumentar()
     def buscar_libro_por_isbn(self, isbn: str) -> Optional[Libro]:
         """Busca un libro por su ISBN"""
-        resultados = self.db.buscar('libros', 'isbn', isbn)
-        return Libro.from_dict(resultados[0]) if resultados else None
+        return self._modelo('libros', isbn, Libro)
     
     # Gestión de Usuarios
+    @instrumentar()
     def registrar_usuario(self, id_usuario: str, nombre: str, email: str) -> bool:
         """Registra un nuevo usuario"""
         if not id_usuario or not nombre or not email:
@@ -42,80 +230,316 @@ class GestorBiblioteca:
         if '@' not in email:
             raise ValueError("Email inválido")
         
-        if self.db.buscar('usuarios', 'id_usuario', id_usuario):
-            raise ValueError("El ID de usuario ya existe")
+        with self.db.transaction():
+            if self.db.buscar('usuarios', 'id_usuario', id_usuario):
+                raise ValueError("El ID de usuario ya existe")
+            
+            usuario = Usuario(id_usuario, nombre, email)
+            return self.db.agregar('usuarios', usuario.to_dict())
+    
+    @instrumentar()
+    def registrar_usuarios_bulk(self, filas: Iterable[Dict[str, Any]],
+                                cada: Optional[int] = None) -> ResultadoImportacion:
+        """Registra usuarios en bloque a partir de filas con id_usuario, nombre y email
         
-        usuario = Usuario(id_usuario, nombre, email)
-        return self.db.agregar('usuarios', usuario.to_dict())
+        Se comporta igual que ``agregar_libros_bulk``.
+        """
+        def importar(fila):
+            self.registrar_usuario(_campo(fila, 'id_usuario'), _campo(fila, 'nombre'),
+                                   _campo(fila, 'email'))
+        return self._importar(filas, cada, importar)
+    
+    def _importar(self, filas: Iterable[Dict[str, Any]], cada: Optional[int],
+                  importar: Callable[[Dict[str, Any]], Any]) -> ResultadoImportacion:
+        """Importa filas en transacciones de ``cada`` filas como máximo"""
+        resultado = ResultadoImportacion()
+        pendientes = enumerate(filas, start=1)
+        terminado = False
+        while not terminado:
+            terminado = True
+            with self.db.transaction():
+                for procesadas, (numero, fila) in enumerate(pendientes, start=1):
+                    try:
+                        if not isinstance(fila, dict):
+                            raise ValueError("Fila con formato inválido")
+                        importar(fila)
+                        resultado.insertados += 1
+                    except ValueError as e:
+                        resultado.errores.append((numero, str(e)))
+                    
+                    if cada and procesadas >= cada:
+                        terminado = False
+                        break
+        return resultado
     
+    @instrumentar()
     def obtener_usuarios(self) -> List[Usuario]:
         """Obtiene todos los usuarios"""
-        usuarios_data = self.db.obtener_todos('usuarios')
-        return [Usuario.from_dict(u) for u in usuarios_data]
+        return self._listado('usuarios', 'usuarios',
+                             lambda: self.db.obtener_todos('usuarios'), Usuario)
+    
+    @instrumentar()
+    def listar_usuarios(self, offset: int = 0, limite: Optional[int] = None,
+                        filtro: Optional[Dict[str, Any]] = None,
+                        orden: Optional[str] = None) -> Pagina[Usuario]:
+        """Obtiene una página de usuarios; ver ``listar_libros``"""
+        return self._pagina('usuarios', offset, limite, filtro, orden, Usuario)
     
+    def iterar_usuarios(self) -> Iterator[Usuario]:
+        """Recorre todos los usuarios sin construir la lista completa"""
+        return (Usuario.from_dict(d) for d in self.db.iterar('usuarios'))
+    
+    @instrumentar()
     def buscar_usuario_por_id(self, id_usuario: str) -> Optional[Usuario]:
         """Busca un usuario por su ID"""
-        resultados = self.db.buscar('usuarios', 'id_usuario', id_usuario)
-        return Usuario.from_dict(resultados[0]) if resultados else None
+        return self._modelo('usuarios', id_usuario, Usuario)
     
     # Gestión de Préstamos
-    def prestar_libro(self, isbn: str, id_usuario: str) -> bool:
-        """Registra un préstamo de libro"""
-        libro = self.buscar_libro_por_isbn(isbn)
-        if not libro:
-            raise ValueError("Libro no encontrado")
-        
-        if not libro.disponible:
-            raise ValueError("El libro no está disponible")
-        
-        usuario = self.buscar_usuario_por_id(id_usuario)
-        if not usuario:
-            raise ValueError("Usuario no encontrado")
-        
-        if not usuario.activo:
-            raise ValueError("Usuario inactivo")
-        
-        # Crear préstamo
-        id_prestamo = f"P-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    @instrumentar()
+    def prestar_libro(self, isbn: str, id_usuario: str, dias: int = DIAS_PRESTAMO) -> bool:
+        """Registra un préstamo de libro que vence en ``dias`` días"""
+        # bool es subclase de int, pero True no es un plazo
+        if not isinstance(dias, int) or isinstance(dias, bool) or dias <= 0:
+            raise ValueError("El plazo del préstamo debe ser un número entero positivo de días")
+        with self.db.transaction():
+            libro = self.buscar_libro_por_isbn(isbn)
+            if not libro:
+                raise ValueError("Libro no encontrado")
+            
+            if not libro.disponible:
+                raise ValueError("El libro no está disponible")
+            
+            usuario = self.buscar_usuario_por_id(id_usuario)
+            if not usuario:
+                raise ValueError("Usuario no encontrado")
+            
+            if not usuario.activo:
+                raise ValueError("Usuario inactivo")
+            
+            # Actualizar disponibilidad del libro
+            self.db.actualizar('libros', 'isbn', isbn, {'disponible': False})
+            
+            if self._crear_prestamo(isbn, id_usuario, dias) is None:
+                # Deshace también el cambio de disponibilidad
+                raise RuntimeError("No se pudo registrar el préstamo")
+            return True
+    
+    def _crear_prestamo(self, isbn: str, id_usuario: str, dias: int) -> Optional[Prestamo]:
+        """Guarda un préstamo que empieza ahora, o devuelve None si falla"""
+        ahora = datetime.now()
         prestamo = Prestamo(
-            id_prestamo=id_prestamo,
+            id_prestamo=nuevo_id('P-'),
             isbn_libro=isbn,
             id_usuario=id_usuario,
-            fecha_prestamo=datetime.now().isoformat()
+            fecha_prestamo=ahora.isoformat(),
+            fecha_vencimiento=(ahora + timedelta(days=dias)).isoformat()
         )
-        
-        # Actualizar disponibilidad del libro
-        self.db.actualizar('libros', 'isbn', isbn, {'disponible': False})
-        
-        return self.db.agregar('prestamos', prestamo.to_dict())
+        return prestamo if self.db.agregar('prestamos', prestamo.to_dict()) else None
     
+    @instrumentar()
     def devolver_libro(self, isbn: str) -> bool:
-        """Registra la devolución de un libro"""
-        # Buscar préstamo activo
-        prestamos = self.db.buscar('prestamos', 'isbn_libro', isbn)
-        prestamo_activo = None
-        
-        for p in prestamos:
-            if p.get('fecha_devolucion') is None:
-                prestamo_activo = p
-                break
+        """Registra la devolución de un libro
         
-        if not prestamo_activo:
-            raise ValueError("No hay préstamo activo para este libro")
+        Si alguien lo tiene reservado se le presta en el acto y el libro
+        sigue sin estar disponible. Las reservas de usuarios inactivos se
+        cancelan al llegarles el turno.
+        """
+        with self.db.transaction():
+            # Buscar préstamo activo
+            prestamo_activo = self.db.prestamo_activo(isbn)
+            
+            if not prestamo_activo:
+                raise ValueError("No hay préstamo activo para este libro")
+            
+            # Actualizar préstamo
+            self.db.actualizar(
+                'prestamos', 
+                'id_prestamo', 
+                prestamo_activo['id_prestamo'],
+                {'fecha_devolucion': datetime.now().isoformat()}
+            )
+            
+            # Atender la primera reserva de un usuario que pueda llevárselo.
+            # Un fallo al guardar lanza excepción para deshacer también la
+            # devolución en lugar de dejar el libro sin préstamo ni disponible
+            while True:
+                reserva = self.db.siguiente_reserva(isbn)
+                if reserva is None:
+                    break
+                usuario = self.buscar_usuario_por_id(reserva['id_usuario'])
+                if not usuario or not usuario.activo:
+                    self._actualizar_reserva(reserva, {'estado': 'cancelada'})
+                    continue
+                prestamo = self._crear_prestamo(isbn, reserva['id_usuario'], DIAS_PRESTAMO)
+                if prestamo is None:
+                    raise RuntimeError("No se pudo registrar el préstamo de la reserva")
+                self._actualizar_reserva(reserva, {'estado': 'atendida',
+                                                   'id_prestamo': prestamo.id_prestamo})
+                return True
+            
+            # Actualizar disponibilidad del libro
+            return self.db.actualizar('libros', 'isbn', isbn, {'disponible': True})
+    
+    # Gestión de Reservas
+    @instrumentar()
+    def reservar_libro(self, isbn: str, id_usuario: str) -> bool:
+        """Pone a un usuario en la cola de un libro prestado
         
-        # Actualizar préstamo
-        self.db.actualizar(
-            'prestamos', 
-            'id_prestamo', 
-            prestamo_activo['id_prestamo'],
-            {'fecha_devolucion': datetime.now().isoformat()}
-        )
+        Cuando el libro se devuelva se le prestará por orden de llegada.
+        """
+        with self.db.transaction():
+            libro = self.buscar_libro_por_isbn(isbn)
+            if not libro:
+                raise ValueError("Libro no encontrado")
+            
+            if libro.disponible:
+                raise ValueError("El libro está disponible, no hace falta reservarlo")
+            
+            usuario = self.buscar_usuario_por_id(id_usuario)
+            if not usuario:
+                raise ValueError("Usuario no encontrado")
+            
+            if not usuario.activo:
+                raise ValueError("Usuario inactivo")
+            
+            prestamo = self.db.prestamo_activo(isbn)
+            if prestamo and prestamo['id_usuario'] == id_usuario:
+                raise ValueError("El usuario ya tiene el libro prestado")
+            
+            if self._reserva_pendiente(isbn, id_usuario):
+                raise ValueError("El usuario ya tiene reservado el libro")
+            
+            reserva = Reserva(
+                id_reserva=nuevo_id('RS-'),
+                isbn_libro=isbn,
+                id_usuario=id_usuario,
+                fecha_reserva=datetime.now().isoformat()
+            )
+            return self.db.agregar('reservas', reserva.to_dict())
+    
+    def _actualizar_reserva(self, reserva: Dict[str, Any], datos: Dict[str, Any]):
+        """Cambia una reserva o lanza RuntimeError si no se pudo guardar"""
+        if not self.db.actualizar('reservas', 'id_reserva', reserva['id_reserva'], datos):
+            raise RuntimeError("No se pudo actualizar la reserva")
+    
+    def _reserva_pendiente(self, isbn: str, id_usuario: str) -> Optional[Dict[str, Any]]:
+        """Reserva pendiente de un usuario para un libro, si la tiene"""
+        for reserva in self.db.reservas_de_usuario(id_usuario):
+            if reserva['isbn_libro'] == isbn:
+                return reserva
+        return None
+    
+    @instrumentar()
+    def cancelar_reserva(self, isbn: str, id_usuario: str) -> bool:
+        """Saca a un usuario de la cola de un libro"""
+        with self.db.transaction():
+            reserva = self._reserva_pendiente(isbn, id_usuario)
+            if not reserva:
+                raise ValueError("No hay reserva pendiente de este usuario para el libro")
+            return self.db.actualizar('reservas', 'id_reserva', reserva['id_reserva'],
+                                      {'estado': 'cancelada'})
+    
+    @instrumentar()
+    def obtener_reservas_usuario(self, id_usuario: str) -> List[Reserva]:
+        """Obtiene las reservas pendientes de un usuario"""
+        return [Reserva.from_dict(r) for r in self.db.reservas_de_usuario(id_usuario)]
+    
+    @instrumentar()
+    def posicion_reserva(self, isbn: str, id_usuario: str) -> Optional[int]:
+        """Puesto (desde 1) de un usuario en la cola de un libro, o None si no está"""
+        return self.db.posicion_reserva(isbn, id_usuario)
+    
+    @instrumentar()
+    def estimar_disponibilidad(self, isbn: str, id_usuario: str,
+                               ahora: Optional[datetime] = None) -> Optional[datetime]:
+        """Cuándo se espera que le llegue el libro a un usuario de su cola
         
-        # Actualizar disponibilidad del libro
-        return self.db.actualizar('libros', 'isbn', isbn, {'disponible': True})
+        Supone que el préstamo actual se devuelve al vencer y que cada
+        reserva anterior lo tiene ``DIAS_PRESTAMO`` días. Devuelve None si
+        el usuario no tiene reserva pendiente del libro.
+        """
+        posicion = self.db.posicion_reserva(isbn, id_usuario)
+        if posicion is None:
+            return None
+        ahora = ahora or datetime.now()
+        inicio = ahora
+        prestamo = self.db.prestamo_activo(isbn)
+        if prestamo and prestamo.get('fecha_vencimiento'):
+            # Un préstamo ya vencido puede devolverse en cualquier momento
+            inicio = max(ahora, datetime.fromisoformat(prestamo['fecha_vencimiento']))
+        return inicio + timedelta(days=(posicion - 1) * DIAS_PRESTAMO)
     
+    @instrumentar()
     def obtener_prestamos_activos(self) -> List[Prestamo]:
         """Obtiene todos los préstamos activos"""
-        prestamos_data = self.db.obtener_todos('prestamos')
-        activos = [p for p in prestamos_data if p.get('fecha_devolucion') is None]
-        return [Prestamo.from_dict(p) for p in activos]
+        return self._listado('prestamos_activos', 'prestamos',
+                             self.db.prestamos_activos, Prestamo)
+    
+    @instrumentar()
+    def listar_prestamos_activos(self, offset: int = 0, limite: Optional[int] = None,
+                                 filtro: Optional[Dict[str, Any]] = None,
+                                 orden: Optional[str] = None) -> Pagina[Prestamo]:
+        """Obtiene una página de préstamos activos; ver ``listar_libros``"""
+        filtro = {**(filtro or {}), 'fecha_devolucion': None}
+        return self._pagina('prestamos', offset, limite, filtro, orden, Prestamo)
+    
+    def iterar_prestamos(self, filtro: Optional[Dict[str, Any]] = None) -> Iterator[Prestamo]:
+        """Recorre los préstamos, incluidos los devueltos, que cumplan el filtro"""
+        filtro = filtro or {}
+        for d in self.db.iterar('prestamos'):
+            if all(d.get(campo) == valor for campo, valor in filtro.items()):
+                yield Prestamo.from_dict(d)
+    
+    def _pagina(self, coleccion: str, offset: int, limite: Optional[int],
+                filtro: Optional[Dict[str, Any]], orden: Optional[str], modelo) -> Pagina:
+        """Pide una página a la base de datos y convierte solo sus filas"""
+        if offset < 0 or (limite is not None and limite < 0):
+            raise ValueError("offset y limite no pueden ser negativos")
+        filas, total = self.db.listar(coleccion, offset, limite, filtro, orden)
+        return Pagina([modelo.from_dict(d) for d in filas], total)
+    
+    @instrumentar()
+    def obtener_prestamos_usuario(self, id_usuario: str) -> List[Prestamo]:
+        """Obtiene los préstamos activos de un usuario"""
+        return [Prestamo.from_dict(p) for p in self.db.prestamos_activos(id_usuario)]
+    
+    @instrumentar()
+    def obtener_prestamos_vencidos(self, ahora: Optional[datetime] = None) -> List[Prestamo]:
+        """Préstamos activos ya vencidos, del que venció antes al último"""
+        ahora = ahora or datetime.now()
+        return [Prestamo.from_dict(p) for p in self.db.prestamos_por_vencer(ahora.isoformat())]
+    
+    @instrumentar()
+    def obtener_prestamos_por_vencer(self, horas: float = 24,
+                                     ahora: Optional[datetime] = None) -> List[Prestamo]:
+        """Préstamos activos que vencen en las próximas ``horas`` horas"""
+        ahora = ahora or datetime.now()
+        hasta = ahora + timedelta(hours=horas)
+        return [Prestamo.from_dict(p) for p in
+                self.db.prestamos_por_vencer(hasta.isoformat(), desde=ahora.isoformat())]
+    
+    @instrumentar()
+    def generar_recordatorios(self, ahora: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Devuelve un recordatorio por cada préstamo vencido
+        
+        No se guardan: cada ejecución recuerda todos los que sigan
+        vencidos, así que la frecuencia la decide quien la programa y
+        nada crece con cada ejecución. Solo se consultan los préstamos
+        vencidos, nunca el historial.
+        """
+        ahora = ahora or datetime.now()
+        recordatorios = []
+        for prestamo in self.db.prestamos_por_vencer(ahora.isoformat()):
+            usuario = self.buscar_usuario_por_id(prestamo['id_usuario'])
+            vencimiento = datetime.fromisoformat(prestamo['fecha_vencimiento'])
+            recordatorios.append({
+                'id_recordatorio': nuevo_id('R-'),
+                'id_prestamo': prestamo['id_prestamo'],
+                'isbn_libro': prestamo['isbn_libro'],
+                'id_usuario': prestamo['id_usuario'],
+                'email': usuario.email if usuario else None,
+                'fecha_vencimiento': prestamo['fecha_vencimiento'],
+                'dias_vencido': (ahora - vencimiento).days,
+                'fecha': ahora.isoformat()
+            })
+        return recordatorios
@@ -0,0 +1,191 @@
+"""Módulo de búsqueda de texto sobre títulos y autores
+
+``IndiceTexto`` es un índice invertido que se mantiene elemento a
+elemento. Las palabras se normalizan sin tildes ni mayúsculas, así que
+"Cálculo" y "calculo" son la misma palabra, y cada palabra de la consulta
+se trata como prefijo de las del texto.
+"""
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import product
+from typing import Dict, List, Optional, Set, Tuple
+
+# Importancia de cada campo en la puntuación de un resultado
+PESOS = {'titulo': 2.0, 'autor': 1.0}
+
+# Palabras tan frecuentes que no sirven para distinguir títulos
+PALABRAS_VACIAS = frozenset(
+    'a al con de del el en la las lo los para por un una y'.split())
+
+# Longitud mínima de una palabra de la consulta para buscarla como prefijo;
+# las más cortas solo coinciden con palabras completas
+MIN_PREFIJO = 2
+
+_PALABRA = re.compile(r'\w+')
+
+def normalizar(texto: str) -> str:
+    """Pasa el texto a minúsculas y le quita las tildes"""
+    texto = texto.casefold()
+    if texto.isascii():
+        return texto
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+# Los títulos repiten mucho las mismas palabras, así que normalizar
+# palabra a palabra con caché es mucho más rápido que hacerlo con el texto
+_normalizar_palabra = lru_cache(maxsize=65536)(normalizar)
+
+def palabras(texto: str) -> List[str]:
+    """Divide un texto en palabras normalizadas, sin palabras vacías ni repetidas"""
+    if not texto.isascii():
+        # Componer las tildes para que no corten las palabras
+        texto = unicodedata.normalize('NFC', texto)
+    normalizadas = dict.fromkeys(map(_normalizar_palabra, _PALABRA.findall(texto)))
+    return [p for p in normalizadas if p not in PALABRAS_VACIAS]
+
+class IndiceTexto:
+    """Índice invertido de palabras a claves de documentos
+    
+    Cada campo tiene su propio índice para poder puntuar por campo sin
+    recorrer los documentos: una consulta solo hace operaciones entre
+    conjuntos de claves.
+    """
+    
+    def __init__(self):
+        # Campos y palabras de cada documento, alternados en una tupla
+        # plana (campo, palabra, campo, palabra...) para poder quitarlo
+        # ocupando poca memoria
+        self._documentos: Dict[str, Tuple[str, ...]] = {}
+        # campo -> palabra -> claves de los documentos que la contienen
+        self._apariciones: Dict[str, Dict[str, Set[str]]] = {}
+        # Palabras ordenadas, para encontrar por bisección las de un
+        # prefijo. Las nuevas se acumulan aparte y se ordenan al consultar;
+        # las que dejan de usarse se ignoran al expandir
+        self._vocabulario: List[str] = []
+        self._nuevas: List[str] = []
+        self._conocidas: Set[str] = set()
+    
+    def __len__(self) -> int:
+        """Cantidad de documentos indexados"""
+        return len(self._documentos)
+    
+    def agregar(self, clave: str, campos: Dict[str, str]):
+        """Indexa un documento, reemplazando el anterior con la misma clave"""
+        self.quitar(clave)
+        pares = []
+        for campo, texto in campos.items():
+            if not texto:
+                continue
+            indice = self._apariciones.setdefault(campo, {})
+            for palabra in palabras(texto):
+                pares += (campo, palabra)
+                claves = indice.get(palabra)
+                if claves is None:
+                    claves = indice[palabra] = set()
+                    if palabra not in self._conocidas:
+                        self._conocidas.add(palabra)
+                        self._nuevas.append(palabra)
+                claves.add(clave)
+        self._documentos[clave] = tuple(pares)
+    
+    def quitar(self, clave: str):
+        """Elimina un documento del índice, si estaba"""
+        pares = self._documentos.pop(clave, ())
+        for campo, palabra in zip(pares[::2], pares[1::2]):
+            indice = self._apariciones[campo]
+            claves = indice[palabra]
+            claves.discard(clave)
+            if not claves:
+                del indice[palabra]
+    
+    def _expandir(self, termino: str) -> List[str]:
+        """Palabras del vocabulario que empiezan por ``termino``"""
+        if len(termino) < MIN_PREFIJO:
+            return [termino]
+        if self._nuevas:
+            # Timsort aprovecha que el vocabulario ya está ordenado
+            self._vocabulario.extend(self._nuevas)
+            self._vocabulario.sort()
+            self._nuevas = []
+        inicio = bisect_left(self._vocabulario, termino)
+        fin = bisect_left(self._vocabulario, termino + '\U0010ffff', inicio)
+        return self._vocabulario[inicio:fin]
+    
+    def _clases(self, termino: str) -> Dict[float, List[Set[str]]]:
+        """Conjuntos de claves que contienen un término, agrupados por puntos"""
+        expansion = self._expandir(termino)
+        clases: Dict[float, List[Set[str]]] = {}
+        for campo, indice in self._apariciones.items():
+            peso = PESOS.get(campo, 1.0)
+            if termino in indice:
+                clases.setdefault(peso, []).append(indice[termino])
+            prefijos = [indice[p] for p in expansion if p != termino and p in indice]
+            if prefijos:
+                clases.setdefault(peso / 2, []).extend(prefijos)
+        return clases
+    
+    @staticmethod
+    def _niveles(clases: Dict[float, List[Set[str]]],
+                 universo: Set[str]) -> List[Tuple[float, Set[str]]]:
+        """Reparte las claves del universo según los puntos de un término
+        
+        Devuelve pares (puntos, claves) de mayor a menor, sin claves
+        repetidas entre niveles. Intersecar con el universo cuesta lo que
+        el universo, no lo que los conjuntos del índice.
+        """
+        niveles = []
+        restantes = universo
+        for puntos in sorted(clases, reverse=True):
+            claves = set()
+            for conjunto in clases[puntos]:
+                claves |= restantes & conjunto
+            if claves:
+                niveles.append((puntos, claves))
+                restantes = restantes - claves
+        return niveles
+    
+    def buscar(self, texto: str, limite: Optional[int] = None) -> List[str]:
+        """Devuelve las claves que contienen todas las palabras, mejores primero
+        
+        Una palabra completa puntúa el doble que una que solo coincide como
+        prefijo, y las del título más que las del autor. A igual puntuación
+        se ordena por clave.
+        """
+        terminos = palabras(texto)
+        if not terminos:
+            return []
+        clases = [self._clases(t) for t in terminos]
+        
+        # Solo pueden aparecer documentos del término más selectivo
+        mas_selectivo = min(clases, key=lambda c: sum(len(s) for l in c.values() for s in l))
+        universo = set().union(*(s for l in mas_selectivo.values() for s in l))
+        niveles = []
+        for clases_termino in clases:
+            niveles_termino = self._niveles(clases_termino, universo)
+            if not niveles_termino:
+                return []
+            niveles.append(niveles_termino)
+        
+        # Cada combinación de niveles, uno por término, da una puntuación;
+        # se recorren de mayor a menor hasta completar el límite
+        grupos: Dict[float, List[List[Set[str]]]] = {}
+        for combinacion in product(*niveles):
+            puntos = sum(p for p, _ in combinacion)
+            grupos.setdefault(puntos, []).append(
+                sorted((claves for _, claves in combinacion), key=len))
+        
+        resultado: List[str] = []
+        for puntos in sorted(grupos, reverse=True):
+            empatadas: Set[str] = set()
+            for conjuntos in grupos[puntos]:
+                empatadas |= set.intersection(*conjuntos)
+            if limite is None:
+                resultado.extend(sorted(empatadas))
+            else:
+                resultado.extend(heapq.nsmallest(limite - len(resultado), empatadas))
+                if len(resultado) >= limite:
+                    break
+        return resultado
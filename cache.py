@@ -0,0 +1,58 @@
+"""Módulo de caché con expulsión del elemento menos usado (LRU)"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class CacheLRU:
+    """Diccionario de tamaño acotado que expulsa lo usado hace más tiempo
+    
+    Cuenta los aciertos y fallos de ``obtener`` para poder comprobar si el
+    tamaño elegido sirve. Puede usarse desde varios hilos a la vez.
+    """
+    
+    def __init__(self, capacidad: int):
+        if capacidad <= 0:
+            raise ValueError("La capacidad debe ser positiva")
+        self.capacidad = capacidad
+        self._elementos: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        # Leer también reordena los elementos
+        self._cerrojo = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._elementos)
+    
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """Devuelve el valor guardado, o None si no está"""
+        with self._cerrojo:
+            valor = self._elementos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._elementos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+    
+    def guardar(self, clave: Hashable, valor: Any):
+        """Guarda un valor, expulsando el menos usado si no cabe"""
+        with self._cerrojo:
+            self._elementos[clave] = valor
+            self._elementos.move_to_end(clave)
+            if len(self._elementos) > self.capacidad:
+                self._elementos.popitem(last=False)
+    
+    def descartar(self, clave: Hashable):
+        """Olvida un valor, si estaba"""
+        with self._cerrojo:
+            self._elementos.pop(clave, None)
+    
+    def vaciar(self):
+        """Olvida todos los valores; los contadores se conservan"""
+        with self._cerrojo:
+            self._elementos.clear()
+    
+    def estadisticas(self) -> Dict[str, int]:
+        """Tamaño actual, capacidad, aciertos y fallos"""
+        return {'elementos': len(self._elementos), 'capacidad': self.capacidad,
+                'aciertos': self.aciertos, 'fallos': self.fallos}
@@ -1,57 +1,1032 @@
 """Módulo de persistencia de datos"""
+import atexit
 import json
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+import weakref
+from bisect import bisect_left, insort
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+import formatos
+from almacen_prestamos import AlmacenPrestamos
+from metricas import instrumentar, registro
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Campo que identifica de forma única a cada elemento de una colección
+CLAVES = {
+    'libros': 'isbn',
+    'usuarios': 'id_usuario',
+    'prestamos': 'id_prestamo',
+    'reservas': 'id_reserva'
+}
+
+# Cantidad de listados filtrados u ordenados que se conservan entre páginas
+MAX_LISTADOS = 32
+
+# Modos de durabilidad de las escrituras (ver ``Database``)
+DURABILIDADES = ('sync', 'grupo', 'periodico')
+# Segundos que espera una escritura en modo grupo a que se le sumen otras
+VENTANA_GRUPO = 0.005
+# Segundos entre volcados en modo periódico
+INTERVALO_VOLCADO = 5.0
+
+@dataclass(frozen=True)
+class Evento:
+    """Cambio confirmado en una colección
+    
+    ``tipo`` es ``'insertado'`` o ``'actualizado'``, ``clave`` el valor del
+    campo clave del elemento y ``elemento`` una copia de cómo quedó.
+    """
+    tipo: str
+    coleccion: str
+    clave: Any
+    elemento: Dict[str, Any]
+
+def _evento(tipo: str, coleccion: str, elemento: Dict[str, Any]) -> Evento:
+    """Crea el evento de un elemento recién insertado o actualizado"""
+    return Evento(tipo, coleccion, elemento.get(CLAVES.get(coleccion)), dict(elemento))
+
+def _notificar(suscriptores: List[Callable[[Evento], Any]], eventos: List[Evento]):
+    """Entrega los eventos; un suscriptor que falla no afecta a los demás"""
+    for evento in eventos:
+        for suscriptor in list(suscriptores):
+            try:
+                suscriptor(evento)
+            except Exception:
+                logger.exception("Error en suscriptor")
+
+def _bloquear_archivo(f):
+    """Toma el bloqueo exclusivo de un archivo abierto, esperando a que se libere"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK se rinde tras diez segundos; se sigue esperando
+            pass
+
+def _desbloquear_archivo(f):
+    """Libera el bloqueo tomado con ``_bloquear_archivo``"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _volcar_al_salir(referencia: 'weakref.ref[Database]'):
+    """Guarda lo pendiente de una base en modo periódico al terminar el proceso"""
+    db = referencia()
+    if db is not None:
+        db.flush()
 
 class Database:
-    """Maneja la persistencia de datos en formato JSON"""
+    """Maneja la persistencia de datos en formato JSON
+    
+    Varios hilos y procesos pueden compartir el mismo archivo: cada
+    escritura o transacción toma un cerrojo del proceso y un bloqueo del
+    archivo ``<archivo>.lock``, y antes de aplicar nada vuelve a leer el
+    archivo si otro proceso lo cambió desde la última lectura.
+    
+    ``durabilidad`` decide cuándo llegan los cambios al disco y qué se
+    pierde si el proceso se cae:
+    
+    - ``'sync'``: cada escritura o transacción se guarda antes de volver.
+      Una caída no pierde nada de lo confirmado.
+    - ``'grupo'``: igual garantía que ``'sync'``, pero cada escritura
+      espera ``ventana_grupo`` segundos a que otros hilos escriban y todas
+      se guardan juntas con una sola escritura a disco. Solo compensa con
+      varios hilos escribiendo a la vez.
+    - ``'periodico'``: las escrituras vuelven en cuanto se aplican en
+      memoria y un hilo las guarda cada ``intervalo_volcado`` segundos,
+      además de en ``flush()``, ``cerrar()`` y al terminar el proceso.
+      Una caída pierde lo escrito desde el último volcado, y los eventos
+      se entregan antes de que los cambios estén en disco.
     
-    def __init__(self, archivo: str = 'biblioteca.json'):
+    En ningún modo queda el archivo a medio escribir. Mientras haya
+    cambios sin guardar se conserva el bloqueo del archivo, así que otro
+    proceso que quiera escribir espera al siguiente volcado.
+    """
+    
+    def __init__(self, archivo: str = 'biblioteca.json', perezoso: bool = False,
+                 formato: Optional[str] = None, durabilidad: str = 'sync',
+                 ventana_grupo: float = VENTANA_GRUPO,
+                 intervalo_volcado: float = INTERVALO_VOLCADO):
+        """Abre la base de datos
+        
+        Con ``perezoso=True`` cada colección se lee del archivo la primera
+        vez que se usa, de modo que abrir la base no depende del tamaño
+        del historial de préstamos.
+        
+        ``formato`` elige cómo se guarda el archivo (ver ``formatos``). El
+        formato del archivo existente se detecta al leerlo; si no se indica
+        ninguno se conserva ese, o JSON compacto para archivos nuevos.
+        """
+        if formato is not None and formato not in formatos.FORMATOS:
+            raise ValueError(f"Formato desconocido: {formato}")
+        if durabilidad not in DURABILIDADES:
+            raise ValueError(f"Durabilidad desconocida: {durabilidad}")
         self.archivo = archivo
-        self.datos = self._cargar_datos()
+        self.durabilidad = durabilidad
+        self.ventana_grupo = ventana_grupo
+        self.intervalo_volcado = intervalo_volcado
+        self.perezoso = perezoso
+        self.formato = formato
+        self.datos: Dict[str, List] = {}
+        self.indices: Dict[str, Dict[Any, Dict]] = {}
+        self.activos_por_isbn: Dict[str, Dict] = {}
+        self.activos_por_usuario: Dict[str, List[Dict]] = {}
+        # Préstamos activos de un libro que ya tenía otro activo, solo
+        # posibles en datos antiguos; se atienden al devolver el primero
+        self.activos_repetidos: Dict[str, List[Dict]] = {}
+        # (fecha_vencimiento, id_prestamo) de los préstamos activos, ordenados
+        self.vencimientos: List[Tuple[str, str]] = []
+        # Cola de reservas de cada libro y reservas pendientes de cada usuario
+        # por ISBN. Las que dejan de estar pendientes siguen en la cola hasta
+        # llegar al principio, para no tener que buscarlas en ella
+        self.reservas_por_isbn: Dict[str, deque] = {}
+        self.reservas_por_usuario: Dict[str, Dict[str, Dict]] = {}
+        self.versiones: Dict[str, int] = {}
+        self._generacion = 0
+        self._listados: Dict[tuple, Tuple[tuple, List[Dict]]] = {}
+        self._completo = True
+        self._consultadas = set()
+        self._transacciones = 0
+        self._pendientes: List[Dict[str, Any]] = []
+        self._eventos: List[Evento] = []
+        self._suscriptores: List[Callable[[Evento], Any]] = []
+        self._cerrojo = threading.RLock()
+        self._bloqueos = 0
+        self._archivo_bloqueo = None
+        # Cambios aplicados pero aún no guardados (modos grupo y periódico),
+        # numerados por turnos para saber hasta dónde llegó cada volcado
+        self._sin_guardar: List[Dict[str, Any]] = []
+        self._turno = 0
+        self._turno_guardado = 0
+        self._turnos_fallidos: List[Tuple[int, int]] = []
+        self._guardando = False
+        self._guardado = threading.Condition(self._cerrojo)
+        self._hilo_volcado: Optional[threading.Thread] = None
+        self._detener_volcado = threading.Event()
+        # Identifica lo que había en disco en la última lectura o escritura
+        # propia; None obliga a leer al tomar el bloqueo por primera vez
+        self._sello = None
+        with self._exclusivo():
+            pass  # al tomarlo se lee el archivo
+    
+    def suscribir(self, callback: Callable[[Evento], Any]):
+        """Registra una función que recibe cada ``Evento`` ya confirmado
+        
+        Los eventos de una transacción se entregan juntos tras guardarla;
+        si se revierte no se entrega ninguno.
+        """
+        self._suscriptores.append(callback)
+    
+    def desuscribir(self, callback: Callable[[Evento], Any]):
+        """Deja de entregar eventos a una función registrada"""
+        self._suscriptores.remove(callback)
     
     def _cargar_datos(self) -> Dict[str, List]:
         """Carga datos desde el archivo JSON"""
         if os.path.exists(self.archivo):
             try:
-                with open(self.archivo, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
+                return formatos.leer(self.archivo, self._formato_archivo())
+            except formatos.ERRORES_ARCHIVO_CORRUPTO:
                 return {'libros': [], 'usuarios': [], 'prestamos': []}
         return {'libros': [], 'usuarios': [], 'prestamos': []}
     
+    def _formato_archivo(self) -> str:
+        """Detecta el formato del archivo y fija el de guardado si no se eligió"""
+        formato = formatos.detectar_formato(self.archivo)
+        if self.formato is None:
+            self.formato = formato
+        return formato
+    
+    def _asegurar(self, coleccion: str):
+        """En modo perezoso, carga una colección la primera vez que se usa"""
+        if self._completo or coleccion in self._consultadas:
+            return
+        with self._cerrojo:
+            if self._completo or coleccion in self._consultadas:
+                return
+            try:
+                elementos = list(formatos.iterar_coleccion(
+                    self.archivo, coleccion, self._formato_archivo()))
+            except formatos.ERRORES_ARCHIVO_CORRUPTO:
+                elementos = []
+            if elementos:
+                self.datos[coleccion] = elementos
+                self._indexar_coleccion(coleccion)
+            # Se marca al final para que otro hilo no la vea a medio cargar
+            self._consultadas.add(coleccion)
+    
+    def _completar(self):
+        """En modo perezoso, carga las colecciones que aún no se usaron"""
+        if self._completo:
+            return
+        for coleccion, elementos in self._cargar_datos().items():
+            if coleccion not in self._consultadas:
+                self.datos[coleccion] = elementos
+                self._indexar_coleccion(coleccion)
+        self._completo = True
+    
+    def iterar(self, coleccion: str) -> Iterator[Dict]:
+        """Recorre una colección sin materializarla si aún no está cargada"""
+        if self._completo or coleccion in self._consultadas:
+            yield from self.datos.get(coleccion, [])
+            return
+        if not os.path.exists(self.archivo):
+            return
+        yield from formatos.iterar_coleccion(
+            self.archivo, coleccion, self._formato_archivo())
+    
+    def _reconstruir_indices(self):
+        """Reconstruye los índices de todas las colecciones cargadas"""
+        self.indices = {}
+        self.activos_por_isbn = {}
+        self.activos_por_usuario = {}
+        self.activos_repetidos = {}
+        self.vencimientos = []
+        self.reservas_por_isbn = {}
+        self.reservas_por_usuario = {}
+        for coleccion in self.datos:
+            self._indexar_coleccion(coleccion)
+    
+    def _indexar_coleccion(self, coleccion: str):
+        """Construye los índices de una colección"""
+        campo = CLAVES.get(coleccion)
+        if campo is None:
+            return
+        indice = self.indices[coleccion] = {}
+        for elemento in self.datos[coleccion]:
+            # Ante claves repetidas se conserva la primera, igual que
+            # haría un recorrido lineal
+            indice.setdefault(elemento.get(campo), elemento)
+        
+        if coleccion == 'prestamos':
+            for prestamo in self.datos[coleccion]:
+                self._indexar_prestamo(prestamo, ordenar=False)
+            # Ordenar una vez al final en lugar de insertar cada uno en orden
+            self.vencimientos.sort()
+        elif coleccion == 'reservas':
+            for reserva in self.datos[coleccion]:
+                self._indexar_reserva(reserva)
+    
+    def _indexar_prestamo(self, prestamo: Dict[str, Any], ordenar: bool = True):
+        """Registra un préstamo en los índices de préstamos activos"""
+        if prestamo.get('fecha_devolucion') is not None:
+            return
+        isbn = prestamo.get('isbn_libro')
+        if isbn in self.activos_por_isbn:
+            # Se conserva el más antiguo como préstamo activo del libro,
+            # igual que en SQLite
+            logger.warning("El libro %s tiene más de un préstamo activo: %s y %s", isbn,
+                           self.activos_por_isbn[isbn].get('id_prestamo'),
+                           prestamo.get('id_prestamo'))
+            self.activos_repetidos.setdefault(isbn, []).append(prestamo)
+        else:
+            self.activos_por_isbn[isbn] = prestamo
+        self.activos_por_usuario.setdefault(prestamo.get('id_usuario'), []).append(prestamo)
+        if prestamo.get('fecha_vencimiento') is not None:
+            entrada = (prestamo['fecha_vencimiento'], prestamo.get('id_prestamo'))
+            if ordenar:
+                insort(self.vencimientos, entrada)
+            else:
+                self.vencimientos.append(entrada)
+    
+    def _desindexar_prestamo(self, prestamo: Dict[str, Any]):
+        """Elimina un préstamo del índice de préstamos activos"""
+        isbn = prestamo.get('isbn_libro')
+        repetidos = self.activos_repetidos.get(isbn, [])
+        if self.activos_por_isbn.get(isbn) is prestamo:
+            if repetidos:
+                self.activos_por_isbn[isbn] = repetidos.pop(0)
+            else:
+                del self.activos_por_isbn[isbn]
+        else:
+            for i, p in enumerate(repetidos):
+                if p is prestamo:
+                    del repetidos[i]
+                    break
+        if not repetidos:
+            self.activos_repetidos.pop(isbn, None)
+        
+        id_usuario = prestamo.get('id_usuario')
+        prestamos_usuario = self.activos_por_usuario.get(id_usuario, [])
+        for i, p in enumerate(prestamos_usuario):
+            if p is prestamo:
+                del prestamos_usuario[i]
+                break
+        if not prestamos_usuario:
+            self.activos_por_usuario.pop(id_usuario, None)
+        
+        if prestamo.get('fecha_vencimiento') is not None:
+            entrada = (prestamo['fecha_vencimiento'], prestamo.get('id_prestamo'))
+            i = bisect_left(self.vencimientos, entrada)
+            if i < len(self.vencimientos) and self.vencimientos[i] == entrada:
+                del self.vencimientos[i]
+    
+    def _indexar_reserva(self, reserva: Dict[str, Any], encolar: bool = True):
+        """Registra una reserva pendiente en la cola de su libro y en su usuario
+        
+        Con ``encolar=False`` no se añade a la cola porque ya estaba en ella.
+        """
+        if reserva.get('estado') != 'pendiente':
+            return
+        isbn = reserva.get('isbn_libro')
+        if encolar:
+            self.reservas_por_isbn.setdefault(isbn, deque()).append(reserva)
+        self.reservas_por_usuario.setdefault(reserva.get('id_usuario'), {}).setdefault(
+            isbn, reserva)
+    
+    def _desindexar_reserva(self, reserva: Dict[str, Any]):
+        """Quita una reserva de las de su usuario; la cola se limpia al consultarla"""
+        id_usuario = reserva.get('id_usuario')
+        reservas_usuario = self.reservas_por_usuario.get(id_usuario, {})
+        if reservas_usuario.get(reserva.get('isbn_libro')) is reserva:
+            del reservas_usuario[reserva.get('isbn_libro')]
+            if not reservas_usuario:
+                del self.reservas_por_usuario[id_usuario]
+    
+    @instrumentar()
     def guardar_datos(self) -> bool:
         """Guarda datos en el archivo JSON"""
+        # Se escribe en un temporal y se renombra para que una caída a
+        # mitad de escritura nunca deje el archivo a medias
+        self._completar()
         try:
-            with open(self.archivo, 'w', encoding='utf-8') as f:
-                json.dump(self.datos, f, indent=2, ensure_ascii=False)
+            temporal = self.archivo + '.tmp'
+            with open(temporal, 'wb') as f:
+                formatos.escribir(f, self._instantanea(), self.formato or 'json')
+                f.flush()
+                os.fsync(f.fileno())
+                escritos = f.tell()
+            os.replace(temporal, self.archivo)
+            if registro.activo:
+                registro.observar('bytes_guardados', 'guardar_datos', escritos)
             return True
-        except Exception as e:
-            print(f"Error al guardar: {e}")
+        except Exception:
+            logger.exception("Error al guardar %s", self.archivo)
             return False
     
+    def _instantanea(self) -> Dict[str, Any]:
+        """Datos que se escriben en el archivo al guardar"""
+        return self.datos
+    
+    def _recargar(self):
+        """Descarta el estado en memoria y lo vuelve a leer del disco"""
+        self._generacion += 1
+        self._consultadas = set()
+        if self.perezoso and os.path.exists(self.archivo):
+            self.datos = {}
+            self._completo = False
+        else:
+            self.datos = self._cargar_datos()
+            self._completo = True
+        self._reconstruir_indices()
+    
+    def _archivos_vigilados(self) -> List[str]:
+        """Archivos cuyo cambio por otro proceso obliga a recargar"""
+        return [self.archivo]
+    
+    def _sello_disco(self) -> tuple:
+        """Inodo, tamaño y fecha de modificación de los archivos vigilados
+        
+        Guardar reemplaza el archivo por uno nuevo, así que el inodo cambia
+        aunque la fecha no alcance a hacerlo.
+        """
+        sello = []
+        for archivo in self._archivos_vigilados():
+            try:
+                estado = os.stat(archivo)
+            except FileNotFoundError:
+                sello.append(None)
+            else:
+                sello.append((estado.st_ino, estado.st_size, estado.st_mtime_ns))
+        return tuple(sello)
+    
+    @contextmanager
+    def _exclusivo(self):
+        """Acceso exclusivo a la base frente a otros hilos y procesos
+        
+        Es reentrante. Al tomarlo desde fuera se recarga el estado si el
+        disco ya no es el de la última lectura o escritura propia.
+        """
+        with self._cerrojo:
+            # Con cambios sin guardar el bloqueo ya es nuestro y el disco
+            # no pudo cambiar
+            if self._bloqueos == 0 and self._archivo_bloqueo is None:
+                self._archivo_bloqueo = open(self.archivo + '.lock', 'a+b')
+                try:
+                    _bloquear_archivo(self._archivo_bloqueo)
+                    if self._sello != self._sello_disco():
+                        self._recargar()
+                except BaseException:
+                    self._archivo_bloqueo.close()
+                    self._archivo_bloqueo = None
+                    raise
+            self._bloqueos += 1
+            try:
+                yield
+            finally:
+                self._bloqueos -= 1
+                if self._bloqueos == 0 and not self._sin_guardar:
+                    # Con el bloqueo tomado, lo que haya en disco es propio
+                    self._sello = self._sello_disco()
+                    _desbloquear_archivo(self._archivo_bloqueo)
+                    self._archivo_bloqueo.close()
+                    self._archivo_bloqueo = None
+    
+    @contextmanager
+    def transaction(self):
+        """Agrupa varios cambios en una única escritura atómica
+        
+        Dentro del bloque los cambios se aplican en memoria y se acumulan;
+        al salir se persisten todos juntos. Si el bloque lanza una
+        excepción se descartan y se restaura el estado guardado. Las
+        transacciones anidadas se integran en la más externa.
+        
+        Todo el bloque se ejecuta con acceso exclusivo, así que lo que se
+        comprueba dentro sigue siendo cierto al guardar.
+        """
+        eventos = []
+        with self._exclusivo():
+            self._transacciones += 1
+            try:
+                yield self
+            except BaseException:
+                self._transacciones -= 1
+                # Solo hay que restaurar si algún cambio llegó a aplicarse
+                if self._transacciones == 0 and self._pendientes:
+                    self._pendientes, self._eventos = [], []
+                    self._restaurar()
+                raise
+            # Se sale de la transacción antes de confirmar: en modo grupo
+            # otros hilos escriben mientras esta espera
+            self._transacciones -= 1
+            if self._transacciones == 0 and self._pendientes:
+                cambios, self._pendientes = self._pendientes, []
+                eventos, self._eventos = self._eventos, []
+                if not self._confirmar(cambios):
+                    # En modo grupo quien guardó el grupo ya restauró el estado
+                    if self.durabilidad == 'sync':
+                        self._restaurar()
+                    raise IOError("No se pudieron guardar los cambios")
+        # Fuera de la transacción, por si un suscriptor vuelve a escribir
+        _notificar(self._suscriptores, eventos)
+    
     def agregar(self, coleccion: str, elemento: Dict[str, Any]) -> bool:
         """Agrega un elemento a una colección"""
+        with self._exclusivo():
+            self._aplicar_agregar(coleccion, elemento)
+            eventos = self._registrar({'op': 'agregar', 'coleccion': coleccion,
+                                       'elemento': elemento},
+                                      _evento('insertado', coleccion, elemento))
+        if eventos is None:
+            return False
+        _notificar(self._suscriptores, eventos)
+        return True
+    
+    def _aplicar_agregar(self, coleccion: str, elemento: Dict[str, Any]):
+        """Agrega un elemento en memoria manteniendo los índices"""
+        self._asegurar(coleccion)
+        self.versiones[coleccion] = self.versiones.get(coleccion, 0) + 1
         if coleccion not in self.datos:
             self.datos[coleccion] = []
         self.datos[coleccion].append(elemento)
-        return self.guardar_datos()
+        campo = CLAVES.get(coleccion)
+        if campo is not None:
+            self.indices.setdefault(coleccion, {}).setdefault(
+                elemento.get(campo), elemento)
+        if coleccion == 'prestamos':
+            self._indexar_prestamo(elemento)
+        elif coleccion == 'reservas':
+            self._indexar_reserva(elemento)
     
     def obtener_todos(self, coleccion: str) -> List[Dict]:
         """Obtiene todos los elementos de una colección"""
+        self._asegurar(coleccion)
         return self.datos.get(coleccion, [])
     
     def buscar(self, coleccion: str, campo: str, valor: Any) -> List[Dict]:
         """Busca elementos por un campo específico"""
+        self._asegurar(coleccion)
+        if CLAVES.get(coleccion) == campo:
+            if registro.activo:
+                registro.observar('elementos_recorridos', coleccion, 1)
+            elemento = self.indices.get(coleccion, {}).get(valor)
+            return [elemento] if elemento is not None else []
         elementos = self.datos.get(coleccion, [])
+        if registro.activo:
+            registro.observar('elementos_recorridos', coleccion, len(elementos))
         return [e for e in elementos if e.get(campo) == valor]
     
     def actualizar(self, coleccion: str, campo: str, valor: Any, 
                    datos_nuevos: Dict[str, Any]) -> bool:
         """Actualiza un elemento en la colección"""
-        elementos = self.datos.get(coleccion, [])
-        for elemento in elementos:
-            if elemento.get(campo) == valor:
-                elemento.update(datos_nuevos)
-                return self.guardar_datos()
-        return False
+        with self._exclusivo():
+            elemento = self._aplicar_actualizar(coleccion, campo, valor, datos_nuevos)
+            if elemento is None:
+                return False
+            eventos = self._registrar({'op': 'actualizar', 'coleccion': coleccion,
+                                       'campo': campo, 'valor': valor,
+                                       'datos': datos_nuevos},
+                                      _evento('actualizado', coleccion, elemento))
+        if eventos is None:
+            return False
+        _notificar(self._suscriptores, eventos)
+        return True
+    
+    def _aplicar_actualizar(self, coleccion: str, campo: str, valor: Any,
+                            datos_nuevos: Dict[str, Any]) -> Optional[Dict]:
+        """Actualiza un elemento en memoria manteniendo los índices
+        
+        Devuelve el elemento actualizado, o None si no existe.
+        """
+        # Solo se modifica lo que vive en memoria, no el historial de
+        # ``DatabaseHistorial``
+        resultados = Database.buscar(self, coleccion, campo, valor)
+        if not resultados:
+            return None
+        elemento = resultados[0]
+        self.versiones[coleccion] = self.versiones.get(coleccion, 0) + 1
+        
+        # Mantener el índice si cambia la clave primaria
+        clave = CLAVES.get(coleccion)
+        if clave in datos_nuevos and datos_nuevos[clave] != elemento.get(clave):
+            indice = self.indices[coleccion]
+            if indice.get(elemento.get(clave)) is elemento:
+                del indice[elemento.get(clave)]
+            indice.setdefault(datos_nuevos[clave], elemento)
+        
+        if coleccion == 'prestamos':
+            self._desindexar_prestamo(elemento)
+            elemento.update(datos_nuevos)
+            self._indexar_prestamo(elemento)
+        elif coleccion == 'reservas':
+            # Una reserva que deja de estar pendiente no vuelve a la cola
+            self._desindexar_reserva(elemento)
+            elemento.update(datos_nuevos)
+            self._indexar_reserva(elemento, encolar=False)
+        else:
+            elemento.update(datos_nuevos)
+        return elemento
+    
+    def _registrar(self, cambio: Dict[str, Any],
+                   evento: Evento) -> Optional[List[Evento]]:
+        """Persiste un cambio que ya se aplicó en memoria
+        
+        Devuelve los eventos que hay que entregar ya (ninguno dentro de una
+        transacción, que los entrega al terminar) o None si no se guardó.
+        """
+        if self._transacciones:
+            self._pendientes.append(cambio)
+            self._eventos.append(evento)
+            return []
+        if not self._confirmar([cambio]):
+            return None
+        return [evento]
+    
+    def _confirmar(self, cambios: List[Dict[str, Any]]) -> bool:
+        """Hace durables unos cambios ya aplicados, según la durabilidad
+        
+        Se llama con acceso exclusivo y fuera de transacciones. En modo
+        grupo espera a que se guarde el grupo; el primero en llegar lo
+        guarda tras esperar a los demás.
+        """
+        if self.durabilidad == 'sync':
+            return self._persistir(cambios)
+        self._sin_guardar.extend(cambios)
+        self._turno += 1
+        if self.durabilidad == 'periodico':
+            self._programar_volcado()
+            return True
+        
+        turno = self._turno
+        if not self._guardando:
+            self._guardando = True
+            try:
+                # Suelta el cerrojo mientras espera, para que otros hilos
+                # puedan aplicar sus cambios y sumarse al grupo
+                self._guardado.wait(self.ventana_grupo)
+            finally:
+                self._guardando = False
+            self.flush()
+        while self._turno_guardado < turno:
+            self._guardado.wait()
+        return not any(desde < turno <= hasta for desde, hasta in self._turnos_fallidos)
+    
+    def flush(self) -> bool:
+        """Guarda ya los cambios pendientes de los modos grupo y periódico
+        
+        Devuelve False si no se pudieron guardar. En modo periódico se
+        conservan para reintentarlo; en modo grupo se descartan y las
+        escrituras que esperaban fallan.
+        """
+        with self._exclusivo():
+            if not self._sin_guardar:
+                return True
+            cambios, self._sin_guardar = self._sin_guardar, []
+            desde, hasta = self._turno_guardado, self._turno
+            guardado = self._persistir(cambios)
+            if not guardado and self.durabilidad == 'periodico':
+                self._sin_guardar[:0] = cambios
+                return False
+            if not guardado:
+                self._recargar()
+                self._turnos_fallidos = self._turnos_fallidos[-15:] + [(desde, hasta)]
+            self._turno_guardado = hasta
+            self._guardado.notify_all()
+            return guardado
+    
+    def _programar_volcado(self):
+        """Arranca el hilo de volcado periódico si aún no lo está"""
+        if self._hilo_volcado is not None:
+            return
+        self._detener_volcado.clear()
+        self._hilo_volcado = threading.Thread(target=self._volcar_periodicamente,
+                                              name='volcado', daemon=True)
+        self._hilo_volcado.start()
+        atexit.register(_volcar_al_salir, weakref.ref(self))
+    
+    def _volcar_periodicamente(self):
+        """Cuerpo del hilo de volcado: guarda cada ``intervalo_volcado``"""
+        while not self._detener_volcado.wait(self.intervalo_volcado):
+            self.flush()
+    
+    def _restaurar(self):
+        """Vuelve al estado guardado más los cambios aún sin guardar
+        
+        Al revertir una transacción no deben perderse los cambios de
+        otros hilos que esperan al próximo volcado.
+        """
+        self._recargar()
+        for cambio in self._sin_guardar:
+            self._aplicar(cambio)
+    
+    def _aplicar(self, cambio: Dict[str, Any]):
+        """Aplica en memoria un cambio registrado (del diario o pendiente)"""
+        if cambio['op'] == 'agregar':
+            self._aplicar_agregar(cambio['coleccion'], cambio['elemento'])
+        elif cambio['op'] == 'actualizar':
+            self._aplicar_actualizar(cambio['coleccion'], cambio['campo'],
+                                     cambio['valor'], cambio['datos'])
+    
+    def _persistir(self, cambios: List[Dict[str, Any]]) -> bool:
+        """Escribe en disco un grupo de cambios ya aplicados en memoria"""
+        return self.guardar_datos()
+    
+    def listar(self, coleccion: str, offset: int = 0, limite: Optional[int] = None,
+               filtro: Optional[Dict[str, Any]] = None,
+               orden: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """Obtiene una página de una colección y el total de elementos
+        
+        ``filtro`` exige igualdad en cada campo indicado y ``orden`` es el
+        nombre de un campo, con un ``-`` delante para orden descendente.
+        El resultado filtrado u ordenado se conserva mientras la colección
+        no cambie, así que pedir las páginas siguientes solo cuesta el
+        tamaño de la página.
+        """
+        filtro = filtro or {}
+        with self._cerrojo:
+            if not filtro and not orden:
+                elementos = self.obtener_todos(coleccion)
+            else:
+                clave = (coleccion, tuple(sorted(filtro.items())), orden)
+                version = self.version(coleccion)
+                guardado = self._listados.get(clave)
+                if guardado is None or guardado[0] != version:
+                    guardado = (version, self._filtrar_y_ordenar(coleccion, filtro, orden))
+                    self._listados.pop(clave, None)
+                    if len(self._listados) >= MAX_LISTADOS:
+                        del self._listados[next(iter(self._listados))]
+                    self._listados[clave] = guardado
+                elementos = guardado[1]
+            
+            fin = None if limite is None else offset + limite
+            return elementos[offset:fin], len(elementos)
+    
+    def _filtrar_y_ordenar(self, coleccion: str, filtro: Dict[str, Any],
+                           orden: Optional[str]) -> List[Dict]:
+        """Aplica un filtro por igualdad y un orden, usando índices si es posible"""
+        clave = CLAVES.get(coleccion)
+        if clave in filtro:
+            candidatos = self.buscar(coleccion, clave, filtro[clave])
+        elif (coleccion == 'prestamos' and 'fecha_devolucion' in filtro
+              and filtro['fecha_devolucion'] is None):
+            candidatos = self.prestamos_activos(filtro.get('id_usuario'))
+        else:
+            candidatos = self.obtener_todos(coleccion)
+        
+        elementos = [e for e in candidatos
+                     if all(e.get(campo) == valor for campo, valor in filtro.items())]
+        if orden:
+            campo = orden.lstrip('-')
+            # Los valores ausentes se agrupan al final en orden ascendente
+            elementos.sort(key=lambda e: (e.get(campo) is None, e.get(campo)),
+                           reverse=orden.startswith('-'))
+        return elementos
+    
+    def version(self, coleccion: str) -> tuple:
+        """Identifica el estado de una colección; cambia con cada modificación
+        
+        Permite a quien guarde objetos derivados de la colección saber
+        si siguen siendo válidos sin volver a recorrerla.
+        """
+        return (self._generacion, self.versiones.get(coleccion, 0))
+    
+    def prestamo_activo(self, isbn: str) -> Optional[Dict]:
+        """Obtiene el préstamo activo de un libro, si lo hay"""
+        self._asegurar('prestamos')
+        return self.activos_por_isbn.get(isbn)
+    
+    def prestamos_activos(self, id_usuario: Optional[str] = None) -> List[Dict]:
+        """Obtiene los préstamos activos, opcionalmente de un usuario"""
+        self._asegurar('prestamos')
+        if id_usuario is not None:
+            return list(self.activos_por_usuario.get(id_usuario, []))
+        return list(self.activos_por_isbn.values()) + [
+            p for repetidos in self.activos_repetidos.values() for p in repetidos]
+    
+    def prestamos_por_vencer(self, hasta: str, desde: Optional[str] = None) -> List[Dict]:
+        """Préstamos activos que vencen antes de ``hasta``, por orden de vencimiento
+        
+        Con ``desde`` solo los que vencen a partir de ese momento. Las
+        fechas son ISO, como las de los préstamos. Gracias al índice
+        ordenado solo se recorren los préstamos que se devuelven.
+        """
+        self._asegurar('prestamos')
+        with self._cerrojo:
+            inicio = 0 if desde is None else bisect_left(self.vencimientos, (desde,))
+            fin = bisect_left(self.vencimientos, (hasta,))
+            indice = self.indices.get('prestamos', {})
+            return [indice[id_prestamo] for _, id_prestamo in self.vencimientos[inicio:fin]]
+    
+    def _cola_reservas(self, isbn: str) -> deque:
+        """Cola de reservas de un libro sin las que ya no están pendientes al principio"""
+        cola = self.reservas_por_isbn.get(isbn)
+        if cola is None:
+            return deque()
+        while cola and (cola[0].get('estado') != 'pendiente'
+                        or cola[0].get('isbn_libro') != isbn):
+            cola.popleft()
+        if not cola:
+            del self.reservas_por_isbn[isbn]
+        return cola
+    
+    def siguiente_reserva(self, isbn: str) -> Optional[Dict]:
+        """Reserva pendiente más antigua de un libro, si la hay"""
+        self._asegurar('reservas')
+        with self._cerrojo:
+            cola = self._cola_reservas(isbn)
+            return cola[0] if cola else None
+    
+    def reservas_de_usuario(self, id_usuario: str) -> List[Dict]:
+        """Reservas pendientes de un usuario"""
+        self._asegurar('reservas')
+        return list(self.reservas_por_usuario.get(id_usuario, {}).values())
+    
+    def posicion_reserva(self, isbn: str, id_usuario: str) -> Optional[int]:
+        """Puesto (desde 1) de la reserva pendiente de un usuario en la cola de un libro
+        
+        Recorre la cola solo hasta llegar a esa reserva.
+        """
+        self._asegurar('reservas')
+        with self._cerrojo:
+            reserva = self.reservas_por_usuario.get(id_usuario, {}).get(isbn)
+            if reserva is None:
+                return None
+            posicion = 0
+            for otra in self._cola_reservas(isbn):
+                if otra.get('estado') == 'pendiente' and otra.get('isbn_libro') == isbn:
+                    posicion += 1
+                if otra is reserva:
+                    return posicion
+            return None
+    
+    def cerrar(self):
+        """Guarda lo pendiente y libera los recursos de la base de datos"""
+        if self._hilo_volcado is not None:
+            self._detener_volcado.set()
+            self._hilo_volcado.join()
+            self._hilo_volcado = None
+        self.flush()
+
+
+class DatabaseDiario(Database):
+    """Persistencia con diario de escritura anticipada (append-only)
+    
+    Cada cambio se añade como una línea JSON compacta al archivo
+    ``<archivo>.log`` en lugar de reescribir todo el JSON. Al abrir, el
+    estado se reconstruye con la última instantánea más el diario, y
+    cuando el diario supera ``umbral_compactacion`` registros se vuelca
+    en una instantánea nueva y se vacía.
+    """
+    
+    def __init__(self, archivo: str = 'biblioteca.json',
+                 umbral_compactacion: int = 1000, formato: Optional[str] = None,
+                 durabilidad: str = 'sync', ventana_grupo: float = VENTANA_GRUPO,
+                 intervalo_volcado: float = INTERVALO_VOLCADO):
+        self.archivo_diario = archivo + '.log'
+        self.umbral_compactacion = umbral_compactacion
+        self.secuencia = 0
+        self.registros_diario = 0
+        super().__init__(archivo, formato=formato, durabilidad=durabilidad,
+                         ventana_grupo=ventana_grupo, intervalo_volcado=intervalo_volcado)
+    
+    def _cargar_datos(self) -> Dict[str, List]:
+        """Carga la instantánea y la secuencia del último cambio incluido"""
+        datos = super()._cargar_datos()
+        self.secuencia = datos.pop('_secuencia', 0)
+        return datos
+    
+    def _reproducir_diario(self):
+        """Aplica sobre la instantánea los cambios registrados en el diario"""
+        self.registros_diario = 0
+        if not os.path.exists(self.archivo_diario):
+            return
+        
+        valido = 0
+        with open(self.archivo_diario, 'rb') as f:
+            for linea in f:
+                try:
+                    cambio = json.loads(linea)
+                except ValueError:
+                    # Línea incompleta de una escritura interrumpida
+                    break
+                valido += len(linea)
+                self.registros_diario += 1
+                if cambio['n'] <= self.secuencia:
+                    continue
+                self._aplicar(cambio)
+                self.secuencia = cambio['n']
+        
+        if valido < os.path.getsize(self.archivo_diario):
+            with open(self.archivo_diario, 'r+b') as f:
+                f.truncate(valido)
+    
+    def _archivos_vigilados(self) -> List[str]:
+        """El diario crece con cada cambio sin reemplazar la instantánea"""
+        return [self.archivo, self.archivo_diario]
+    
+    def _recargar(self):
+        """Vuelve a leer la instantánea y el diario desde el disco"""
+        super()._recargar()
+        self._reproducir_diario()
+    
+    def _persistir(self, cambios: List[Dict[str, Any]]) -> bool:
+        """Añade los cambios al diario y compacta si se supera el umbral"""
+        lineas = []
+        for cambio in cambios:
+            self.secuencia += 1
+            lineas.append(json.dumps({'n': self.secuencia, **cambio},
+                                     ensure_ascii=False, separators=(',', ':')))
+        texto = '\n'.join(lineas) + '\n'
+        try:
+            with open(self.archivo_diario, 'a', encoding='utf-8') as f:
+                f.write(texto)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            logger.exception("Error al guardar %s", self.archivo_diario)
+            return False
+        if registro.activo:
+            registro.observar('bytes_guardados', 'diario', len(texto.encode('utf-8')))
+        
+        self.registros_diario += len(lineas)
+        if self.registros_diario >= self.umbral_compactacion:
+            return self.compactar()
+        return True
+    
+    def _instantanea(self) -> Dict[str, Any]:
+        """La instantánea incluye la secuencia del último cambio aplicado"""
+        return {**self.datos, '_secuencia': self.secuencia}
+    
+    def compactar(self) -> bool:
+        """Vuelca el diario en una instantánea nueva y lo vacía"""
+        with self._exclusivo():
+            if not self.guardar_datos():
+                return False
+            # Si se interrumpe aquí, los registros ya incluidos en la
+            # instantánea se descartan al reproducir gracias a la secuencia
+            with open(self.archivo_diario, 'w', encoding='utf-8'):
+                pass
+            self.registros_diario = 0
+            return True
+
+
+class DatabaseHistorial(Database):
+    """Persistencia JSON con los préstamos cerrados fuera del archivo
+    
+    Solo los préstamos activos viven en memoria y en el JSON. Al guardar,
+    los que se cerraron pasan a un ``AlmacenPrestamos`` en
+    ``<archivo>.historial``, de modo que ni la memoria ni cada guardado
+    crecen con el historial. Los préstamos cerrados de un JSON existente
+    se trasladan en la primera escritura.
+    
+    ``iterar``, ``obtener_todos`` y ``buscar`` incluyen el historial,
+    ``buscar`` por libro o usuario sin decodificar los demás registros. Un
+    préstamo cerrado ya no se puede modificar, y los préstamos se recorren
+    en el orden en que se cerraron, con los activos al final.
+    """
+    
+    def __init__(self, archivo: str = 'biblioteca.json', formato: Optional[str] = None,
+                 durabilidad: str = 'sync', ventana_grupo: float = VENTANA_GRUPO,
+                 intervalo_volcado: float = INTERVALO_VOLCADO):
+        self.historial = AlmacenPrestamos(archivo + '.historial')
+        # Préstamos cerrados que aún no se han añadido al historial
+        self._cerrados: List[Dict[str, Any]] = []
+        super().__init__(archivo, formato=formato, durabilidad=durabilidad,
+                         ventana_grupo=ventana_grupo, intervalo_volcado=intervalo_volcado)
+    
+    def _cargar_datos(self) -> Dict[str, List]:
+        """Carga el JSON y descarta del historial lo que este no incluye"""
+        datos = super()._cargar_datos()
+        # Un historial más largo que lo que registra el JSON viene de un
+        # guardado que no llegó a completarse
+        self.historial.abrir(datos.pop('_historial', 0))
+        prestamos = datos.get('prestamos', [])
+        self._cerrados = [p for p in prestamos if p.get('fecha_devolucion') is not None]
+        if self._cerrados:
+            datos['prestamos'] = [p for p in prestamos if p.get('fecha_devolucion') is None]
+        return datos
+    
+    def _archivos_vigilados(self) -> List[str]:
+        """Otro proceso también puede añadir al historial"""
+        return [self.archivo] + self.historial.rutas
+    
+    def _aplicar_agregar(self, coleccion: str, elemento: Dict[str, Any]):
+        """Un préstamo que ya llega cerrado va directo al historial"""
+        if coleccion != 'prestamos' or elemento.get('fecha_devolucion') is None:
+            super()._aplicar_agregar(coleccion, elemento)
+            return
+        self.versiones[coleccion] = self.versiones.get(coleccion, 0) + 1
+        self._cerrados.append(elemento)
+    
+    def _aplicar_actualizar(self, coleccion: str, campo: str, valor: Any,
+                            datos_nuevos: Dict[str, Any]) -> Optional[Dict]:
+        """Saca de memoria los préstamos que se cierran"""
+        elemento = super()._aplicar_actualizar(coleccion, campo, valor, datos_nuevos)
+        if (coleccion == 'prestamos' and elemento is not None
+                and elemento.get('fecha_devolucion') is not None):
+            prestamos = self.datos['prestamos']
+            for i, p in enumerate(prestamos):
+                if p is elemento:
+                    del prestamos[i]
+                    break
+            indice = self.indices['prestamos']
+            if indice.get(elemento.get('id_prestamo')) is elemento:
+                del indice[elemento.get('id_prestamo')]
+            self._cerrados.append(elemento)
+        return elemento
+    
+    def iterar(self, coleccion: str) -> Iterator[Dict]:
+        """Los préstamos se recorren desde el historial, sin cargarlo"""
+        if coleccion == 'prestamos':
+            yield from self.historial
+            yield from list(self._cerrados)
+        yield from super().iterar(coleccion)
+    
+    def obtener_todos(self, coleccion: str) -> List[Dict]:
+        """Con los préstamos hay que leer todo el historial"""
+        if coleccion == 'prestamos':
+            return list(self.iterar(coleccion))
+        return super().obtener_todos(coleccion)
+    
+    def buscar(self, coleccion: str, campo: str, valor: Any) -> List[Dict]:
+        """Busca también en el historial los préstamos que no están activos"""
+        resultados = super().buscar(coleccion, campo, valor)
+        if coleccion != 'prestamos' or (resultados and campo == CLAVES[coleccion]):
+            return resultados
+        return (resultados + [p for p in self._cerrados if p.get(campo) == valor]
+                + list(self.historial.buscar(campo, valor)))
+    
+    def guardar_datos(self) -> bool:
+        """Añade al historial los préstamos cerrados y guarda el JSON"""
+        if self._cerrados:
+            if not self.historial.anadir(self._cerrados):
+                return False
+            self._cerrados = []
+        return super().guardar_datos()
+    
+    def _instantanea(self) -> Dict[str, Any]:
+        """La instantánea registra cuántos registros del historial son válidos"""
+        return {**self.datos, '_historial': len(self.historial)}
+    
+    def cerrar(self):
+        """Guarda lo pendiente y libera el mapa del historial"""
+        super().cerrar()
+        self.historial.cerrar()
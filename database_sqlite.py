@@ -0,0 +1,506 @@
+"""Módulo de persistencia de datos en SQLite"""
+import json
+import logging
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+from database import Evento, _evento, _notificar
+import formatos
+
+logger = logging.getLogger(__name__)
+
+# Columnas de cada colección; la primera es la clave primaria
+ESQUEMA = {
+    'libros': ['isbn', 'titulo', 'autor', 'disponible'],
+    'usuarios': ['id_usuario', 'nombre', 'email', 'activo'],
+    'prestamos': ['id_prestamo', 'isbn_libro', 'id_usuario',
+                  'fecha_prestamo', 'fecha_devolucion', 'fecha_vencimiento'],
+    'reservas': ['id_reserva', 'isbn_libro', 'id_usuario', 'fecha_reserva',
+                 'estado', 'id_prestamo']
+}
+
+# Columnas que SQLite guarda como enteros pero se exponen como bool
+BOOLEANOS = {'disponible', 'activo'}
+
+SENTENCIAS_ESQUEMA = [
+    '''CREATE TABLE IF NOT EXISTS libros (
+        isbn TEXT PRIMARY KEY,
+        titulo TEXT NOT NULL,
+        autor TEXT NOT NULL,
+        disponible INTEGER NOT NULL DEFAULT 1
+    )''',
+    '''CREATE TABLE IF NOT EXISTS usuarios (
+        id_usuario TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        email TEXT NOT NULL,
+        activo INTEGER NOT NULL DEFAULT 1
+    )''',
+    '''CREATE TABLE IF NOT EXISTS prestamos (
+        id_prestamo TEXT NOT NULL,
+        isbn_libro TEXT NOT NULL,
+        id_usuario TEXT NOT NULL,
+        fecha_prestamo TEXT NOT NULL,
+        fecha_devolucion TEXT,
+        fecha_vencimiento TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_prestamos_id ON prestamos(id_prestamo)',
+    'CREATE INDEX IF NOT EXISTS idx_prestamos_isbn ON prestamos(isbn_libro)',
+    'CREATE INDEX IF NOT EXISTS idx_prestamos_usuario ON prestamos(id_usuario)',
+    '''CREATE INDEX IF NOT EXISTS idx_prestamos_activos_isbn
+        ON prestamos(isbn_libro) WHERE fecha_devolucion IS NULL''',
+    '''CREATE INDEX IF NOT EXISTS idx_prestamos_activos_usuario
+        ON prestamos(id_usuario) WHERE fecha_devolucion IS NULL''',
+    '''CREATE INDEX IF NOT EXISTS idx_prestamos_activos_vencimiento
+        ON prestamos(fecha_vencimiento, id_prestamo) WHERE fecha_devolucion IS NULL''',
+    '''CREATE TABLE IF NOT EXISTS reservas (
+        id_reserva TEXT NOT NULL,
+        isbn_libro TEXT NOT NULL,
+        id_usuario TEXT NOT NULL,
+        fecha_reserva TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        id_prestamo TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_reservas_id ON reservas(id_reserva)',
+    # La cola de cada libro son sus reservas pendientes por orden de rowid
+    """CREATE INDEX IF NOT EXISTS idx_reservas_pendientes_isbn
+        ON reservas(isbn_libro) WHERE estado = 'pendiente'""",
+    """CREATE INDEX IF NOT EXISTS idx_reservas_pendientes_usuario
+        ON reservas(id_usuario) WHERE estado = 'pendiente'""",
+    # Colecciones sin tabla propia se guardan como documentos JSON
+    '''CREATE TABLE IF NOT EXISTS documentos (
+        coleccion TEXT NOT NULL,
+        datos TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_documentos ON documentos(coleccion)'
+]
+
+class SQLiteDatabase:
+    """Maneja la persistencia de datos en una base SQLite
+    
+    Ofrece la misma interfaz que ``Database`` (agregar, obtener_todos,
+    buscar, actualizar y las consultas de préstamos activos), pero los
+    datos viven en disco con índices en lugar de cargarse completos en
+    memoria.
+    """
+    
+    def __init__(self, archivo: str = 'biblioteca.db'):
+        self.archivo = archivo
+        # sqlite3 reutiliza las sentencias preparadas de su caché cuando
+        # el texto SQL coincide, por eso cada consulta se genera una sola vez.
+        # La conexión puede usarse desde varios hilos; las lecturas,
+        # escrituras y transacciones se serializan con ``_cerrojo``
+        self.conexion = sqlite3.connect(archivo, cached_statements=256,
+                                        check_same_thread=False)
+        self.conexion.row_factory = sqlite3.Row
+        self.conexion.execute('PRAGMA journal_mode=WAL')
+        self.conexion.execute('PRAGMA synchronous=NORMAL')
+        with self.conexion:
+            self._anadir_columnas()
+            for sentencia in SENTENCIAS_ESQUEMA:
+                self.conexion.execute(sentencia)
+        self._sql: Dict[tuple, str] = {}
+        self._cerrojo = threading.RLock()
+        self._transacciones = 0
+        self.versiones: Dict[str, int] = {}
+        self._eventos: List[Evento] = []
+        self._suscriptores: List[Callable[[Evento], Any]] = []
+    
+    def _anadir_columnas(self):
+        """Añade a las tablas de una base existente las columnas que les falten"""
+        for coleccion, columnas in ESQUEMA.items():
+            existentes = {fila[1] for fila in
+                          self.conexion.execute(f'PRAGMA table_info({coleccion})')}
+            # Sin columnas la tabla aún no existe y se crea completa
+            for columna in columnas:
+                if existentes and columna not in existentes:
+                    self.conexion.execute(f'ALTER TABLE {coleccion} ADD COLUMN {columna}')
+    
+    def suscribir(self, callback: Callable[[Evento], Any]):
+        """Registra una función que recibe cada ``Evento`` ya confirmado
+        
+        Igual que en ``Database``, los eventos de una transacción se
+        entregan tras confirmarla.
+        """
+        self._suscriptores.append(callback)
+    
+    def desuscribir(self, callback: Callable[[Evento], Any]):
+        """Deja de entregar eventos a una función registrada"""
+        self._suscriptores.remove(callback)
+    
+    def _sentencia(self, *clave) -> str:
+        """Obtiene el texto SQL de una operación, generándolo una vez"""
+        sql = self._sql.get(clave)
+        if sql is None:
+            sql = self._sql[clave] = self._generar_sql(*clave)
+        return sql
+    
+    @staticmethod
+    def _generar_sql(operacion: str, coleccion: str, *campos: str) -> str:
+        """Genera el texto SQL de una operación sobre una colección"""
+        columnas = ESQUEMA[coleccion]
+        if operacion == 'insertar':
+            return (f"INSERT INTO {coleccion} ({', '.join(columnas)}) "
+                    f"VALUES ({', '.join('?' for _ in columnas)})")
+        if operacion == 'todos':
+            return f"SELECT {', '.join(columnas)} FROM {coleccion} ORDER BY rowid"
+        if operacion == 'tramo':
+            return (f"SELECT rowid, {', '.join(columnas)} FROM {coleccion} "
+                    f"WHERE rowid > ? ORDER BY rowid LIMIT ?")
+        if operacion == 'buscar':
+            return (f"SELECT {', '.join(columnas)} FROM {coleccion} "
+                    f"WHERE {campos[0]} IS ? ORDER BY rowid")
+        if operacion == 'actualizar':
+            # RETURNING (SQLite 3.35+) devuelve la fila para el evento
+            asignaciones = ', '.join(f'{c} = ?' for c in campos[1:])
+            return (f"UPDATE {coleccion} SET {asignaciones} WHERE rowid = "
+                    f"(SELECT rowid FROM {coleccion} WHERE {campos[0]} IS ? "
+                    f"ORDER BY rowid LIMIT 1) RETURNING {', '.join(columnas)}")
+        raise ValueError(f"Operación desconocida: {operacion}")
+    
+    @staticmethod
+    def _validar_campos(coleccion: str, campos) -> None:
+        """Evita que un nombre de campo arbitrario llegue al SQL"""
+        desconocidos = set(campos) - set(ESQUEMA[coleccion])
+        if desconocidos:
+            raise ValueError(f"Campos desconocidos en {coleccion}: {sorted(desconocidos)}")
+    
+    @staticmethod
+    def _a_dict(fila: sqlite3.Row) -> Dict[str, Any]:
+        """Convierte una fila en el diccionario que usa el resto del sistema"""
+        elemento = dict(fila)
+        for campo in BOOLEANOS & elemento.keys():
+            elemento[campo] = bool(elemento[campo])
+        return elemento
+    
+    def _filas(self, sql: str, parametros=()) -> List[sqlite3.Row]:
+        """Ejecuta una consulta y devuelve todas sus filas
+        
+        Se lee bajo ``_cerrojo`` para no ver, ni interrumpir, la
+        transacción que otro hilo tenga abierta en la conexión compartida.
+        """
+        with self._cerrojo:
+            return self.conexion.execute(sql, parametros).fetchall()
+    
+    def guardar_datos(self) -> bool:
+        """Confirma los cambios pendientes en la base de datos"""
+        try:
+            with self._cerrojo:
+                self.conexion.commit()
+            return True
+        except sqlite3.Error:
+            logger.exception("Error al guardar %s", self.archivo)
+            return False
+    
+    @contextmanager
+    def transaction(self):
+        """Agrupa varios cambios en una única transacción de SQLite
+        
+        Si el bloque lanza una excepción los cambios se deshacen. Las
+        transacciones anidadas se integran en la más externa.
+        """
+        eventos = []
+        # Los demás hilos esperan a que termine para no colarse en ella
+        with self._cerrojo:
+            if self._transacciones == 0:
+                # IMMEDIATE reserva la escritura desde el principio, así las
+                # comprobaciones hechas dentro del bloque siguen siendo válidas
+                self.conexion.execute('BEGIN IMMEDIATE')
+            self._transacciones += 1
+            try:
+                yield self
+            except BaseException:
+                if self._transacciones == 1:
+                    self._deshacer()
+                raise
+            else:
+                if self._transacciones == 1:
+                    try:
+                        self.conexion.commit()
+                    except BaseException:
+                        self._deshacer()
+                        raise
+                    eventos, self._eventos = self._eventos, []
+            finally:
+                self._transacciones -= 1
+        _notificar(self._suscriptores, eventos)
+    
+    def _deshacer(self):
+        """Deshace la transacción abierta y descarta sus eventos"""
+        self.conexion.rollback()
+        self._eventos = []
+        # Lo leído durante la transacción ya no es válido
+        for coleccion in self.versiones:
+            self.versiones[coleccion] += 1
+    
+    @contextmanager
+    def _escritura(self, coleccion: str):
+        """Confirma la escritura al terminar salvo dentro de una transacción
+        
+        Entrega una lista donde anotar los eventos de la escritura, que se
+        notifican al confirmarla.
+        """
+        eventos: List[Evento] = []
+        with self._cerrojo:
+            self.versiones[coleccion] = self.versiones.get(coleccion, 0) + 1
+            if self._transacciones:
+                yield eventos
+                self._eventos.extend(eventos)
+                return
+            with self.conexion:
+                yield eventos
+        _notificar(self._suscriptores, eventos)
+    
+    def agregar(self, coleccion: str, elemento: Dict[str, Any]) -> bool:
+        """Agrega un elemento a una colección
+        
+        Dentro de una transacción los errores de SQLite se propagan para
+        que se deshaga entera; fuera de ella se registran y devuelve False.
+        """
+        en_transaccion = False
+        try:
+            with self._escritura(coleccion) as eventos:
+                en_transaccion = self._transacciones > 0
+                if coleccion in ESQUEMA:
+                    self._validar_campos(coleccion, elemento)
+                    self.conexion.execute(
+                        self._sentencia('insertar', coleccion),
+                        [elemento.get(c) for c in ESQUEMA[coleccion]])
+                else:
+                    self.conexion.execute(
+                        'INSERT INTO documentos (coleccion, datos) VALUES (?, ?)',
+                        (coleccion, json.dumps(elemento, ensure_ascii=False)))
+                eventos.append(_evento('insertado', coleccion, elemento))
+            return True
+        except sqlite3.Error:
+            if en_transaccion:
+                raise
+            logger.exception("Error al guardar %s", self.archivo)
+            return False
+    
+    def obtener_todos(self, coleccion: str) -> List[Dict]:
+        """Obtiene todos los elementos de una colección"""
+        if coleccion not in ESQUEMA:
+            filas = self._filas(
+                'SELECT datos FROM documentos WHERE coleccion = ? ORDER BY rowid',
+                (coleccion,))
+            return [json.loads(fila[0]) for fila in filas]
+        return [self._a_dict(fila) for fila in self._filas(self._sentencia('todos', coleccion))]
+    
+    def iterar(self, coleccion: str, tramo: int = 1000) -> Iterator[Dict]:
+        """Recorre una colección sin materializarla
+        
+        Lee ``tramo`` filas cada vez por orden de rowid, así el cerrojo no
+        queda tomado mientras quien itera procesa cada elemento.
+        """
+        if coleccion not in ESQUEMA:
+            yield from self.obtener_todos(coleccion)
+            return
+        sql = self._sentencia('tramo', coleccion)
+        ultimo = 0
+        while True:
+            filas = self._filas(sql, (ultimo, tramo))
+            for fila in filas:
+                elemento = self._a_dict(fila)
+                ultimo = elemento.pop('rowid')
+                yield elemento
+            if len(filas) < tramo:
+                return
+    
+    def listar(self, coleccion: str, offset: int = 0, limite: Optional[int] = None,
+               filtro: Optional[Dict[str, Any]] = None,
+               orden: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """Obtiene una página de una colección y el total de elementos
+        
+        Mismo comportamiento que ``Database.listar``: el filtrado, el orden
+        y la paginación los resuelve SQLite con sus índices.
+        """
+        filtro = filtro or {}
+        if coleccion not in ESQUEMA:
+            elementos = [e for e in self.obtener_todos(coleccion)
+                         if all(e.get(c) == v for c, v in filtro.items())]
+            fin = None if limite is None else offset + limite
+            return elementos[offset:fin], len(elementos)
+        
+        campo_orden = orden.lstrip('-') if orden else None
+        self._validar_campos(coleccion, [*filtro, *([campo_orden] if campo_orden else [])])
+        
+        # NULL se escribe literal para que SQLite pueda usar los índices
+        # parciales de préstamos activos
+        condiciones, parametros = [], []
+        for campo, valor in filtro.items():
+            if valor is None:
+                condiciones.append(f'{campo} IS NULL')
+            else:
+                condiciones.append(f'{campo} = ?')
+                parametros.append(valor)
+        donde = f" WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        
+        total = self._filas(f'SELECT COUNT(*) FROM {coleccion}{donde}', parametros)[0][0]
+        
+        sql = f"SELECT {', '.join(ESQUEMA[coleccion])} FROM {coleccion}{donde} ORDER BY "
+        if campo_orden:
+            # Los valores ausentes se agrupan al final en orden ascendente
+            direccion = 'DESC' if orden.startswith('-') else 'ASC'
+            sql += f'{campo_orden} IS NULL {direccion}, {campo_orden} {direccion}, '
+        sql += 'rowid LIMIT ? OFFSET ?'
+        filas = self._filas(sql, [*parametros, -1 if limite is None else limite, offset])
+        return [self._a_dict(fila) for fila in filas], total
+    
+    def buscar(self, coleccion: str, campo: str, valor: Any) -> List[Dict]:
+        """Busca elementos por un campo específico"""
+        if coleccion not in ESQUEMA:
+            return [e for e in self.obtener_todos(coleccion) if e.get(campo) == valor]
+        if campo not in ESQUEMA[coleccion]:
+            return []
+        filas = self._filas(self._sentencia('buscar', coleccion, campo), (valor,))
+        return [self._a_dict(fila) for fila in filas]
+    
+    def actualizar(self, coleccion: str, campo: str, valor: Any,
+                   datos_nuevos: Dict[str, Any]) -> bool:
+        """Actualiza un elemento en la colección; ver ``agregar`` para los errores"""
+        if coleccion not in ESQUEMA:
+            return self._actualizar_documento(coleccion, campo, valor, datos_nuevos)
+        self._validar_campos(coleccion, [campo, *datos_nuevos])
+        campos = list(datos_nuevos)
+        en_transaccion = False
+        try:
+            with self._escritura(coleccion) as eventos:
+                en_transaccion = self._transacciones > 0
+                fila = self.conexion.execute(
+                    self._sentencia('actualizar', coleccion, campo, *campos),
+                    [*(datos_nuevos[c] for c in campos), valor]).fetchone()
+                if fila is not None:
+                    eventos.append(_evento('actualizado', coleccion, self._a_dict(fila)))
+            return fila is not None
+        except sqlite3.Error:
+            if en_transaccion:
+                raise
+            logger.exception("Error al guardar %s", self.archivo)
+            return False
+    
+    def _actualizar_documento(self, coleccion: str, campo: str, valor: Any,
+                              datos_nuevos: Dict[str, Any]) -> bool:
+        """Actualiza el primer documento de una colección sin tabla propia"""
+        filas = self._filas(
+            'SELECT rowid, datos FROM documentos WHERE coleccion = ? ORDER BY rowid',
+            (coleccion,))
+        for rowid, datos in filas:
+            elemento = json.loads(datos)
+            if elemento.get(campo) == valor:
+                elemento.update(datos_nuevos)
+                with self._escritura(coleccion) as eventos:
+                    self.conexion.execute(
+                        'UPDATE documentos SET datos = ? WHERE rowid = ?',
+                        (json.dumps(elemento, ensure_ascii=False), rowid))
+                    eventos.append(_evento('actualizado', coleccion, elemento))
+                return True
+        return False
+    
+    def version(self, coleccion: str) -> tuple:
+        """Identifica el estado de una colección; cambia con cada modificación
+        
+        ``data_version`` cambia cuando otra conexión confirma cambios.
+        """
+        data_version = self._filas('PRAGMA data_version')[0][0]
+        return (data_version, self.versiones.get(coleccion, 0))
+    
+    def prestamo_activo(self, isbn: str) -> Optional[Dict]:
+        """Obtiene el préstamo activo de un libro, si lo hay"""
+        filas = self._filas(
+            f"SELECT {', '.join(ESQUEMA['prestamos'])} FROM prestamos "
+            "WHERE isbn_libro = ? AND fecha_devolucion IS NULL "
+            "ORDER BY rowid LIMIT 1", (isbn,))
+        return self._a_dict(filas[0]) if filas else None
+    
+    def prestamos_activos(self, id_usuario: Optional[str] = None) -> List[Dict]:
+        """Obtiene los préstamos activos, opcionalmente de un usuario"""
+        sql = (f"SELECT {', '.join(ESQUEMA['prestamos'])} FROM prestamos "
+               "WHERE fecha_devolucion IS NULL")
+        if id_usuario is not None:
+            filas = self._filas(sql + " AND id_usuario = ? ORDER BY rowid", (id_usuario,))
+        else:
+            filas = self._filas(sql + " ORDER BY rowid")
+        return [self._a_dict(fila) for fila in filas]
+    
+    def prestamos_por_vencer(self, hasta: str, desde: Optional[str] = None) -> List[Dict]:
+        """Préstamos activos que vencen antes de ``hasta``; ver ``Database``"""
+        sql = (f"SELECT {', '.join(ESQUEMA['prestamos'])} FROM prestamos "
+               "WHERE fecha_devolucion IS NULL AND fecha_vencimiento < ?")
+        parametros = [hasta]
+        if desde is not None:
+            sql += " AND fecha_vencimiento >= ?"
+            parametros.append(desde)
+        filas = self._filas(sql + " ORDER BY fecha_vencimiento, id_prestamo", parametros)
+        return [self._a_dict(fila) for fila in filas]
+    
+    def siguiente_reserva(self, isbn: str) -> Optional[Dict]:
+        """Reserva pendiente más antigua de un libro, si la hay"""
+        filas = self._filas(
+            f"SELECT {', '.join(ESQUEMA['reservas'])} FROM reservas "
+            "WHERE isbn_libro = ? AND estado = 'pendiente' "
+            "ORDER BY rowid LIMIT 1", (isbn,))
+        return self._a_dict(filas[0]) if filas else None
+    
+    def reservas_de_usuario(self, id_usuario: str) -> List[Dict]:
+        """Reservas pendientes de un usuario"""
+        filas = self._filas(
+            f"SELECT {', '.join(ESQUEMA['reservas'])} FROM reservas "
+            "WHERE id_usuario = ? AND estado = 'pendiente' ORDER BY rowid", (id_usuario,))
+        return [self._a_dict(fila) for fila in filas]
+    
+    def posicion_reserva(self, isbn: str, id_usuario: str) -> Optional[int]:
+        """Puesto (desde 1) de la reserva pendiente de un usuario en la cola de un libro"""
+        filas = self._filas(
+            "SELECT COUNT(*) FROM reservas WHERE isbn_libro = ? AND estado = 'pendiente' "
+            "AND rowid <= (SELECT rowid FROM reservas WHERE isbn_libro = ? "
+            "AND id_usuario = ? AND estado = 'pendiente' ORDER BY rowid LIMIT 1)",
+            (isbn, isbn, id_usuario))
+        return filas[0][0] or None
+    
+    def migrar_desde_json(self, archivo_json: str) -> Dict[str, int]:
+        """Importa en una sola transacción el contenido de un biblioteca.json
+        
+        Acepta cualquiera de los formatos de ``formatos``, que se detecta
+        como al abrirlo con ``Database``. Devuelve cuántos elementos se
+        importaron por colección.
+        """
+        datos = formatos.leer(archivo_json, formatos.detectar_formato(archivo_json))
+        
+        totales = {}
+        with self.conexion:
+            for coleccion, elementos in datos.items():
+                if not isinstance(elementos, list):
+                    continue
+                if coleccion in ESQUEMA:
+                    columnas = ESQUEMA[coleccion]
+                    self.conexion.executemany(
+                        self._sentencia('insertar', coleccion),
+                        ([e.get(c) for c in columnas] for e in elementos))
+                else:
+                    self.conexion.executemany(
+                        'INSERT INTO documentos (coleccion, datos) VALUES (?, ?)',
+                        ((coleccion, json.dumps(e, ensure_ascii=False))
+                         for e in elementos))
+                totales[coleccion] = len(elementos)
+        return totales
+    
+    def cerrar(self):
+        """Cierra la conexión con la base de datos"""
+        self.conexion.close()
+
+def main():
+    """Migra un archivo JSON existente a una base SQLite"""
+    origen = sys.argv[1] if len(sys.argv) > 1 else 'biblioteca.json'
+    destino = sys.argv[2] if len(sys.argv) > 2 else 'biblioteca.db'
+    
+    db = SQLiteDatabase(destino)
+    totales = db.migrar_desde_json(origen)
+    db.cerrar()
+    
+    for coleccion, total in totales.items():
+        print(f"{coleccion}: {total} elementos migrados")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Módulo de ejecución de tareas en segundo plano
+
+La interfaz no puede bloquearse mientras se guarda el archivo de datos,
+así que las llamadas a ``GestorBiblioteca`` se ejecutan en un hilo de
+trabajo y sus resultados vuelven al hilo principal, que los recoge
+llamando periódicamente a ``Ejecutor.procesar`` (en Tkinter, con
+``root.after``).
+"""
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Tarea:
+    """Llamada pendiente y a quién avisar cuando termine"""
+    funcion: Callable
+    args: Tuple
+    al_terminar: Optional[Callable[[Any], Any]]
+    al_fallar: Optional[Callable[[Exception], Any]]
+    clave: Any
+
+class Ejecutor:
+    """Ejecuta funciones de una en una en un único hilo de trabajo
+    
+    Un solo hilo mantiene el orden de las escrituras y evita que dos
+    operaciones usen la base de datos a la vez.
+    """
+    
+    def __init__(self):
+        self._tareas: queue.Queue = queue.Queue()
+        self._resultados: queue.Queue = queue.Queue()
+        # Tareas con clave que aún no empezaron, para agruparlas
+        self._en_cola: Dict[Any, _Tarea] = {}
+        self._cerrojo = threading.Lock()
+        self._sin_terminar = 0
+        self._hilo = threading.Thread(target=self._trabajar, name='ejecutor', daemon=True)
+        self._hilo.start()
+    
+    @property
+    def ocupado(self) -> bool:
+        """Indica si hay tareas cuyo resultado aún no se procesó"""
+        return self._sin_terminar > 0
+    
+    def enviar(self, funcion: Callable, *args,
+               al_terminar: Optional[Callable[[Any], Any]] = None,
+               al_fallar: Optional[Callable[[Exception], Any]] = None,
+               clave: Any = None) -> bool:
+        """Encola ``funcion(*args)`` para ejecutarla en el hilo de trabajo
+        
+        ``al_terminar`` recibe el resultado y ``al_fallar`` la excepción,
+        ambos en el hilo que llama a ``procesar``. Si ya hay en cola una
+        tarea con la misma ``clave`` que no ha empezado, no se encola otra:
+        la existente pasa a usar los argumentos y avisos de la nueva.
+        Devuelve False en ese caso.
+        """
+        with self._cerrojo:
+            tarea = self._en_cola.get(clave) if clave is not None else None
+            if tarea is not None:
+                tarea.funcion, tarea.args = funcion, args
+                tarea.al_terminar, tarea.al_fallar = al_terminar, al_fallar
+                return False
+            tarea = _Tarea(funcion, args, al_terminar, al_fallar, clave)
+            if clave is not None:
+                self._en_cola[clave] = tarea
+            self._sin_terminar += 1
+        self._tareas.put(tarea)
+        return True
+    
+    def en_hilo_principal(self, funcion: Callable, *args):
+        """Pide que ``funcion(*args)`` se ejecute en el próximo ``procesar``"""
+        self._resultados.put((funcion, args, False))
+    
+    def procesar(self) -> int:
+        """Ejecuta los avisos pendientes; devuelve cuántos se atendieron
+        
+        Si un aviso lanza una excepción se registra y se sigue con el resto.
+        """
+        atendidos = 0
+        while True:
+            try:
+                funcion, args, de_tarea = self._resultados.get_nowait()
+            except queue.Empty:
+                return atendidos
+            if de_tarea:
+                with self._cerrojo:
+                    self._sin_terminar -= 1
+            atendidos += 1
+            if funcion is not None:
+                try:
+                    funcion(*args)
+                except Exception:
+                    logger.exception("Error al procesar el aviso %r", funcion)
+    
+    def _trabajar(self):
+        """Bucle del hilo de trabajo"""
+        while True:
+            tarea = self._tareas.get()
+            if tarea is None:
+                return
+            with self._cerrojo:
+                # A partir de aquí una nueva petición con la misma clave
+                # debe volver a ejecutarse
+                if tarea.clave is not None:
+                    self._en_cola.pop(tarea.clave, None)
+            try:
+                resultado = tarea.funcion(*tarea.args)
+            except Exception as e:
+                aviso = tarea.al_fallar or _informar_error
+                self._resultados.put((aviso, (e,), True))
+            else:
+                self._resultados.put((tarea.al_terminar, (resultado,), True))
+    
+    def cerrar(self):
+        """Espera a que terminen las tareas encoladas y detiene el hilo"""
+        self._tareas.put(None)
+        self._hilo.join()
+
+def _informar_error(error: Exception):
+    """Aviso por defecto para tareas que fallan sin ``al_fallar``"""
+    logger.error("Error en segundo plano: %s", error, exc_info=error)
@@ -0,0 +1,146 @@
+"""Módulo de formatos de serialización del archivo de datos
+
+Formatos disponibles:
+
+- ``json``: JSON compacto, sin sangría (por defecto).
+- ``json-legible``: JSON con sangría, cómodo para revisarlo a mano.
+- ``jsonl``: JSON-lines; cada colección es una línea de cabecera
+  seguida de una línea por elemento.
+- ``gzip``: JSON compacto comprimido con gzip.
+- ``msgpack``: instantánea binaria MessagePack (requiere el paquete
+  ``msgpack``).
+
+Al leer, el formato se detecta por los primeros bytes del archivo.
+"""
+import gzip
+import io
+import json
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, Tuple
+
+from lector_json import iterar_coleccion as iterar_coleccion_json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATOS = ('json', 'json-legible', 'jsonl', 'gzip', 'msgpack')
+
+_CABECERA_JSONL = b'{"coleccion":'
+
+# Errores con los que la lectura delata un archivo truncado o corrupto;
+# los gzip dañados lanzan BadGzipFile (un OSError) o zlib.error
+ERRORES_ARCHIVO_CORRUPTO = (ValueError, EOFError, gzip.BadGzipFile, zlib.error)
+
+def detectar_formato(ruta: str) -> str:
+    """Deduce el formato de un archivo por sus primeros bytes"""
+    with open(ruta, 'rb') as f:
+        inicio = f.read(32)
+    if inicio.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if inicio and (0x80 <= inicio[0] <= 0x8f or inicio[0] in (0xde, 0xdf)):
+        return 'msgpack'
+    if inicio.lstrip().startswith(_CABECERA_JSONL):
+        return 'jsonl'
+    return 'json'
+
+def _requerir_msgpack():
+    """Comprueba que el paquete opcional msgpack esté instalado"""
+    if msgpack is None:
+        raise ImportError("El formato msgpack requiere instalar el paquete 'msgpack'")
+
+def _linea(valor: Any) -> str:
+    """Serializa un valor como una línea de JSON compacto"""
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def escribir(f: BinaryIO, datos: Dict[str, Any], formato: str):
+    """Serializa los datos en un archivo binario abierto"""
+    if formato == 'msgpack':
+        _requerir_msgpack()
+        f.write(msgpack.packb(datos, use_bin_type=True))
+        return
+    
+    comprimido = None
+    if formato == 'gzip':
+        comprimido = f = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0)
+    texto = io.TextIOWrapper(f, encoding='utf-8')
+    if formato == 'jsonl':
+        for coleccion, valor in datos.items():
+            if isinstance(valor, list):
+                texto.write(_linea({'coleccion': coleccion, 'total': len(valor)}))
+                for elemento in valor:
+                    texto.write(_linea(elemento))
+            else:
+                texto.write(_linea({'coleccion': coleccion, 'valor': valor}))
+    elif formato == 'json-legible':
+        json.dump(datos, texto, indent=2, ensure_ascii=False)
+    else:
+        # dumps usa el codificador en C de una sola pasada, bastante más
+        # rápido que dump, que escribe por fragmentos
+        texto.write(json.dumps(datos, ensure_ascii=False, separators=(',', ':')))
+    texto.flush()
+    # Soltar el envoltorio sin cerrar el archivo, que cierra quien lo abrió
+    texto.detach()
+    if comprimido is not None:
+        comprimido.close()
+
+def _abrir_texto(ruta: str, formato: str):
+    """Abre un archivo de texto JSON, descomprimiéndolo si hace falta"""
+    if formato == 'gzip':
+        return gzip.open(ruta, 'rt', encoding='utf-8')
+    return open(ruta, 'r', encoding='utf-8')
+
+def _elementos_jsonl(archivo, total: int) -> Iterator[Any]:
+    """Lee las ``total`` líneas de elementos que siguen a una cabecera"""
+    for _ in range(total):
+        linea = archivo.readline()
+        if not linea:
+            raise ValueError('archivo jsonl truncado')
+        yield json.loads(linea)
+
+def _iterar_jsonl(archivo) -> Iterator[Tuple[str, bool, Any]]:
+    """Recorre un archivo JSON-lines devolviendo (colección, es_lista, valor)
+    
+    Para las colecciones el valor es un generador de sus elementos, que
+    hay que consumir antes de pasar a la siguiente.
+    """
+    for linea in archivo:
+        cabecera = json.loads(linea)
+        if 'total' in cabecera:
+            yield cabecera['coleccion'], True, _elementos_jsonl(archivo, cabecera['total'])
+        else:
+            yield cabecera['coleccion'], False, cabecera.get('valor')
+
+def leer(ruta: str, formato: str) -> Dict[str, Any]:
+    """Carga el archivo completo en el formato indicado"""
+    if formato == 'msgpack':
+        _requerir_msgpack()
+        with open(ruta, 'rb') as f:
+            return msgpack.unpackb(f.read(), raw=False)
+    with _abrir_texto(ruta, formato) as f:
+        if formato == 'jsonl':
+            return {coleccion: list(valor) if es_lista else valor
+                    for coleccion, es_lista, valor in _iterar_jsonl(f)}
+        return json.load(f)
+
+def iterar_coleccion(ruta: str, coleccion: str, formato: str) -> Iterator[Dict[str, Any]]:
+    """Recorre los elementos de una colección sin cargar el archivo completo
+    
+    El formato msgpack no admite lectura incremental y se carga entero.
+    """
+    if formato == 'msgpack':
+        yield from leer(ruta, formato).get(coleccion, [])
+        return
+    with _abrir_texto(ruta, formato) as f:
+        if formato != 'jsonl':
+            yield from iterar_coleccion_json(f, coleccion)
+            return
+        for nombre, es_lista, valor in _iterar_jsonl(f):
+            if not es_lista:
+                continue
+            if nombre == coleccion:
+                yield from valor
+                return
+            for _ in valor:
+                pass
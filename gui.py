@@ -1,24 +1,220 @@
 """Interfaz gráfica de usuario con Tkinter"""
 import tkinter as tk
 from tkinter import ttk, messagebox
-from biblioteca import GestorBiblioteca
-from database import Database
+from typing import Any, Callable, Dict, List, Tuple
+from biblioteca import GestorBiblioteca, Pagina
+from database import Database, Evento
+from ejecutor import Ejecutor
+from models import Libro, Usuario, Prestamo
+
+class ListaVirtual(ttk.Frame):
+    """Treeview que solo crea las filas visibles
+    
+    Las filas se piden por páginas a ``obtener(offset, limite)`` según la
+    posición de la barra de desplazamiento, así que refrescar cuesta lo
+    mismo con cien elementos que con un millón. ``insertar``,
+    ``actualizar`` y ``eliminar`` aplican un único cambio sin refrescar,
+    localizando la fila por ``clave(elemento)``.
+    
+    Las páginas se piden en el hilo del ``Ejecutor``; los refrescos que se
+    acumulan mientras tanto se agrupan en uno solo.
+    """
+    
+    ALTO_FILA = 20
+    
+    def __init__(self, parent, columnas: List[Tuple[str, str]],
+                 obtener: Callable[[int, int], Pagina],
+                 a_fila: Callable[[Any], tuple],
+                 clave: Callable[[Any], str], ejecutor: Ejecutor):
+        super().__init__(parent)
+        self.obtener = obtener
+        self.ejecutor = ejecutor
+        self.a_fila = a_fila
+        self.clave = clave
+        # Clave de cada fila visible -> elemento del Treeview
+        self.filas: Dict[str, str] = {}
+        self.inicio = 0
+        self.total = 0
+        self.visibles = 10
+        
+        self.tree = ttk.Treeview(self, columns=[c for c, _ in columnas],
+                                 show='headings', height=self.visibles)
+        for columna, titulo in columnas:
+            self.tree.heading(columna, text=titulo)
+        self.barra = ttk.Scrollbar(self, orient='vertical', command=self.desplazar)
+        self.barra.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+        
+        alto = ttk.Style().lookup('Treeview', 'rowheight')
+        self.alto_fila = int(alto) if alto else self.ALTO_FILA
+        
+        self.tree.bind('<Configure>', self._al_redimensionar)
+        self.tree.bind('<MouseWheel>', self._al_girar_rueda)
+        self.tree.bind('<Button-4>', lambda e: self.desplazar('scroll', -3, 'units'))
+        self.tree.bind('<Button-5>', lambda e: self.desplazar('scroll', 3, 'units'))
+        self.tree.bind('<Prior>', lambda e: self.desplazar('scroll', -1, 'pages'))
+        self.tree.bind('<Next>', lambda e: self.desplazar('scroll', 1, 'pages'))
+    
+    def refrescar(self):
+        """Vuelve a pedir la ventana visible de filas"""
+        self.ejecutor.enviar(self._consultar, al_terminar=self._mostrar,
+                             clave=('refrescar', id(self)))
+    
+    def _consultar(self) -> Tuple[int, Pagina]:
+        """Obtiene la página visible; se ejecuta en el hilo de trabajo"""
+        inicio, visibles = self.inicio, self.visibles
+        pagina = self.obtener(inicio, visibles)
+        # Si la colección encogió, retroceder para no quedar en blanco
+        maximo = max(0, pagina.total - visibles)
+        if inicio > maximo:
+            inicio = maximo
+            pagina = self.obtener(inicio, visibles)
+        return inicio, pagina
+    
+    def _mostrar(self, resultado: Tuple[int, Pagina]):
+        """Vuelca en el Treeview la página obtenida"""
+        self.inicio, pagina = resultado
+        self.total = pagina.total
+        
+        # Reutilizar los elementos existentes en lugar de borrarlos todos
+        items = self.tree.get_children()
+        self.filas = {}
+        for i, elemento in enumerate(pagina.elementos):
+            if i < len(items):
+                item = items[i]
+                self.tree.item(item, values=self.a_fila(elemento))
+            else:
+                item = self.tree.insert('', 'end', values=self.a_fila(elemento))
+            self.filas[self.clave(elemento)] = item
+        if len(items) > len(pagina.elementos):
+            self.tree.delete(*items[len(pagina.elementos):])
+        self._actualizar_barra()
+    
+    def insertar(self, elemento):
+        """Añade un elemento nuevo, que los listados colocan al final"""
+        self.total += 1
+        visibles = len(self.filas)
+        if visibles < self.visibles and self.inicio + visibles == self.total - 1:
+            item = self.tree.insert('', 'end', values=self.a_fila(elemento))
+            self.filas[self.clave(elemento)] = item
+        self._actualizar_barra()
+    
+    def actualizar(self, elemento):
+        """Redibuja la fila de un elemento si está a la vista"""
+        item = self.filas.get(self.clave(elemento))
+        if item is not None:
+            self.tree.item(item, values=self.a_fila(elemento))
+    
+    def eliminar(self, clave: str):
+        """Quita un elemento que ya no pertenece al listado"""
+        item = self.filas.pop(clave, None)
+        if item is not None:
+            self.tree.delete(item)
+        self.total = max(0, self.total - 1)
+        self._actualizar_barra()
+        # Pedir la página para ocupar el hueco o, si estaba fuera de la
+        # vista, porque las filas visibles se han corrido
+        self.refrescar()
+    
+    def _actualizar_barra(self):
+        """Ajusta la barra de desplazamiento a la ventana visible"""
+        if self.total:
+            self.barra.set(self.inicio / self.total,
+                           min(1.0, (self.inicio + self.visibles) / self.total))
+        else:
+            self.barra.set(0.0, 1.0)
+    
+    def desplazar(self, accion: str, cantidad, unidad: str = 'units'):
+        """Atiende los comandos de la barra de desplazamiento"""
+        if accion == 'moveto':
+            inicio = int(float(cantidad) * self.total)
+        else:
+            paso = self.visibles if unidad == 'pages' else 1
+            inicio = self.inicio + int(cantidad) * paso
+        inicio = max(0, min(inicio, self.total - self.visibles))
+        if inicio != self.inicio:
+            self.inicio = inicio
+            self.refrescar()
+    
+    def _al_redimensionar(self, event):
+        """Ajusta el número de filas pedidas al alto del widget"""
+        # Se descuenta una fila para el encabezado
+        visibles = max(1, event.height // self.alto_fila - 1)
+        if visibles != self.visibles:
+            self.visibles = visibles
+            self.refrescar()
+    
+    def _al_girar_rueda(self, event):
+        """Desplaza con la rueda del ratón en Windows y macOS"""
+        self.desplazar('scroll', -3 if event.delta > 0 else 3, 'units')
 
 class BibliotecaGUI:
     """Interfaz gráfica para el sistema de biblioteca"""
     
+    # Milisegundos entre revisiones de los resultados del hilo de trabajo
+    INTERVALO_SONDEO = 50
+    # Resultados de búsqueda que se muestran como máximo
+    MAX_RESULTADOS = 500
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Sistema de Gestión de Biblioteca")
         self.root.geometry("800x600")
         
-        self.db = Database()
+        # La carga perezosa permite mostrar la ventana sin leer el historial
+        self.db = Database(perezoso=True)
         self.gestor = GestorBiblioteca(self.db)
+        # Las operaciones sobre los datos se ejecutan fuera del hilo de Tk
+        self.ejecutor = Ejecutor()
         
         self.crear_widgets()
+        # Cada cambio confirmado actualiza solo su fila
+        self.gestor.suscribir(self.al_cambiar_datos)
+        self.root.protocol('WM_DELETE_WINDOW', self.cerrar)
+        self.sondear_ejecutor()
+    
+    def sondear_ejecutor(self):
+        """Recoge los resultados del hilo de trabajo y muestra si está ocupado"""
+        try:
+            self.ejecutor.procesar()
+            if self.ejecutor.ocupado:
+                self.estado.set("Trabajando...")
+                self.root.config(cursor='watch')
+            else:
+                self.estado.set("Listo")
+                self.root.config(cursor='')
+        finally:
+            # Un error aquí no debe detener el sondeo para siempre
+            self.root.after(self.INTERVALO_SONDEO, self.sondear_ejecutor)
+    
+    def en_segundo_plano(self, funcion: Callable, *args, exito: str,
+                         campos: List[ttk.Entry]):
+        """Ejecuta una operación del gestor en el hilo de trabajo
+        
+        Al terminar muestra ``exito`` y vacía ``campos``; si falla, muestra
+        el error.
+        """
+        def al_terminar(_):
+            messagebox.showinfo("Éxito", exito)
+            for campo in campos:
+                campo.delete(0, tk.END)
+        
+        self.ejecutor.enviar(funcion, *args, al_terminar=al_terminar,
+                             al_fallar=lambda e: messagebox.showerror("Error", str(e)))
+    
+    def cerrar(self):
+        """Espera a que terminen las escrituras pendientes y cierra la ventana"""
+        self.ejecutor.cerrar()
+        self.db.cerrar()
+        self.root.destroy()
     
     def crear_widgets(self):
         """Crea todos los widgets de la interfaz"""
+        # Barra de estado; se coloca antes que el notebook para reservarle sitio
+        self.estado = tk.StringVar(value="Listo")
+        ttk.Label(self.root, textvariable=self.estado, anchor='w').pack(
+            fill='x', side='bottom', padx=10)
+        
         # Notebook para pestañas
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -35,6 +231,50 @@ class BibliotecaGUI:
         self.crear_tab_libros()
         self.crear_tab_usuarios()
         self.crear_tab_prestamos()
+        
+        # Las listas de las pestañas ocultas se llenan al mostrarlas
+        self.pestanas_cargadas = {str(self.tab_libros)}
+        self.notebook.bind('<<NotebookTabChanged>>', self.al_cambiar_pestana)
+    
+    def al_cambiar_pestana(self, event=None):
+        """Llena la lista de una pestaña la primera vez que se muestra"""
+        pestana = self.notebook.select()
+        if pestana in self.pestanas_cargadas:
+            return
+        self.pestanas_cargadas.add(pestana)
+        if pestana == str(self.tab_usuarios):
+            self.actualizar_lista_usuarios()
+        elif pestana == str(self.tab_prestamos):
+            self.actualizar_lista_prestamos()
+    
+    def al_cambiar_datos(self, evento: Evento):
+        """Recibe un cambio desde el hilo de trabajo y lo pasa al de Tk"""
+        self.ejecutor.en_hilo_principal(self.aplicar_evento, evento)
+    
+    def aplicar_evento(self, evento: Evento):
+        """Aplica a las listas un cambio confirmado en la base de datos"""
+        if evento.coleccion == 'libros':
+            if self.consulta_libros:
+                # El cambio puede hacer que el libro entre o salga de los resultados
+                self.lista_libros.refrescar()
+                return
+            lista, elemento = self.lista_libros, Libro.from_dict(evento.elemento)
+        elif evento.coleccion == 'usuarios':
+            lista, elemento = self.lista_usuarios, Usuario.from_dict(evento.elemento)
+        elif evento.coleccion == 'prestamos':
+            lista, elemento = self.lista_prestamos, Prestamo.from_dict(evento.elemento)
+            # Un préstamo devuelto deja de estar en la lista de activos
+            if elemento.fecha_devolucion is not None:
+                if evento.tipo == 'actualizado':
+                    lista.eliminar(elemento.id_prestamo)
+                return
+        else:
+            return
+        
+        if evento.tipo == 'insertado':
+            lista.insertar(elemento)
+        else:
+            lista.actualizar(elemento)
     
     def crear_tab_libros(self):
         """Crea la pestaña de gestión de libros"""
@@ -61,22 +301,56 @@ class BibliotecaGUI:
         frame_lista = ttk.LabelFrame(self.tab_libros, text="Libros Registrados", padding=10)
         frame_lista.pack(fill='both', expand=True, padx=10, pady=10)
         
-        self.tree_libros = ttk.Treeview(
-            frame_lista, 
-            columns=('ISBN', 'Título', 'Autor', 'Disponible'),
-            show='headings'
+        # Búsqueda por título o autor mientras se escribe
+        frame_busqueda = ttk.Frame(frame_lista)
+        frame_busqueda.pack(fill='x', pady=(0, 5))
+        ttk.Label(frame_busqueda, text="Buscar:").pack(side='left')
+        self.entry_busqueda = ttk.Entry(frame_busqueda, width=40)
+        self.entry_busqueda.pack(side='left', padx=5)
+        self.entry_busqueda.bind('<KeyRelease>', self.buscar_libros)
+        ttk.Button(frame_busqueda, text="Limpiar",
+                   command=self.limpiar_busqueda).pack(side='left')
+        self.consulta_libros = ''
+        
+        self.lista_libros = ListaVirtual(
+            frame_lista,
+            columnas=[('ISBN', 'ISBN'), ('Título', 'Título'), ('Autor', 'Autor'),
+                      ('Disponible', 'Disponible')],
+            obtener=self.obtener_pagina_libros,
+            ejecutor=self.ejecutor,
+            a_fila=lambda libro: (libro.isbn, libro.titulo, libro.autor,
+                                  'Sí' if libro.disponible else 'No'),
+            clave=lambda libro: libro.isbn
         )
-        self.tree_libros.heading('ISBN', text='ISBN')
-        self.tree_libros.heading('Título', text='Título')
-        self.tree_libros.heading('Autor', text='Autor')
-        self.tree_libros.heading('Disponible', text='Disponible')
-        self.tree_libros.pack(fill='both', expand=True)
+        self.lista_libros.pack(fill='both', expand=True)
         
         ttk.Button(frame_lista, text="Actualizar Lista", 
                    command=self.actualizar_lista_libros).pack(pady=5)
         
         self.actualizar_lista_libros()
     
+    def obtener_pagina_libros(self, offset: int, limite: int) -> Pagina:
+        """Página del catálogo o, si hay una búsqueda, de sus resultados"""
+        consulta = self.consulta_libros
+        if not consulta:
+            return self.gestor.listar_libros(offset, limite)
+        resultados = self.gestor.buscar_libros(consulta, limite=self.MAX_RESULTADOS)
+        return Pagina(resultados[offset:offset + limite], len(resultados))
+    
+    def buscar_libros(self, event=None):
+        """Muestra los libros que coinciden con el texto de búsqueda"""
+        consulta = self.entry_busqueda.get().strip()
+        if consulta == self.consulta_libros:
+            return
+        self.consulta_libros = consulta
+        self.lista_libros.inicio = 0
+        self.lista_libros.refrescar()
+    
+    def limpiar_busqueda(self):
+        """Vuelve a mostrar el catálogo completo"""
+        self.entry_busqueda.delete(0, tk.END)
+        self.buscar_libros()
+    
     def crear_tab_usuarios(self):
         """Crea la pestaña de gestión de usuarios"""
         frame_form = ttk.LabelFrame(self.tab_usuarios, text="Registrar Usuario", padding=10)
@@ -101,21 +375,20 @@ class BibliotecaGUI:
         frame_lista = ttk.LabelFrame(self.tab_usuarios, text="Usuarios Registrados", padding=10)
         frame_lista.pack(fill='both', expand=True, padx=10, pady=10)
         
-        self.tree_usuarios = ttk.Treeview(
+        self.lista_usuarios = ListaVirtual(
             frame_lista,
-            columns=('ID', 'Nombre', 'Email', 'Activo'),
-            show='headings'
+            columnas=[('ID', 'ID'), ('Nombre', 'Nombre'), ('Email', 'Email'),
+                      ('Activo', 'Activo')],
+            obtener=self.gestor.listar_usuarios,
+            ejecutor=self.ejecutor,
+            a_fila=lambda usuario: (usuario.id_usuario, usuario.nombre, usuario.email,
+                                    'Sí' if usuario.activo else 'No'),
+            clave=lambda usuario: usuario.id_usuario
         )
-        self.tree_usuarios.heading('ID', text='ID')
-        self.tree_usuarios.heading('Nombre', text='Nombre')
-        self.tree_usuarios.heading('Email', text='Email')
-        self.tree_usuarios.heading('Activo', text='Activo')
-        self.tree_usuarios.pack(fill='both', expand=True)
+        self.lista_usuarios.pack(fill='both', expand=True)
         
         ttk.Button(frame_lista, text="Actualizar Lista",
                    command=self.actualizar_lista_usuarios).pack(pady=5)
-        
-        self.actualizar_lista_usuarios()
     
     def crear_tab_prestamos(self):
         """Crea la pestaña de gestión de préstamos"""
@@ -148,126 +421,74 @@ class BibliotecaGUI:
         frame_lista = ttk.LabelFrame(self.tab_prestamos, text="Préstamos Activos", padding=10)
         frame_lista.pack(fill='both', expand=True, padx=10, pady=10)
         
-        self.tree_prestamos = ttk.Treeview(
+        self.lista_prestamos = ListaVirtual(
             frame_lista,
-            columns=('ID Préstamo', 'ISBN', 'ID Usuario', 'Fecha'),
-            show='headings'
+            columnas=[('ID Préstamo', 'ID Préstamo'), ('ISBN', 'ISBN'),
+                      ('ID Usuario', 'ID Usuario'), ('Fecha', 'Fecha Préstamo')],
+            obtener=self.gestor.listar_prestamos_activos,
+            ejecutor=self.ejecutor,
+            a_fila=lambda prestamo: (prestamo.id_prestamo, prestamo.isbn_libro,
+                                     prestamo.id_usuario,
+                                     prestamo.fecha_prestamo.split('T')[0]),
+            clave=lambda prestamo: prestamo.id_prestamo
         )
-        self.tree_prestamos.heading('ID Préstamo', text='ID Préstamo')
-        self.tree_prestamos.heading('ISBN', text='ISBN')
-        self.tree_prestamos.heading('ID Usuario', text='ID Usuario')
-        self.tree_prestamos.heading('Fecha', text='Fecha Préstamo')
-        self.tree_prestamos.pack(fill='both', expand=True)
+        self.lista_prestamos.pack(fill='both', expand=True)
         
         ttk.Button(frame_lista, text="Actualizar Lista",
                    command=self.actualizar_lista_prestamos).pack(pady=5)
-        
-        self.actualizar_lista_prestamos()
     
     def agregar_libro(self):
         """Agrega un libro al sistema"""
-        try:
-            isbn = self.entry_isbn.get().strip()
-            titulo = self.entry_titulo.get().strip()
-            autor = self.entry_autor.get().strip()
-            
-            self.gestor.agregar_libro(isbn, titulo, autor)
-            messagebox.showinfo("Éxito", "Libro agregado correctamente")
-            
-            self.entry_isbn.delete(0, tk.END)
-            self.entry_titulo.delete(0, tk.END)
-            self.entry_autor.delete(0, tk.END)
-            
-            self.actualizar_lista_libros()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        isbn = self.entry_isbn.get().strip()
+        titulo = self.entry_titulo.get().strip()
+        autor = self.entry_autor.get().strip()
+        
+        self.en_segundo_plano(
+            self.gestor.agregar_libro, isbn, titulo, autor,
+            exito="Libro agregado correctamente",
+            campos=[self.entry_isbn, self.entry_titulo, self.entry_autor])
     
     def registrar_usuario(self):
         """Registra un usuario en el sistema"""
-        try:
-            id_usuario = self.entry_id_usuario.get().strip()
-            nombre = self.entry_nombre.get().strip()
-            email = self.entry_email.get().strip()
-            
-            self.gestor.registrar_usuario(id_usuario, nombre, email)
-            messagebox.showinfo("Éxito", "Usuario registrado correctamente")
-            
-            self.entry_id_usuario.delete(0, tk.END)
-            self.entry_nombre.delete(0, tk.END)
-            self.entry_email.delete(0, tk.END)
-            
-            self.actualizar_lista_usuarios()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        id_usuario = self.entry_id_usuario.get().strip()
+        nombre = self.entry_nombre.get().strip()
+        email = self.entry_email.get().strip()
+        
+        self.en_segundo_plano(
+            self.gestor.registrar_usuario, id_usuario, nombre, email,
+            exito="Usuario registrado correctamente",
+            campos=[self.entry_id_usuario, self.entry_nombre, self.entry_email])
     
     def prestar_libro(self):
         """Registra un préstamo de libro"""
-        try:
-            isbn = self.entry_isbn_prestamo.get().strip()
-            id_usuario = self.entry_id_prestamo.get().strip()
-            
-            self.gestor.prestar_libro(isbn, id_usuario)
-            messagebox.showinfo("Éxito", "Préstamo registrado correctamente")
-            
-            self.entry_isbn_prestamo.delete(0, tk.END)
-            self.entry_id_prestamo.delete(0, tk.END)
-            
-            self.actualizar_lista_libros()
-            self.actualizar_lista_prestamos()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        isbn = self.entry_isbn_prestamo.get().strip()
+        id_usuario = self.entry_id_prestamo.get().strip()
+        
+        self.en_segundo_plano(
+            self.gestor.prestar_libro, isbn, id_usuario,
+            exito="Préstamo registrado correctamente",
+            campos=[self.entry_isbn_prestamo, self.entry_id_prestamo])
     
     def devolver_libro(self):
         """Registra la devolución de un libro"""
-        try:
-            isbn = self.entry_isbn_devolucion.get().strip()
-            
-            self.gestor.devolver_libro(isbn)
-            messagebox.showinfo("Éxito", "Devolución registrada correctamente")
-            
-            self.entry_isbn_devolucion.delete(0, tk.END)
-            
-            self.actualizar_lista_libros()
-            self.actualizar_lista_prestamos()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        isbn = self.entry_isbn_devolucion.get().strip()
+        
+        self.en_segundo_plano(
+            self.gestor.devolver_libro, isbn,
+            exito="Devolución registrada correctamente",
+            campos=[self.entry_isbn_devolucion])
     
     def actualizar_lista_libros(self):
         """Actualiza la lista de libros en la interfaz"""
-        for item in self.tree_libros.get_children():
-            self.tree_libros.delete(item)
-        
-        libros = self.gestor.obtener_libros()
-        for libro in libros:
-            self.tree_libros.insert('', 'end', values=(
-                libro.isbn, libro.titulo, libro.autor,
-                'Sí' if libro.disponible else 'No'
-            ))
+        self.lista_libros.refrescar()
     
     def actualizar_lista_usuarios(self):
         """Actualiza la lista de usuarios en la interfaz"""
-        for item in self.tree_usuarios.get_children():
-            self.tree_usuarios.delete(item)
-        
-        usuarios = self.gestor.obtener_usuarios()
-        for usuario in usuarios:
-            self.tree_usuarios.insert('', 'end', values=(
-                usuario.id_usuario, usuario.nombre, usuario.email,
-                'Sí' if usuario.activo else 'No'
-            ))
+        self.lista_usuarios.refrescar()
     
     def actualizar_lista_prestamos(self):
         """Actualiza la lista de préstamos en la interfaz"""
-        for item in self.tree_prestamos.get_children():
-            self.tree_prestamos.delete(item)
-        
-        prestamos = self.gestor.obtener_prestamos_activos()
-        for prestamo in prestamos:
-            fecha = prestamo.fecha_prestamo.split('T')[0]
-            self.tree_prestamos.insert('', 'end', values=(
-                prestamo.id_prestamo, prestamo.isbn_libro,
-                prestamo.id_usuario, fecha
-            ))
+        self.lista_prestamos.refrescar()
 
 def main():
     """Función principal para ejecutar la aplicación"""
@@ -0,0 +1,105 @@
+"""Módulo de generación de identificadores únicos
+
+Los identificadores siguen la idea de ULID: 128 bits con los milisegundos
+desde 1970 en los 48 más altos y un valor aleatorio en los 80 restantes,
+escritos con 26 caracteres del alfabeto base32 extendido (0-9, A-V) que
+``int(texto, 32)`` sabe leer. Como ese alfabeto está en orden ASCII,
+ordenar los identificadores como texto los ordena por fecha de creación.
+
+Dentro del mismo milisegundo cada identificador es el anterior más uno,
+así que un proceso nunca repite ni desordena los suyos; entre procesos
+los separa la parte aleatoria, que se elige de nuevo en cada milisegundo.
+"""
+import os
+import random
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+
+_ALFABETO = '0123456789ABCDEFGHIJKLMNOPQRSTUV'
+_BITS_ALEATORIOS = 80
+_MASCARA = (1 << _BITS_ALEATORIOS) - 1
+_LONGITUD = 26
+
+# Cada par de caracteres codifica 10 bits; con esta tabla la parte
+# aleatoria se escribe con ocho consultas en lugar de dieciséis divisiones
+_PARES = [a + b for a in _ALFABETO for b in _ALFABETO]
+
+def _codificar(valor: int, longitud: int) -> str:
+    """Escribe un entero en base32 extendido con ``longitud`` caracteres"""
+    caracteres = []
+    for _ in range(longitud):
+        valor, resto = divmod(valor, 32)
+        caracteres.append(_ALFABETO[resto])
+    return ''.join(reversed(caracteres))
+
+# Generadores vivos, para reiniciarlos en el proceso hijo tras un fork
+_generadores: 'weakref.WeakSet[GeneradorIds]' = weakref.WeakSet()
+
+class GeneradorIds:
+    """Genera identificadores crecientes y únicos, seguro entre hilos"""
+    
+    def __init__(self, prefijo: str = ''):
+        self.prefijo = prefijo
+        self._reiniciar()
+        _generadores.add(self)
+    
+    def _reiniciar(self):
+        """Olvida el último identificador y prepara un cerrojo nuevo
+        
+        Tras un fork el hijo heredaría el último valor del padre y ambos
+        seguirían la misma secuencia; con el estado limpio el hijo elige
+        otra parte aleatoria.
+        """
+        self._cerrojo = threading.Lock()
+        self._ultimo = 0
+        self._milisegundo = -1
+        # Los diez caracteres del tiempo solo cambian una vez por milisegundo
+        self._alto = -1
+        self._texto_alto = ''
+        self._aleatorio = random.SystemRandom()
+    
+    def nuevo(self) -> str:
+        """Devuelve un identificador mayor que todos los anteriores"""
+        milisegundo = time.time_ns() // 1_000_000
+        with self._cerrojo:
+            if milisegundo > self._milisegundo:
+                self._milisegundo = milisegundo
+                valor = (milisegundo << _BITS_ALEATORIOS
+                         | self._aleatorio.getrandbits(_BITS_ALEATORIOS))
+                # Nunca por debajo de lo ya generado, aunque la parte
+                # aleatoria del milisegundo anterior fuera mayor
+                valor = max(valor, self._ultimo + 1)
+            else:
+                # Mismo milisegundo, o el reloj retrocedió
+                valor = self._ultimo + 1
+            self._ultimo = valor
+            alto = valor >> _BITS_ALEATORIOS
+            if alto != self._alto:
+                self._alto, self._texto_alto = alto, _codificar(alto, 10)
+            texto_alto = self._texto_alto
+        bajo = valor & _MASCARA
+        pares = _PARES
+        return (self.prefijo + texto_alto
+                + pares[bajo >> 70] + pares[bajo >> 60 & 1023]
+                + pares[bajo >> 50 & 1023] + pares[bajo >> 40 & 1023]
+                + pares[bajo >> 30 & 1023] + pares[bajo >> 20 & 1023]
+                + pares[bajo >> 10 & 1023] + pares[bajo & 1023])
+
+def fecha_de(identificador: str) -> datetime:
+    """Momento de creación (en UTC) codificado en un identificador"""
+    texto = identificador[-_LONGITUD:]
+    valor = int(texto, 32)
+    milisegundos = valor >> _BITS_ALEATORIOS
+    return datetime.fromtimestamp(milisegundos / 1000, tz=timezone.utc)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(
+        after_in_child=lambda: [g._reiniciar() for g in list(_generadores)])
+
+_por_defecto = GeneradorIds()
+
+def nuevo_id(prefijo: str = '') -> str:
+    """Identificador nuevo del generador compartido del proceso"""
+    return prefijo + _por_defecto.nuevo()
@@ -0,0 +1,65 @@
+"""Módulo de importación masiva de libros y usuarios desde CSV o JSON-lines"""
+import argparse
+import csv
+import json
+import sys
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+from biblioteca import GestorBiblioteca, ResultadoImportacion
+from database import Database
+
+def leer_csv(archivo: TextIO) -> Iterator[Dict[str, Any]]:
+    """Lee filas de un CSV con encabezado, una a una"""
+    yield from csv.DictReader(archivo)
+
+def leer_jsonl(archivo: TextIO) -> Iterator[Optional[Dict[str, Any]]]:
+    """Lee filas de un archivo JSON-lines, una a una
+    
+    Las líneas que no son JSON válido se devuelven como ``None`` para
+    que la importación las anote como error sin detenerse.
+    """
+    for linea in archivo:
+        if not linea.strip():
+            continue
+        try:
+            yield json.loads(linea)
+        except ValueError:
+            yield None
+
+def detectar_formato(ruta: str) -> str:
+    """Deduce el formato de un archivo por su extensión"""
+    return 'jsonl' if ruta.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+def importar(gestor: GestorBiblioteca, tipo: str, archivo: TextIO,
+             formato: str = 'csv', cada: Optional[int] = None) -> ResultadoImportacion:
+    """Importa libros o usuarios desde un archivo abierto"""
+    filas = leer_jsonl(archivo) if formato == 'jsonl' else leer_csv(archivo)
+    if tipo == 'libros':
+        return gestor.agregar_libros_bulk(filas, cada)
+    return gestor.registrar_usuarios_bulk(filas, cada)
+
+def main():
+    """Importa un archivo desde la línea de comandos ('-' lee la entrada estándar)"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('tipo', choices=['libros', 'usuarios'])
+    parser.add_argument('archivo')
+    parser.add_argument('--formato', choices=['csv', 'jsonl'])
+    parser.add_argument('--cada', type=int, help='guardar cada N filas')
+    parser.add_argument('--db', default='biblioteca.json')
+    args = parser.parse_args()
+    
+    formato = args.formato or detectar_formato(args.archivo)
+    gestor = GestorBiblioteca(Database(args.db))
+    if args.archivo == '-':
+        resultado = importar(gestor, args.tipo, sys.stdin, formato, args.cada)
+    else:
+        with open(args.archivo, 'r', encoding='utf-8-sig', newline='') as f:
+            resultado = importar(gestor, args.tipo, f, formato, args.cada)
+    
+    for numero, mensaje in resultado.errores:
+        print(f"Fila {numero}: {mensaje}", file=sys.stderr)
+    print(f"{resultado.insertados} {args.tipo} importados, "
+          f"{len(resultado.errores)} errores")
+
+if __name__ == '__main__':
+    main()
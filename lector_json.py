@@ -0,0 +1,115 @@
+"""Módulo de lectura incremental de archivos biblioteca.json"""
+import json
+import re
+from typing import Any, Dict, Iterator, TextIO
+
+TAMANO_BLOQUE = 64 * 1024
+
+_ESPACIOS = re.compile(r'\s*')
+_decodificador = json.JSONDecoder()
+
+class _Lector:
+    """Recorre un objeto JSON de nivel superior leyendo el archivo por bloques"""
+    
+    def __init__(self, archivo: TextIO):
+        self.archivo = archivo
+        self.buffer = ''
+        self.pos = 0
+        self.fin = False
+    
+    def _leer_bloque(self) -> bool:
+        """Añade un bloque al buffer; devuelve False al llegar al final"""
+        bloque = self.archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            self.fin = True
+            return False
+        # Descartar lo ya consumido para que el buffer no crezca sin límite
+        self.buffer = self.buffer[self.pos:] + bloque
+        self.pos = 0
+        return True
+    
+    def caracter(self) -> str:
+        """Salta los espacios y devuelve el siguiente carácter sin consumirlo"""
+        while True:
+            self.pos = _ESPACIOS.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._leer_bloque():
+                raise ValueError("Fin inesperado del archivo JSON")
+    
+    def esperar(self, esperado: str) -> str:
+        """Consume uno de los caracteres esperados y lo devuelve"""
+        actual = self.caracter()
+        if actual not in esperado:
+            raise ValueError(f"Se esperaba {esperado!r} y se encontró {actual!r}")
+        self.pos += 1
+        return actual
+    
+    def valor(self) -> Any:
+        """Decodifica el siguiente valor JSON completo"""
+        self.caracter()
+        while True:
+            try:
+                valor, final = _decodificador.raw_decode(self.buffer, self.pos)
+                # Un número al final del buffer podría continuar en el bloque
+                # siguiente, así que solo se acepta si queda algo detrás
+                if final < len(self.buffer) or self.fin:
+                    self.pos = final
+                    return valor
+            except json.JSONDecodeError:
+                if self.fin:
+                    raise
+            self._leer_bloque()
+    
+    def elementos(self) -> Iterator[Any]:
+        """Recorre uno a uno los elementos de un arreglo JSON"""
+        self.esperar('[')
+        if self.caracter() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.valor()
+            if self.esperar(',]') == ']':
+                return
+    
+    def claves(self) -> Iterator[str]:
+        """Recorre las claves del objeto de nivel superior
+        
+        Tras cada clave el lector queda posicionado al inicio de su valor,
+        que debe consumirse (o saltarse) antes de pedir la siguiente.
+        """
+        self.esperar('{')
+        if self.caracter() == '}':
+            self.pos += 1
+            return
+        while True:
+            clave = self.valor()
+            self.esperar(':')
+            yield clave
+            if self.esperar(',}') == '}':
+                return
+    
+    def saltar(self):
+        """Consume el valor actual sin conservarlo en memoria"""
+        if self.caracter() == '[':
+            for _ in self.elementos():
+                pass
+        else:
+            self.valor()
+
+def iterar_coleccion(archivo: TextIO, coleccion: str) -> Iterator[Dict[str, Any]]:
+    """Recorre los elementos de una colección sin cargar el archivo completo
+    
+    Solo mantiene en memoria el elemento actual; las colecciones que
+    aparecen antes en el archivo se recorren sin conservarlas.
+    """
+    lector = _Lector(archivo)
+    for clave in lector.claves():
+        if clave != coleccion:
+            lector.saltar()
+            continue
+        if lector.caracter() != '[':
+            lector.saltar()
+            return
+        yield from lector.elementos()
+        return
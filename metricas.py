@@ -0,0 +1,254 @@
+"""Módulo de métricas de las operaciones de la biblioteca
+
+Registra cuántas veces se llama a cada operación, cuántas fallan y cuánto
+tardan (en un histograma), además de los bytes escritos en cada guardado
+y los elementos recorridos en cada búsqueda. Todo se acumula en
+``registro``, que está desactivado por defecto: mientras lo esté, las
+operaciones instrumentadas solo pagan una comprobación.
+
+    import metricas
+    metricas.registro.activar()
+    ...
+    print(metricas.registro.prometheus())
+
+Para ver en qué se va el tiempo de una operación concreta se puede
+activar cProfile solo alrededor de ella con ``registro.perfilar``.
+"""
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+# Límites superiores de las cubetas de cada histograma
+LIMITES = {
+    'duracion_segundos': (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                          0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'bytes_guardados': tuple(1024 * 4 ** i for i in range(11)),
+    'elementos_recorridos': (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+}
+
+AYUDA = {
+    'operaciones_total': 'Llamadas a cada operación',
+    'errores_total': 'Llamadas que terminaron con una excepción',
+    'duracion_segundos': 'Duración de cada operación',
+    'bytes_guardados': 'Bytes escritos en disco por guardado',
+    'elementos_recorridos': 'Elementos recorridos por búsqueda',
+    'cache_aciertos_total': 'Modelos servidos desde la caché',
+    'cache_fallos_total': 'Modelos que hubo que construir',
+}
+
+PREFIJO = 'biblioteca_'
+
+class Histograma:
+    """Cuenta observaciones por cubetas de límites fijos"""
+    
+    def __init__(self, limites: Sequence[float]):
+        self.limites = tuple(limites)
+        # Una cubeta más para los valores por encima del último límite
+        self.cuentas = [0] * (len(self.limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+    
+    def observar(self, valor: float):
+        """Anota un valor"""
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+    
+    def percentil(self, p: float) -> float:
+        """Estima un percentil con el límite de la cubeta que lo contiene"""
+        objetivo = p * self.total
+        acumulado = 0
+        for limite, cuenta in zip(self.limites + (float('inf'),), self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return limite
+        return float('inf')
+    
+    def resumen(self) -> Dict[str, float]:
+        """Cuenta, suma, media y percentiles aproximados"""
+        return {
+            'cuenta': self.total,
+            'suma': self.suma,
+            'media': self.suma / self.total if self.total else 0.0,
+            'p50': self.percentil(0.5),
+            'p99': self.percentil(0.99),
+        }
+
+class Metricas:
+    """Contadores e histogramas etiquetados con el nombre de la operación"""
+    
+    def __init__(self):
+        self.activo = False
+        self._cerrojo = threading.Lock()
+        self.contadores: Dict[Tuple[str, str], int] = {}
+        self.histogramas: Dict[Tuple[str, str], Histograma] = {}
+        self._perfilar: Dict[str, cProfile.Profile] = {}
+        # Un perfil solo puede estar activo en un hilo a la vez
+        self._cerrojo_perfil = threading.Lock()
+        # cProfile no admite dos perfiles activos a la vez, así que las
+        # operaciones anidadas dentro de una perfilada no se perfilan
+        self._perfilando = threading.local()
+    
+    def activar(self, activo: bool = True):
+        """Empieza (o deja) de registrar métricas"""
+        self.activo = activo
+    
+    def reiniciar(self):
+        """Descarta todo lo registrado"""
+        with self._cerrojo:
+            self.contadores.clear()
+            self.histogramas.clear()
+    
+    def contar(self, metrica: str, operacion: str = '', cantidad: int = 1):
+        """Suma ``cantidad`` a un contador"""
+        clave = (metrica, operacion)
+        with self._cerrojo:
+            self.contadores[clave] = self.contadores.get(clave, 0) + cantidad
+    
+    def observar(self, metrica: str, operacion: str, valor: float):
+        """Anota un valor en el histograma de una métrica"""
+        clave = (metrica, operacion)
+        with self._cerrojo:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = Histograma(LIMITES[metrica])
+            histograma.observar(valor)
+    
+    def perfilar(self, operacion: str, activo: bool = True):
+        """Activa o desactiva cProfile alrededor de una operación
+        
+        Las llamadas perfiladas se acumulan hasta desactivarlo; el
+        resultado se consulta con ``informe_perfil``.
+        """
+        if activo:
+            self._perfilar.setdefault(operacion, cProfile.Profile())
+        else:
+            self._perfilar.pop(operacion, None)
+    
+    def informe_perfil(self, operacion: str, lineas: int = 20) -> str:
+        """Funciones que más tiempo acumulan en las llamadas perfiladas"""
+        perfil = self._perfilar.get(operacion)
+        if perfil is None:
+            return ''
+        salida = io.StringIO()
+        with self._cerrojo_perfil:
+            pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(lineas)
+        return salida.getvalue()
+    
+    def ejecutar(self, operacion: str, funcion: Callable, *args, **kwargs) -> Any:
+        """Llama a una función registrando su duración y si falla"""
+        perfil = self._perfilar.get(operacion)
+        if perfil is not None and not getattr(self._perfilando, 'activo', False):
+            self._perfilando.activo = True
+        else:
+            perfil = None
+        fallo = False
+        inicio = time.perf_counter()
+        try:
+            if perfil is not None:
+                with self._cerrojo_perfil:
+                    return perfil.runcall(funcion, *args, **kwargs)
+            return funcion(*args, **kwargs)
+        except Exception:
+            fallo = True
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            if perfil is not None:
+                self._perfilando.activo = False
+            self._anotar_llamada(operacion, duracion, fallo)
+    
+    def _anotar_llamada(self, operacion: str, duracion: float, fallo: bool):
+        """Cuenta una llamada y su duración con un solo paso por el cerrojo"""
+        with self._cerrojo:
+            clave = ('operaciones_total', operacion)
+            self.contadores[clave] = self.contadores.get(clave, 0) + 1
+            if fallo:
+                clave = ('errores_total', operacion)
+                self.contadores[clave] = self.contadores.get(clave, 0) + 1
+            clave = ('duracion_segundos', operacion)
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = Histograma(LIMITES['duracion_segundos'])
+            histograma.observar(duracion)
+    
+    def estadisticas(self) -> Dict[str, Dict[str, Any]]:
+        """Todo lo registrado como diccionario métrica -> operación -> valor
+        
+        Los contadores son enteros y los histogramas resúmenes con cuenta,
+        suma, media y percentiles aproximados.
+        """
+        resultado: Dict[str, Dict[str, Any]] = {}
+        with self._cerrojo:
+            for (metrica, operacion), valor in sorted(self.contadores.items()):
+                resultado.setdefault(metrica, {})[operacion] = valor
+            for (metrica, operacion), histograma in sorted(self.histogramas.items(),
+                                                           key=lambda e: e[0]):
+                resultado.setdefault(metrica, {})[operacion] = histograma.resumen()
+        return resultado
+    
+    def prometheus(self) -> str:
+        """Todo lo registrado en el formato de texto de Prometheus"""
+        lineas = []
+        with self._cerrojo:
+            # Copias, para escribir el texto sin el cerrojo tomado
+            contadores = sorted(self.contadores.items())
+            histogramas = [(clave, list(h.cuentas), h.suma, h.total, h.limites)
+                           for clave, h in sorted(self.histogramas.items(),
+                                                  key=lambda e: e[0])]
+        
+        metrica_anterior = None
+        for (metrica, operacion), valor in contadores:
+            if metrica != metrica_anterior:
+                lineas += _cabecera(metrica, 'counter')
+                metrica_anterior = metrica
+            lineas.append(f'{PREFIJO}{metrica}{_etiquetas(operacion)} {valor}')
+        
+        for (metrica, operacion), cuentas, suma, total, limites in histogramas:
+            if metrica != metrica_anterior:
+                lineas += _cabecera(metrica, 'histogram')
+                metrica_anterior = metrica
+            acumulado = 0
+            for limite, cuenta in zip(limites + (float('inf'),), cuentas):
+                acumulado += cuenta
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                lineas.append(f'{PREFIJO}{metrica}_bucket'
+                              f'{_etiquetas(operacion, le=le)} {acumulado}')
+            lineas.append(f'{PREFIJO}{metrica}_sum{_etiquetas(operacion)} {suma}')
+            lineas.append(f'{PREFIJO}{metrica}_count{_etiquetas(operacion)} {total}')
+        return '\n'.join(lineas) + '\n' if lineas else ''
+
+def _cabecera(metrica: str, tipo: str) -> list:
+    """Líneas HELP y TYPE de una métrica"""
+    return [f'# HELP {PREFIJO}{metrica} {AYUDA.get(metrica, metrica)}',
+            f'# TYPE {PREFIJO}{metrica} {tipo}']
+
+def _etiquetas(operacion: str, **extra: str) -> str:
+    """Etiquetas de una muestra en formato Prometheus"""
+    pares = ([f'operacion="{operacion}"'] if operacion else []) + \
+        [f'{k}="{v}"' for k, v in extra.items()]
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+# Registro compartido por todo el proceso
+registro = Metricas()
+
+def instrumentar(operacion: Optional[str] = None):
+    """Decorador que registra las llamadas a una función en ``registro``
+    
+    Con el registro desactivado solo añade una llamada y una comprobación.
+    """
+    def decorador(funcion: Callable) -> Callable:
+        nombre = operacion or funcion.__name__
+        
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not registro.activo:
+                return funcion(*args, **kwargs)
+            return registro.ejecutar(nombre, funcion, *args, **kwargs)
+        return envoltura
+    return decorador
@@ -3,7 +3,10 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
-@dataclass
+# Días que dura un préstamo si no se indica otro plazo
+DIAS_PRESTAMO = 14
+
+@dataclass(slots=True)
 class Libro:
     """Representa un libro en la biblioteca"""
     isbn: str
@@ -23,7 +26,7 @@ class Libro:
     def from_dict(data):
         return Libro(**data)
 
-@dataclass
+@dataclass(slots=True)
 class Usuario:
     """Representa un usuario de la biblioteca"""
     id_usuario: str
@@ -43,7 +46,7 @@ class Usuario:
     def from_dict(data):
         return Usuario(**data)
 
-@dataclass
+@dataclass(slots=True)
 class Prestamo:
     """Representa un préstamo de libro"""
     id_prestamo: str
@@ -51,6 +54,8 @@ class Prestamo:
     id_usuario: str
     fecha_prestamo: str
     fecha_devolucion: Optional[str] = None
+    # Los préstamos anteriores a los vencimientos no tienen
+    fecha_vencimiento: Optional[str] = None
     
     def to_dict(self):
         return {
@@ -58,9 +63,36 @@ class Prestamo:
             'isbn_libro': self.isbn_libro,
             'id_usuario': self.id_usuario,
             'fecha_prestamo': self.fecha_prestamo,
-            'fecha_devolucion': self.fecha_devolucion
+            'fecha_devolucion': self.fecha_devolucion,
+            'fecha_vencimiento': self.fecha_vencimiento
         }
     
     @staticmethod
     def from_dict(data):
         return Prestamo(**data)
+
+@dataclass(slots=True)
+class Reserva:
+    """Representa la reserva de un libro prestado por parte de un usuario"""
+    id_reserva: str
+    isbn_libro: str
+    id_usuario: str
+    fecha_reserva: str
+    # 'pendiente' mientras espera en la cola; 'atendida' o 'cancelada' después
+    estado: str = 'pendiente'
+    # Préstamo con el que se atendió
+    id_prestamo: Optional[str] = None
+    
+    def to_dict(self):
+        return {
+            'id_reserva': self.id_reserva,
+            'isbn_libro': self.isbn_libro,
+            'id_usuario': self.id_usuario,
+            'fecha_reserva': self.fecha_reserva,
+            'estado': self.estado,
+            'id_prestamo': self.id_prestamo
+        }
+    
+    @staticmethod
+    def from_dict(data):
+        return Reserva(**data)
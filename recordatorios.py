@@ -0,0 +1,32 @@
+"""Tarea programada que genera los recordatorios de préstamos vencidos
+
+Escribe un recordatorio por cada préstamo vencido como una línea JSON en
+la salida estándar, para que otro programa los envíe; la base no se
+modifica:
+    
+    python recordatorios.py biblioteca.json >> pendientes.jsonl
+
+Pensada para ejecutarse periódicamente (por ejemplo una vez al día con
+cron). Abre la base en modo perezoso, así que de un archivo JSON solo lee
+los préstamos y los usuarios, y consulta el índice de préstamos por
+vencimiento en lugar de recorrerlos.
+"""
+import json
+import sys
+
+from biblioteca import GestorBiblioteca
+from database import Database
+from database_sqlite import SQLiteDatabase
+
+def main():
+    """Genera los recordatorios de la base indicada en la línea de comandos"""
+    archivo = sys.argv[1] if len(sys.argv) > 1 else 'biblioteca.json'
+    db = SQLiteDatabase(archivo) if archivo.endswith('.db') else Database(archivo, perezoso=True)
+    try:
+        for recordatorio in GestorBiblioteca(db).generar_recordatorios():
+            print(json.dumps(recordatorio, ensure_ascii=False))
+    finally:
+        db.cerrar()
+
+if __name__ == '__main__':
+    main()
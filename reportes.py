@@ -0,0 +1,207 @@
+"""Módulo de informes sobre el historial de préstamos
+
+Carga una vez los campos de los préstamos en columnas de NumPy (las
+fechas como ``datetime64`` y los ISBN y usuarios como códigos enteros) y
+calcula cada informe con operaciones vectorizadas sobre ellas. Columnas
+y resultados se reutilizan mientras la versión de las colecciones de las
+que salen no cambie.
+
+Requiere el paquete ``numpy``:
+    
+    reportes = Reportes(db)
+    reportes.prestamos_por_mes()
+    reportes.usuarios_mas_activos(10)
+"""
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from models import DIAS_PRESTAMO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_FECHA = ('fecha_prestamo', 'fecha_devolucion', 'fecha_vencimiento')
+
+# Préstamos que se convierten a columnas de una vez
+TRAMO_COLUMNAS = 65536
+
+def _requerir_numpy():
+    """Comprueba que el paquete opcional numpy esté instalado"""
+    if np is None:
+        raise ImportError("Los informes requieren instalar el paquete 'numpy'")
+
+def _fechas(prestamos: List[Dict[str, Any]], campo: str) -> 'np.ndarray':
+    """Columna ``datetime64`` de un campo; las fechas ausentes valen NaT"""
+    return np.array([p.get(campo) for p in prestamos], dtype='datetime64[us]')
+
+def _fechas_validas(prestamo: Dict[str, Any]) -> bool:
+    """Indica si todas las fechas de un préstamo se pueden convertir"""
+    try:
+        for campo in CAMPOS_FECHA:
+            np.datetime64(prestamo.get(campo), 'us')
+    except (ValueError, TypeError):
+        return False
+    return True
+
+class Columnas:
+    """Campos de todos los préstamos como arreglos del mismo largo
+    
+    Los préstamos se convierten por tramos de ``tramo``, así nunca están
+    todos los diccionarios en memoria a la vez. Los que tienen una fecha
+    mal formada se saltan y se cuentan en ``descartados``.
+    """
+    
+    def __init__(self, prestamos: Iterable[Dict[str, Any]], tramo: int = TRAMO_COLUMNAS):
+        isbns: Dict[Any, int] = {}
+        usuarios: Dict[Any, int] = {}
+        partes: Dict[str, List['np.ndarray']] = {
+            campo: [] for campo in ('isbn_libro', 'id_usuario', *CAMPOS_FECHA)}
+        self.descartados = 0
+        prestamos = iter(prestamos)
+        while True:
+            bloque = list(islice(prestamos, tramo))
+            if not bloque:
+                break
+            try:
+                fechas = [_fechas(bloque, campo) for campo in CAMPOS_FECHA]
+            except (ValueError, TypeError):
+                # Solo el tramo con la fecha errónea se revisa fila a fila
+                validos = [p for p in bloque if _fechas_validas(p)]
+                self.descartados += len(bloque) - len(validos)
+                bloque = validos
+                fechas = [_fechas(bloque, campo) for campo in CAMPOS_FECHA]
+            for campo, columna in zip(CAMPOS_FECHA, fechas):
+                partes[campo].append(columna)
+            for campo, codigos in (('isbn_libro', isbns), ('id_usuario', usuarios)):
+                partes[campo].append(np.fromiter(
+                    (codigos.setdefault(p.get(campo), len(codigos)) for p in bloque),
+                    dtype=np.int32, count=len(bloque)))
+        if self.descartados:
+            logger.warning("Se descartaron %d préstamos con fechas mal formadas",
+                           self.descartados)
+        
+        def unir(campo: str, dtype: str) -> 'np.ndarray':
+            return np.concatenate(partes[campo]) if partes[campo] else np.array([], dtype)
+        self.libro, self.isbns = unir('isbn_libro', 'int32'), list(isbns)
+        self.usuario, self.usuarios = unir('id_usuario', 'int32'), list(usuarios)
+        # Los préstamos activos no tienen devolución: NaT
+        self.prestamo = unir('fecha_prestamo', 'datetime64[us]')
+        self.devolucion = unir('fecha_devolucion', 'datetime64[us]')
+        self.vencimiento = unir('fecha_vencimiento', 'datetime64[us]')
+    
+    def __len__(self) -> int:
+        return len(self.libro)
+
+def _mayores(conteos: 'np.ndarray', nombres: List[Any]) -> List[Tuple[Any, int]]:
+    """Pares (nombre, conteo) de mayor a menor conteo, sin los ceros
+    
+    Los empates quedan en el orden en que aparecieron en los préstamos.
+    """
+    con_datos = np.flatnonzero(conteos)
+    orden = con_datos[np.argsort(-conteos[con_datos], kind='stable')]
+    return [(nombres[i], n) for i, n in zip(orden.tolist(), conteos[orden].tolist())]
+
+class Reportes:
+    """Informes del historial de préstamos de una base de datos"""
+    
+    def __init__(self, db):
+        self.db = db
+        self._columnas: Optional[Tuple[tuple, Columnas]] = None
+        # Resultado de cada informe con la versión de la que salió
+        self._resultados: Dict[tuple, Tuple[tuple, Any]] = {}
+    
+    def columnas(self) -> Columnas:
+        """Columnas de los préstamos, recargadas solo si la colección cambió"""
+        _requerir_numpy()
+        version = self.db.version('prestamos')
+        if self._columnas is None or self._columnas[0] != version:
+            self._columnas = (version, Columnas(self.db.iterar('prestamos')))
+        return self._columnas[1]
+    
+    def _cacheado(self, clave: tuple, colecciones: Tuple[str, ...],
+                  calcular: Callable[[], Any]) -> Any:
+        """Resultado de un informe, recalculado solo si sus colecciones cambiaron"""
+        version = tuple(self.db.version(c) for c in colecciones)
+        guardado = self._resultados.get(clave)
+        if guardado is None or guardado[0] != version:
+            guardado = (version, calcular())
+            self._resultados[clave] = guardado
+        return guardado[1]
+    
+    def prestamos_por_libro(self, limite: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Libros más prestados como pares (isbn, préstamos)"""
+        def calcular():
+            c = self.columnas()
+            return _mayores(np.bincount(c.libro, minlength=len(c.isbns)), c.isbns)
+        return self._cacheado(('libro',), ('prestamos',), calcular)[:limite]
+    
+    def prestamos_por_autor(self, limite: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Autores más prestados como pares (autor, préstamos)
+        
+        Los préstamos de libros que ya no están en el catálogo no cuentan.
+        """
+        def calcular():
+            c = self.columnas()
+            autores_por_isbn = {libro.get('isbn'): libro.get('autor')
+                                for libro in self.db.iterar('libros')}
+            # Un código de autor por cada ISBN de los préstamos; -1 si no se conoce
+            codigos: Dict[Any, int] = {}
+            autor_de_libro = np.array(
+                [-1 if autores_por_isbn.get(isbn) is None
+                 else codigos.setdefault(autores_por_isbn[isbn], len(codigos))
+                 for isbn in c.isbns], dtype=np.int64)
+            autores = autor_de_libro[c.libro]
+            autores = autores[autores >= 0]
+            return _mayores(np.bincount(autores, minlength=len(codigos)), list(codigos))
+        return self._cacheado(('autor',), ('prestamos', 'libros'), calcular)[:limite]
+    
+    def prestamos_por_mes(self) -> List[Tuple[str, int]]:
+        """Préstamos iniciados en cada mes como pares ('AAAA-MM', préstamos)"""
+        def calcular():
+            meses = self.columnas().prestamo.astype('datetime64[M]')
+            meses, conteos = np.unique(meses[~np.isnat(meses)], return_counts=True)
+            return [(str(mes), int(n)) for mes, n in zip(meses, conteos)]
+        return list(self._cacheado(('mes',), ('prestamos',), calcular))
+    
+    def usuarios_mas_activos(self, limite: Optional[int] = 10) -> List[Tuple[str, int]]:
+        """Usuarios con más préstamos como pares (id_usuario, préstamos)"""
+        def calcular():
+            c = self.columnas()
+            return _mayores(np.bincount(c.usuario, minlength=len(c.usuarios)), c.usuarios)
+        return self._cacheado(('usuario',), ('prestamos',), calcular)[:limite]
+    
+    def duracion_media(self) -> Optional[float]:
+        """Días que duran de media los préstamos ya devueltos, o None si no hay"""
+        def calcular():
+            c = self.columnas()
+            cerrados = ~np.isnat(c.devolucion) & ~np.isnat(c.prestamo)
+            if not cerrados.any():
+                return None
+            duraciones = c.devolucion[cerrados] - c.prestamo[cerrados]
+            return float(duraciones.mean() / np.timedelta64(1, 'D'))
+        return self._cacheado(('duracion',), ('prestamos',), calcular)
+    
+    def vencidos(self, dias: int = DIAS_PRESTAMO,
+                 ahora: Optional[datetime] = None) -> Dict[str, int]:
+        """Préstamos que pasaron de su fecha de vencimiento
+        
+        Los préstamos sin vencimiento, anteriores a que existiera, vencen
+        a los ``dias`` días. Devuelve los que siguen activos
+        (``'activos'``) y los devueltos tarde (``'devueltos'``). Depende de
+        la hora, así que no se guarda el resultado, aunque sí las columnas.
+        """
+        c = self.columnas()
+        vencimiento = np.where(np.isnat(c.vencimiento),
+                               c.prestamo + np.timedelta64(dias, 'D'), c.vencimiento)
+        ahora = np.datetime64(ahora or datetime.now(), 'us')
+        activos = np.isnat(c.devolucion)
+        return {
+            'activos': int(np.count_nonzero(activos & (vencimiento < ahora))),
+            'devueltos': int(np.count_nonzero(~activos & (c.devolucion > vencimiento))),
+        }
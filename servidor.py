@@ -0,0 +1,449 @@
+"""Servicio HTTP/JSON de la biblioteca sobre asyncio
+
+Permite que varios puestos trabajen contra una única base de datos:
+    
+    python servidor.py --archivo biblioteca.json --puerto 8080
+
+Rutas:
+
+- ``GET  /libros`` (``offset``, ``limite``, ``orden``, ``disponible``)
+- ``GET  /libros/buscar?q=texto``
+- ``GET  /libros/<isbn>``
+- ``POST /libros`` con ``{"isbn", "titulo", "autor"}``
+- ``GET  /usuarios`` (``offset``, ``limite``, ``orden``, ``activo``)
+- ``GET  /usuarios/<id_usuario>``
+- ``POST /usuarios`` con ``{"id_usuario", "nombre", "email"}``
+- ``GET  /prestamos`` (préstamos activos; ``offset``, ``limite``, ``orden``,
+  ``id_usuario``)
+- ``POST /prestamos`` con ``{"isbn", "id_usuario"}``
+- ``POST /devoluciones`` con ``{"isbn"}``
+- ``GET  /metricas`` (formato de texto de Prometheus; ver ``metricas``)
+
+Las escrituras pasan por una única tarea escritora que las ejecuta de una
+en una en su propio hilo, así que guardar el archivo nunca bloquea el
+bucle de eventos. Las lecturas no esperan en esa cola: se atienden en un
+grupo de hilos en cuanto llegan, y solo esperan si coinciden con la
+escritura en curso.
+"""
+import argparse
+import asyncio
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from biblioteca import GestorBiblioteca, Pagina
+from database import Database
+from database_sqlite import SQLiteDatabase
+import metricas
+
+# Tamaño máximo del cuerpo de una petición
+MAX_CUERPO = 1024 * 1024
+# Elementos por página si no se indica ``limite``, y máximo permitido
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 1000
+# Escrituras que pueden esperar en cola antes de frenar a los clientes
+MAX_ESCRITURAS_EN_COLA = 1000
+HILOS_LECTURA = 4
+# El modo 'grupo' no tiene sentido aquí: las escrituras se ejecutan de una
+# en una, así que ninguna se junta con otra y cada una solo esperaría la ventana
+DURABILIDADES_SERVIDOR = ('sync', 'periodico')
+
+ESTADOS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+class ErrorHTTP(Exception):
+    """Error que se devuelve al cliente con un código de estado"""
+    
+    def __init__(self, estado: int, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+
+def _a_json(valor: Any) -> Any:
+    """Convierte modelos y páginas en estructuras serializables"""
+    if isinstance(valor, Pagina):
+        return {'elementos': [_a_json(e) for e in valor.elementos], 'total': valor.total}
+    if isinstance(valor, list):
+        return [_a_json(e) for e in valor]
+    if hasattr(valor, 'to_dict'):
+        return valor.to_dict()
+    return valor
+
+def _booleano(texto: str) -> bool:
+    """Interpreta un parámetro de consulta como booleano"""
+    if texto.lower() in ('1', 'true', 'si', 'sí'):
+        return True
+    if texto.lower() in ('0', 'false', 'no'):
+        return False
+    raise ErrorHTTP(400, f"Valor booleano inválido: {texto}")
+
+def _entero(parametros: Dict[str, str], nombre: str, defecto: int) -> int:
+    """Lee un parámetro entero no negativo"""
+    try:
+        valor = int(parametros.get(nombre, defecto))
+    except ValueError:
+        raise ErrorHTTP(400, f"'{nombre}' debe ser un entero")
+    if valor < 0:
+        raise ErrorHTTP(400, f"'{nombre}' no puede ser negativo")
+    return valor
+
+def _campos(cuerpo: Dict[str, Any], *nombres: str) -> Tuple[str, ...]:
+    """Extrae del cuerpo JSON los campos de texto de una operación"""
+    valores = []
+    for nombre in nombres:
+        valor = cuerpo.get(nombre)
+        if valor is not None and not isinstance(valor, str):
+            raise ErrorHTTP(400, f"'{nombre}' debe ser texto")
+        valores.append((valor or '').strip())
+    return tuple(valores)
+
+class CerrojoLecturaEscritura:
+    """Deja entrar a varios lectores a la vez o a un único escritor
+    
+    Los escritores tienen preferencia: mientras alguno espera no entran
+    lectores nuevos, así un flujo continuo de lecturas no los bloquea.
+    """
+    
+    def __init__(self):
+        self._condicion = threading.Condition(threading.Lock())
+        self._lectores = 0
+        self._escribiendo = False
+        self._escritores_esperando = 0
+    
+    @contextmanager
+    def lectura(self):
+        """Acceso compartido con otros lectores"""
+        with self._condicion:
+            while self._escribiendo or self._escritores_esperando:
+                self._condicion.wait()
+            self._lectores += 1
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._lectores -= 1
+                if not self._lectores:
+                    self._condicion.notify_all()
+    
+    @contextmanager
+    def escritura(self):
+        """Acceso exclusivo"""
+        with self._condicion:
+            self._escritores_esperando += 1
+            try:
+                while self._escribiendo or self._lectores:
+                    self._condicion.wait()
+            finally:
+                self._escritores_esperando -= 1
+            self._escribiendo = True
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._escribiendo = False
+                self._condicion.notify_all()
+
+class ServicioBiblioteca:
+    """Atiende peticiones HTTP con un ``GestorBiblioteca`` compartido"""
+    
+    def __init__(self, gestor: GestorBiblioteca):
+        self.gestor = gestor
+        # Protege los datos en memoria: las lecturas se atienden a la vez,
+        # pero ninguna mientras se ejecuta una escritura
+        self._cerrojo = CerrojoLecturaEscritura()
+        self._hilo_escritor = ThreadPoolExecutor(max_workers=1,
+                                                 thread_name_prefix='escritor')
+        self._hilos_lectura = ThreadPoolExecutor(max_workers=HILOS_LECTURA,
+                                                 thread_name_prefix='lector')
+        self._cola: Optional[asyncio.Queue] = None
+        self._tarea_escritora: Optional[asyncio.Task] = None
+        self._rutas = [
+            ('GET', r'/libros', self._listar_libros),
+            ('GET', r'/libros/buscar', self._buscar_libros),
+            ('GET', r'/libros/(?P<isbn>[^/]+)', self._obtener_libro),
+            ('POST', r'/libros', self._agregar_libro),
+            ('GET', r'/usuarios', self._listar_usuarios),
+            ('GET', r'/usuarios/(?P<id_usuario>[^/]+)', self._obtener_usuario),
+            ('POST', r'/usuarios', self._registrar_usuario),
+            ('GET', r'/prestamos', self._listar_prestamos),
+            ('POST', r'/prestamos', self._prestar_libro),
+            ('POST', r'/devoluciones', self._devolver_libro),
+            ('GET', r'/metricas', self._metricas),
+        ]
+        self._rutas = [(m, re.compile(r + '$'), f) for m, r, f in self._rutas]
+    
+    # Acceso a los datos
+    def _con_lectura(self, funcion: Callable, args: tuple) -> Any:
+        """Ejecuta una lectura del gestor a la vez que otras lecturas"""
+        with self._cerrojo.lectura():
+            return funcion(*args)
+    
+    def _con_escritura(self, funcion: Callable, args: tuple) -> Any:
+        """Ejecuta una escritura del gestor con acceso exclusivo a los datos"""
+        with self._cerrojo.escritura():
+            return funcion(*args)
+    
+    async def _leer(self, funcion: Callable, *args) -> Any:
+        """Ejecuta una lectura en el grupo de hilos de lectura"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._hilos_lectura, self._con_lectura,
+                                          funcion, args)
+    
+    async def _escribir(self, funcion: Callable, *args) -> Any:
+        """Encola una escritura para la tarea escritora y espera su resultado"""
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((funcion, args, futuro))
+        return await futuro
+    
+    async def _escritora(self):
+        """Ejecuta las escrituras de una en una, en orden de llegada"""
+        loop = asyncio.get_running_loop()
+        while True:
+            funcion, args, futuro = await self._cola.get()
+            try:
+                resultado = await loop.run_in_executor(
+                    self._hilo_escritor, self._con_escritura, funcion, args)
+            except Exception as e:
+                if not futuro.cancelled():
+                    futuro.set_exception(e)
+            else:
+                if not futuro.cancelled():
+                    futuro.set_result(resultado)
+            finally:
+                self._cola.task_done()
+    
+    async def iniciar(self, host: str = '127.0.0.1', puerto: int = 8080) -> asyncio.AbstractServer:
+        """Arranca la tarea escritora y empieza a aceptar conexiones"""
+        self._cola = asyncio.Queue(maxsize=MAX_ESCRITURAS_EN_COLA)
+        self._tarea_escritora = asyncio.create_task(self._escritora())
+        return await asyncio.start_server(self._atender, host, puerto)
+    
+    async def detener(self):
+        """Termina las escrituras encoladas y libera los hilos"""
+        if self._cola is not None:
+            await self._cola.join()
+            self._tarea_escritora.cancel()
+        self._hilo_escritor.shutdown()
+        self._hilos_lectura.shutdown()
+    
+    # Protocolo HTTP
+    async def _atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atiende las peticiones de una conexión, que puede reutilizarse"""
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, destino, version = linea.decode('latin-1').split()
+                except ValueError:
+                    break
+                cabeceras = {}
+                while True:
+                    linea = await reader.readline()
+                    if linea in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = linea.decode('latin-1').partition(':')
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                
+                try:
+                    longitud = int(cabeceras.get('content-length', 0) or 0)
+                except ValueError:
+                    longitud = -1
+                if longitud < 0:
+                    # Sin saber dónde acaba el cuerpo no se puede seguir leyendo
+                    await self._responder(writer, 400, {'error': "Content-Length inválido"},
+                                          mantener=False)
+                    break
+                if longitud > MAX_CUERPO:
+                    await self._responder(writer, 413, {'error': "Cuerpo demasiado grande"},
+                                          mantener=False)
+                    break
+                cuerpo = await reader.readexactly(longitud) if longitud else b''
+                
+                estado, respuesta = await self._despachar(metodo, destino, cuerpo)
+                mantener = (version == 'HTTP/1.1'
+                            and cabeceras.get('connection', '').lower() != 'close')
+                await self._responder(writer, estado, respuesta, mantener)
+                if not mantener:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    @staticmethod
+    async def _responder(writer: asyncio.StreamWriter, estado: int, cuerpo: Any,
+                         mantener: bool):
+        """Envía una respuesta JSON, o de texto si el cuerpo es una cadena"""
+        if isinstance(cuerpo, str):
+            datos = cuerpo.encode('utf-8')
+            tipo = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            datos = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+            tipo = 'application/json; charset=utf-8'
+        cabecera = (f"HTTP/1.1 {estado} {ESTADOS.get(estado, '')}\r\n"
+                    f"Content-Type: {tipo}\r\n"
+                    f"Content-Length: {len(datos)}\r\n"
+                    f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n")
+        writer.write(cabecera.encode('latin-1') + datos)
+        await writer.drain()
+    
+    async def _despachar(self, metodo: str, destino: str, cuerpo: bytes) -> Tuple[int, Any]:
+        """Encuentra la ruta de una petición y convierte errores en respuestas"""
+        partes = urlsplit(destino)
+        parametros = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        metodos_ruta = set()
+        for metodo_ruta, patron, manejador in self._rutas:
+            coincidencia = patron.match(partes.path)
+            if not coincidencia:
+                continue
+            metodos_ruta.add(metodo_ruta)
+            if metodo_ruta != metodo:
+                continue
+            try:
+                datos = json.loads(cuerpo) if cuerpo else {}
+                if not isinstance(datos, dict):
+                    raise ErrorHTTP(400, "El cuerpo debe ser un objeto JSON")
+                argumentos = {k: unquote(v) for k, v in coincidencia.groupdict().items()}
+                return await manejador(parametros, datos, **argumentos)
+            except ErrorHTTP as e:
+                return e.estado, {'error': str(e)}
+            except json.JSONDecodeError:
+                return 400, {'error': "JSON inválido"}
+            except ValueError as e:
+                return 400, {'error': str(e)}
+            except Exception as e:
+                return 500, {'error': f"Error interno: {e}"}
+        if metodos_ruta:
+            return 405, {'error': f"Método no permitido: {metodo}"}
+        return 404, {'error': f"Ruta no encontrada: {partes.path}"}
+    
+    # Manejadores
+    async def _pagina(self, listar: Callable, parametros: Dict[str, str],
+                      filtro: Dict[str, Any]) -> Tuple[int, Any]:
+        """Responde con una página de un listado"""
+        offset = _entero(parametros, 'offset', 0)
+        limite = min(_entero(parametros, 'limite', LIMITE_POR_DEFECTO), LIMITE_MAXIMO)
+        pagina = await self._leer(listar, offset, limite, filtro, parametros.get('orden'))
+        return 200, _a_json(pagina)
+    
+    async def _listar_libros(self, parametros, cuerpo):
+        filtro = {}
+        if 'disponible' in parametros:
+            filtro['disponible'] = _booleano(parametros['disponible'])
+        return await self._pagina(self.gestor.listar_libros, parametros, filtro)
+    
+    async def _buscar_libros(self, parametros, cuerpo):
+        limite = min(_entero(parametros, 'limite', LIMITE_POR_DEFECTO), LIMITE_MAXIMO)
+        libros = await self._leer(self.gestor.buscar_libros, parametros.get('q', ''), limite)
+        return 200, _a_json(libros)
+    
+    async def _obtener_libro(self, parametros, cuerpo, isbn):
+        libro = await self._leer(self.gestor.buscar_libro_por_isbn, isbn)
+        if libro is None:
+            raise ErrorHTTP(404, "Libro no encontrado")
+        return 200, _a_json(libro)
+    
+    async def _agregar_libro(self, parametros, cuerpo):
+        isbn, titulo, autor = _campos(cuerpo, 'isbn', 'titulo', 'autor')
+        await self._escribir(self.gestor.agregar_libro, isbn, titulo, autor)
+        return 201, {'isbn': isbn}
+    
+    async def _listar_usuarios(self, parametros, cuerpo):
+        filtro = {}
+        if 'activo' in parametros:
+            filtro['activo'] = _booleano(parametros['activo'])
+        return await self._pagina(self.gestor.listar_usuarios, parametros, filtro)
+    
+    async def _obtener_usuario(self, parametros, cuerpo, id_usuario):
+        usuario = await self._leer(self.gestor.buscar_usuario_por_id, id_usuario)
+        if usuario is None:
+            raise ErrorHTTP(404, "Usuario no encontrado")
+        return 200, _a_json(usuario)
+    
+    async def _registrar_usuario(self, parametros, cuerpo):
+        id_usuario, nombre, email = _campos(cuerpo, 'id_usuario', 'nombre', 'email')
+        await self._escribir(self.gestor.registrar_usuario, id_usuario, nombre, email)
+        return 201, {'id_usuario': id_usuario}
+    
+    async def _listar_prestamos(self, parametros, cuerpo):
+        filtro = {}
+        if 'id_usuario' in parametros:
+            filtro['id_usuario'] = parametros['id_usuario']
+        return await self._pagina(self.gestor.listar_prestamos_activos, parametros, filtro)
+    
+    async def _prestar_libro(self, parametros, cuerpo):
+        isbn, id_usuario = _campos(cuerpo, 'isbn', 'id_usuario')
+        prestamo = await self._escribir(self._prestar_y_leer, isbn, id_usuario)
+        return 201, prestamo
+    
+    def _prestar_y_leer(self, isbn: str, id_usuario: str) -> Optional[Dict]:
+        """Presta el libro y lee el préstamo en la misma escritura
+        
+        Leerlo después, ya sin el cerrojo, podría devolver el préstamo de
+        otra petición o ninguno si entretanto se devolvió.
+        """
+        self.gestor.prestar_libro(isbn, id_usuario)
+        return self.gestor.db.prestamo_activo(isbn)
+    
+    async def _devolver_libro(self, parametros, cuerpo):
+        isbn, = _campos(cuerpo, 'isbn')
+        await self._escribir(self.gestor.devolver_libro, isbn)
+        return 200, {'isbn': isbn}
+    
+    async def _metricas(self, parametros, cuerpo):
+        return 200, metricas.registro.prometheus()
+
+def abrir_base(archivo: str, durabilidad: str = 'sync'):
+    """Abre la base de datos según la extensión del archivo
+    
+    ``durabilidad`` solo se aplica a los archivos JSON (ver ``Database``)
+    y debe ser una de ``DURABILIDADES_SERVIDOR``.
+    """
+    if durabilidad not in DURABILIDADES_SERVIDOR:
+        raise ValueError(f"Durabilidad no admitida por el servidor: {durabilidad}")
+    if archivo.endswith('.db'):
+        return SQLiteDatabase(archivo)
+    return Database(archivo, durabilidad=durabilidad)
+
+async def servir(archivo: str, host: str, puerto: int, con_metricas: bool = False,
+                 durabilidad: str = 'sync'):
+    """Sirve la biblioteca hasta que se interrumpa el proceso"""
+    metricas.registro.activar(con_metricas)
+    db = abrir_base(archivo, durabilidad)
+    servicio = ServicioBiblioteca(GestorBiblioteca(db))
+    servidor = await servicio.iniciar(host, puerto)
+    direccion = servidor.sockets[0].getsockname()
+    print(f"Sirviendo {archivo} en http://{direccion[0]}:{direccion[1]}", flush=True)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        await servicio.detener()
+        db.cerrar()
+
+def main(argv=None):
+    """Punto de entrada de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Servicio HTTP de la biblioteca")
+    parser.add_argument('--archivo', default='biblioteca.json',
+                        help="archivo de datos (.json o .db para SQLite)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8080)
+    parser.add_argument('--metricas', action='store_true',
+                        help="registra métricas de las operaciones (GET /metricas)")
+    parser.add_argument('--durabilidad', choices=DURABILIDADES_SERVIDOR, default='sync',
+                        help="cuándo se guardan los cambios en un archivo JSON")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(servir(args.archivo, args.host, args.puerto, args.metricas,
+                           args.durabilidad))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
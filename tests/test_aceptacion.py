@@ -18,8 +18,9 @@ class TestAceptacion(unittest.TestCase):
     
     def tearDown(self):
         """Limpieza después de cada prueba"""
-        if os.path.exists(self.archivo_test):
-            os.remove(self.archivo_test)
+        for archivo in (self.archivo_test, self.archivo_test + '.lock'):
+            if os.path.exists(archivo):
+                os.remove(archivo)
     
     def test_historia_usuario_nuevo_miembro(self):
         """
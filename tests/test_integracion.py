@@ -2,25 +2,33 @@ import unittest
 import sys
 import os
 import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from database import Database
+from database_sqlite import SQLiteDatabase
 from biblioteca import GestorBiblioteca
 
 class TestIntegracion(unittest.TestCase):
     """Pruebas de integración entre Database y GestorBiblioteca"""
     
+    crear_db = Database
+    archivo_test = 'test_biblioteca.json'
+    
     def setUp(self):
         """Configuración antes de cada prueba"""
-        self.archivo_test = 'test_biblioteca.json'
-        self.db = Database(self.archivo_test)
+        self.db = self.crear_db(self.archivo_test)
         self.gestor = GestorBiblioteca(self.db)
     
     def tearDown(self):
         """Limpieza después de cada prueba"""
-        if os.path.exists(self.archivo_test):
-            os.remove(self.archivo_test)
+        self.db.cerrar()
+        for sufijo in ('', '.log', '.lock', '-wal', '-shm'):
+            if os.path.exists(self.archivo_test + sufijo):
+                os.remove(self.archivo_test + sufijo)
     
     def test_agregar_y_buscar_libro(self):
         """Prueba agregar un libro y buscarlo en la base de datos"""
@@ -68,6 +76,213 @@ class TestIntegracion(unittest.TestCase):
         libro = self.gestor.buscar_libro_por_isbn(isbn)
         self.assertTrue(libro.disponible)
     
+    def test_prestamos_activos_por_usuario(self):
+        """Prueba consultar los préstamos activos de un usuario"""
+        self.gestor.agregar_libro('978-010', 'Libro A', 'Autor A')
+        self.gestor.agregar_libro('978-011', 'Libro B', 'Autor B')
+        self.gestor.registrar_usuario('U-TEST-010', 'Usuario A', 'a@email.com')
+        self.gestor.registrar_usuario('U-TEST-011', 'Usuario B', 'b@email.com')
+        
+        self.gestor.prestar_libro('978-010', 'U-TEST-010')
+        self.gestor.prestar_libro('978-011', 'U-TEST-011')
+        
+        prestamos = self.gestor.obtener_prestamos_usuario('U-TEST-010')
+        self.assertEqual(len(prestamos), 1)
+        self.assertEqual(prestamos[0].isbn_libro, '978-010')
+        
+        self.gestor.devolver_libro('978-010')
+        self.assertEqual(self.gestor.obtener_prestamos_usuario('U-TEST-010'), [])
+        self.assertEqual(len(self.gestor.obtener_prestamos_activos()), 1)
+    
+    def test_prestamos_seguidos_tienen_id_distinto(self):
+        """Prueba que devolver un libro no cierre el préstamo de otro prestado a la vez"""
+        for i in range(5):
+            self.gestor.agregar_libro(f'978-02{i}', f'Libro {i}', 'Autor')
+        self.gestor.registrar_usuario('U-TEST-020', 'Usuario', 'u@email.com')
+        for i in range(5):
+            self.gestor.prestar_libro(f'978-02{i}', 'U-TEST-020')
+        
+        ids = [p.id_prestamo for p in self.gestor.obtener_prestamos_usuario('U-TEST-020')]
+        self.assertEqual(len(set(ids)), 5)
+        
+        self.gestor.devolver_libro('978-023')
+        activos = {p.isbn_libro for p in self.gestor.obtener_prestamos_activos()}
+        self.assertEqual(activos, {'978-020', '978-021', '978-022', '978-024'})
+    
+    def test_transaccion_revierte_cambios(self):
+        """Prueba que un fallo dentro de una transacción no deje cambios a medias"""
+        isbn = '978-012'
+        self.gestor.agregar_libro(isbn, 'Libro Transacción', 'Autor')
+        
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.actualizar('libros', 'isbn', isbn, {'disponible': False})
+                raise RuntimeError("fallo simulado")
+        
+        self.assertTrue(self.gestor.buscar_libro_por_isbn(isbn).disponible)
+        self.assertEqual(self.gestor.obtener_prestamos_activos(), [])
+    
+    def test_prestamo_no_guardado_deshace_la_disponibilidad(self):
+        """Prueba que si el préstamo no se guarda el libro siga disponible"""
+        self.gestor.agregar_libro('978-013', 'Libro', 'Autor')
+        self.gestor.registrar_usuario('U-TEST-013', 'Usuario', 'u013@email.com')
+        agregar = self.db.agregar
+        self.db.agregar = lambda coleccion, elemento: (
+            coleccion != 'prestamos' and agregar(coleccion, elemento))
+        
+        with self.assertRaises(RuntimeError):
+            self.gestor.prestar_libro('978-013', 'U-TEST-013')
+        self.assertTrue(self.gestor.buscar_libro_por_isbn('978-013').disponible)
+    
+    def test_cache_de_modelos_se_invalida_al_escribir(self):
+        """Prueba que la caché de modelos no devuelva datos desfasados"""
+        self.gestor.agregar_libro('978-040', 'Libro A', 'Autor')
+        self.gestor.agregar_libro('978-041', 'Libro B', 'Autor')
+        self.gestor.registrar_usuario('U-TEST-040', 'Usuario', 'u@email.com')
+        
+        libro_b = self.gestor.buscar_libro_por_isbn('978-041')
+        self.assertIs(self.gestor.buscar_libro_por_isbn('978-041'), libro_b)
+        
+        # Prestar el libro A solo invalida ese libro
+        self.gestor.prestar_libro('978-040', 'U-TEST-040')
+        self.assertFalse(self.gestor.buscar_libro_por_isbn('978-040').disponible)
+        self.assertIs(self.gestor.buscar_libro_por_isbn('978-041'), libro_b)
+        
+        # Un cambio revertido no deja en la caché lo leído a mitad
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.actualizar('libros', 'isbn', '978-041', {'disponible': False})
+                self.assertFalse(self.gestor.buscar_libro_por_isbn('978-041').disponible)
+                raise RuntimeError("fallo simulado")
+        self.assertTrue(self.gestor.buscar_libro_por_isbn('978-041').disponible)
+        
+        estadisticas = self.gestor.estadisticas_cache()['libros']
+        self.assertGreater(estadisticas['aciertos'], 0)
+        self.assertGreater(estadisticas['fallos'], 0)
+    
+    def test_importacion_masiva_libros(self):
+        """Prueba la importación en bloque con filas duplicadas e inválidas"""
+        self.gestor.agregar_libro('978-030', 'Existente', 'Autor')
+        filas = [
+            {'isbn': '978-031', 'titulo': 'Libro 1', 'autor': 'Autor 1'},
+            {'isbn': '978-030', 'titulo': 'Repetido', 'autor': 'Autor'},
+            {'isbn': '978-032', 'titulo': '', 'autor': 'Autor 2'},
+            {'isbn': '978-031', 'titulo': 'Repetido en el lote', 'autor': 'Autor 1'},
+            None,
+            {'isbn': '978-033', 'titulo': 'Libro 3', 'autor': 'Autor 3'},
+        ]
+        
+        resultado = self.gestor.agregar_libros_bulk(filas, cada=2)
+        
+        self.assertEqual(resultado.insertados, 2)
+        self.assertEqual([numero for numero, _ in resultado.errores], [2, 3, 4, 5])
+        self.assertIn('ISBN ya existe', resultado.errores[0][1])
+        self.assertEqual(len(self.gestor.obtener_libros()), 3)
+    
+    def test_importacion_masiva_usuarios(self):
+        """Prueba la importación de usuarios con validación de email"""
+        filas = [
+            {'id_usuario': 'U-BULK-1', 'nombre': 'Uno', 'email': 'uno@email.com'},
+            {'id_usuario': 'U-BULK-2', 'nombre': 'Dos', 'email': 'sin-arroba'},
+        ]
+        
+        resultado = self.gestor.registrar_usuarios_bulk(filas)
+        
+        self.assertEqual(resultado.insertados, 1)
+        self.assertEqual(resultado.errores, [(2, 'Email inválido')])
+        self.assertIsNotNone(self.gestor.buscar_usuario_por_id('U-BULK-1'))
+    
+    def test_listados_reutilizan_modelos(self):
+        """Prueba que los listados no se reconstruyan si no hubo cambios"""
+        self.gestor.agregar_libro('978-040', 'Libro A', 'Autor A')
+        self.gestor.registrar_usuario('U-TEST-040', 'Usuario', 'u40@email.com')
+        
+        primero = self.gestor.obtener_libros()
+        self.assertIs(self.gestor.obtener_libros()[0], primero[0])
+        
+        self.gestor.prestar_libro('978-040', 'U-TEST-040')
+        libros = self.gestor.obtener_libros()
+        self.assertFalse(libros[0].disponible)
+        self.assertEqual(len(self.gestor.obtener_prestamos_activos()), 1)
+        
+        self.gestor.devolver_libro('978-040')
+        self.assertEqual(self.gestor.obtener_prestamos_activos(), [])
+    
+    def test_listados_paginados(self):
+        """Prueba la paginación, el filtro y el orden de los listados"""
+        for i in range(5):
+            self.gestor.agregar_libro(f'978-05{i}', f'Libro {4 - i}', 'Autor')
+        self.gestor.registrar_usuario('U-TEST-050', 'Usuario', 'u50@email.com')
+        self.gestor.prestar_libro('978-051', 'U-TEST-050')
+        self.gestor.prestar_libro('978-053', 'U-TEST-050')
+        
+        pagina = self.gestor.listar_libros(offset=1, limite=2, orden='titulo')
+        self.assertEqual(pagina.total, 5)
+        self.assertEqual([l.titulo for l in pagina.elementos], ['Libro 1', 'Libro 2'])
+        
+        pagina = self.gestor.listar_libros(limite=10, filtro={'disponible': True},
+                                           orden='-isbn')
+        self.assertEqual(pagina.total, 3)
+        self.assertEqual([l.isbn for l in pagina.elementos],
+                         ['978-054', '978-052', '978-050'])
+        
+        activos = self.gestor.listar_prestamos_activos(filtro={'id_usuario': 'U-TEST-050'})
+        self.assertEqual(activos.total, 2)
+        self.gestor.devolver_libro('978-051')
+        activos = self.gestor.listar_prestamos_activos(limite=1)
+        self.assertEqual(activos.total, 1)
+        self.assertEqual(activos.elementos[0].isbn_libro, '978-053')
+        
+        self.assertEqual(len(list(self.gestor.iterar_libros())), 5)
+        self.assertEqual(len(list(self.gestor.iterar_prestamos())), 2)
+        devueltos = [p for p in self.gestor.iterar_prestamos() if p.fecha_devolucion]
+        self.assertEqual([p.isbn_libro for p in devueltos], ['978-051'])
+        self.assertEqual(self.gestor.listar_usuarios().total, 1)
+    
+    def test_eventos_de_cambios(self):
+        """Prueba que cada cambio confirmado emita un evento con su clave"""
+        eventos = []
+        self.gestor.suscribir(eventos.append)
+        self.gestor.agregar_libro('978-060', 'Libro', 'Autor')
+        self.gestor.registrar_usuario('U-TEST-060', 'Usuario', 'u60@email.com')
+        self.assertEqual([(e.tipo, e.coleccion, e.clave) for e in eventos],
+                         [('insertado', 'libros', '978-060'),
+                          ('insertado', 'usuarios', 'U-TEST-060')])
+        
+        eventos.clear()
+        self.gestor.prestar_libro('978-060', 'U-TEST-060')
+        self.assertEqual([(e.tipo, e.coleccion) for e in eventos],
+                         [('actualizado', 'libros'), ('insertado', 'prestamos')])
+        self.assertFalse(eventos[0].elemento['disponible'])
+        
+        eventos.clear()
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.actualizar('libros', 'isbn', '978-060', {'titulo': 'Otro'})
+                raise RuntimeError("fallo simulado")
+        self.assertEqual(eventos, [])
+        
+        self.gestor.devolver_libro('978-060')
+        prestamo = next(e for e in eventos if e.coleccion == 'prestamos')
+        self.assertEqual(prestamo.tipo, 'actualizado')
+        self.assertIsNotNone(prestamo.elemento['fecha_devolucion'])
+    
+    def test_buscar_libros_por_texto(self):
+        """Prueba que la búsqueda siga los cambios hechos tras construirla"""
+        self.gestor.agregar_libro('978-070', 'Cálculo Integral', 'Piskunov')
+        self.assertEqual([l.isbn for l in self.gestor.buscar_libros('calculo')], ['978-070'])
+        
+        self.gestor.agregar_libro('978-071', 'Calculus', 'Spivak')
+        self.db.actualizar('libros', 'isbn', '978-070', {'titulo': 'Integrales'})
+        self.assertEqual([l.isbn for l in self.gestor.buscar_libros('calcul')], ['978-071'])
+        
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.actualizar('libros', 'isbn', '978-071', {'titulo': 'Otro'})
+                raise RuntimeError("fallo simulado")
+        self.assertEqual(len(self.gestor.buscar_libros('calculus')), 1)
+        self.assertEqual(self.gestor.buscar_libros('otro'), [])
+    
     def test_validacion_isbn_duplicado(self):
         """Prueba que no se pueda agregar un libro con ISBN duplicado"""
         isbn = '978-003'
@@ -84,6 +299,246 @@ class TestIntegracion(unittest.TestCase):
             self.gestor.registrar_usuario('U-TEST', 'Usuario Test', 'email_invalido')
         
         self.assertIn('Email inválido', str(context.exception))
+    
+    def test_vencimientos_y_recordatorios(self):
+        """Prueba los préstamos vencidos, los que están por vencer y los recordatorios"""
+        for i, dias in enumerate((1, 5, 10)):
+            self.gestor.agregar_libro(f'978-03{i}', f'Libro {i}', 'Autor')
+            self.gestor.registrar_usuario(f'U03{i}', f'Usuario {i}', f'u03{i}@email.com')
+            self.gestor.prestar_libro(f'978-03{i}', f'U03{i}', dias=dias)
+        ahora = datetime.now()
+        
+        self.assertEqual([p.isbn_libro for p in
+                          self.gestor.obtener_prestamos_vencidos(ahora + timedelta(days=3))],
+                         ['978-030'])
+        self.assertEqual([p.isbn_libro for p in self.gestor.obtener_prestamos_por_vencer(
+                              horas=72, ahora=ahora + timedelta(days=3))], ['978-031'])
+        
+        self.gestor.devolver_libro('978-030')
+        recordatorios = self.gestor.generar_recordatorios(ahora + timedelta(days=8))
+        self.assertEqual([(r['id_usuario'], r['email'], r['dias_vencido']) for r in recordatorios],
+                         [('U031', 'u031@email.com', 3)])
+        # Los recordatorios no se guardan, así que repetirlos no hace crecer la base
+        self.assertEqual(self.db.obtener_todos('recordatorios'), [])
+    
+    def test_plazo_de_prestamo_invalido(self):
+        """Prueba que un plazo que no sea un entero positivo se rechace sin prestar"""
+        self.gestor.agregar_libro('978-035', 'Libro', 'Autor')
+        self.gestor.registrar_usuario('U035', 'Usuario', 'u035@email.com')
+        for dias in (0, -3, 1.5, '7', True):
+            with self.subTest(dias=dias):
+                with self.assertRaises(ValueError):
+                    self.gestor.prestar_libro('978-035', 'U035', dias=dias)
+        self.assertTrue(self.gestor.buscar_libro_por_isbn('978-035').disponible)
+    
+    def test_cola_de_reservas(self):
+        """Prueba el orden de la cola, su posición y la asignación al devolver"""
+        self.gestor.agregar_libro('978-040', 'Libro Reservado', 'Autor')
+        for i in range(4):
+            self.gestor.registrar_usuario(f'U04{i}', f'Usuario {i}', f'u04{i}@email.com')
+        
+        with self.assertRaises(ValueError):
+            self.gestor.reservar_libro('978-040', 'U041')
+        self.gestor.prestar_libro('978-040', 'U040')
+        with self.assertRaises(ValueError):
+            self.gestor.reservar_libro('978-040', 'U040')
+        for id_usuario in ('U041', 'U042', 'U043'):
+            self.assertTrue(self.gestor.reservar_libro('978-040', id_usuario))
+        with self.assertRaises(ValueError):
+            self.gestor.reservar_libro('978-040', 'U042')
+        
+        self.assertEqual(self.gestor.posicion_reserva('978-040', 'U043'), 3)
+        vencimiento = datetime.fromisoformat(self.db.prestamo_activo('978-040')['fecha_vencimiento'])
+        self.assertEqual(self.gestor.estimar_disponibilidad('978-040', 'U042'),
+                         vencimiento + timedelta(days=14))
+        
+        self.gestor.cancelar_reserva('978-040', 'U041')
+        self.assertEqual(self.gestor.posicion_reserva('978-040', 'U041'), None)
+        self.assertEqual(self.gestor.posicion_reserva('978-040', 'U043'), 2)
+        self.db.actualizar('usuarios', 'id_usuario', 'U042', {'activo': False})
+        
+        # La reserva del usuario inactivo se cancela y el libro pasa al siguiente
+        self.assertTrue(self.gestor.devolver_libro('978-040'))
+        self.assertEqual(self.db.prestamo_activo('978-040')['id_usuario'], 'U043')
+        self.assertFalse(self.gestor.buscar_libro_por_isbn('978-040').disponible)
+        self.assertEqual(self.gestor.obtener_reservas_usuario('U043'), [])
+        estados = {r['id_usuario']: r['estado'] for r in self.db.obtener_todos('reservas')}
+        self.assertEqual(estados, {'U041': 'cancelada', 'U042': 'cancelada',
+                                   'U043': 'atendida'})
+        
+        # Sin reservas pendientes el libro vuelve a estar disponible
+        self.gestor.devolver_libro('978-040')
+        self.assertTrue(self.gestor.buscar_libro_por_isbn('978-040').disponible)
+    
+    def test_fallo_al_atender_reserva_deshace_la_devolucion(self):
+        """Prueba que si no se puede atender la reserva la devolución no se confirme"""
+        self.gestor.agregar_libro('978-042', 'Libro', 'Autor')
+        for i in range(2):
+            self.gestor.registrar_usuario(f'U06{i}', f'Usuario {i}', f'u06{i}@email.com')
+        self.gestor.prestar_libro('978-042', 'U060')
+        self.gestor.reservar_libro('978-042', 'U061')
+        agregar, actualizar = self.db.agregar, self.db.actualizar
+        fallos = {
+            'prestamo': ('agregar', lambda coleccion, elemento: (
+                coleccion != 'prestamos' and agregar(coleccion, elemento))),
+            'reserva': ('actualizar', lambda coleccion, *args: (
+                coleccion != 'reservas' and actualizar(coleccion, *args))),
+        }
+        for nombre, (metodo, falla) in fallos.items():
+            with self.subTest(fallo=nombre):
+                setattr(self.db, metodo, falla)
+                try:
+                    with self.assertRaises(RuntimeError):
+                        self.gestor.devolver_libro('978-042')
+                finally:
+                    self.db.agregar, self.db.actualizar = agregar, actualizar
+                self.assertEqual(self.db.prestamo_activo('978-042')['id_usuario'], 'U060')
+                self.assertFalse(self.gestor.buscar_libro_por_isbn('978-042').disponible)
+                self.assertEqual(self.gestor.posicion_reserva('978-042', 'U061'), 1)
+    
+    def test_reservas_persisten_al_reabrir(self):
+        """Prueba que la cola de reservas se recupera de disco"""
+        self.gestor.agregar_libro('978-041', 'Libro', 'Autor')
+        for i in range(3):
+            self.gestor.registrar_usuario(f'U05{i}', f'Usuario {i}', f'u05{i}@email.com')
+        self.gestor.prestar_libro('978-041', 'U050')
+        self.gestor.reservar_libro('978-041', 'U051')
+        self.gestor.reservar_libro('978-041', 'U052')
+        self.db.cerrar()
+        
+        self.db = self.crear_db(self.archivo_test)
+        self.gestor = GestorBiblioteca(self.db)
+        self.assertEqual(self.gestor.posicion_reserva('978-041', 'U052'), 2)
+        self.assertEqual([r.id_usuario for r in self.gestor.obtener_reservas_usuario('U051')],
+                         ['U051'])
+        self.gestor.devolver_libro('978-041')
+        self.assertEqual(self.db.prestamo_activo('978-041')['id_usuario'], 'U051')
+        self.assertEqual(self.gestor.posicion_reserva('978-041', 'U052'), 1)
+
+class TestIntegracionSQLite(TestIntegracion):
+    """Repite las pruebas de integración con el almacenamiento SQLite"""
+    
+    crear_db = SQLiteDatabase
+    archivo_test = 'test_biblioteca.db'
+    
+    def test_migracion_desde_json(self):
+        """Prueba la migración de un biblioteca.json existente"""
+        archivo_json = 'test_migracion.json'
+        db_json = Database(archivo_json)
+        gestor_json = GestorBiblioteca(db_json)
+        gestor_json.agregar_libro('978-020', 'Libro JSON', 'Autor JSON')
+        gestor_json.registrar_usuario('U-TEST-020', 'Usuario JSON', 'json@email.com')
+        gestor_json.prestar_libro('978-020', 'U-TEST-020')
+        
+        try:
+            totales = self.db.migrar_desde_json(archivo_json)
+        finally:
+            os.remove(archivo_json)
+            os.remove(archivo_json + '.lock')
+        
+        self.assertEqual(totales, {'libros': 1, 'usuarios': 1, 'prestamos': 1})
+        libro = self.gestor.buscar_libro_por_isbn('978-020')
+        self.assertFalse(libro.disponible)
+        self.assertEqual(len(self.gestor.obtener_prestamos_activos()), 1)
+        
+        self.gestor.devolver_libro('978-020')
+        self.assertTrue(self.gestor.buscar_libro_por_isbn('978-020').disponible)
+    
+    def test_migracion_desde_otros_formatos(self):
+        """Prueba que se migre un archivo guardado en cualquier formato"""
+        for numero, formato in enumerate(('gzip', 'jsonl'), start=21):
+            with self.subTest(formato=formato):
+                archivo_json = f'test_migracion.{formato}'
+                db_json = Database(archivo_json, formato=formato)
+                GestorBiblioteca(db_json).agregar_libro(f'978-0{numero}', 'Libro', 'Autor')
+                db_json.cerrar()
+                try:
+                    totales = self.db.migrar_desde_json(archivo_json)
+                finally:
+                    os.remove(archivo_json)
+                    os.remove(archivo_json + '.lock')
+                
+                self.assertEqual(totales['libros'], 1)
+                self.assertIsNotNone(self.gestor.buscar_libro_por_isbn(f'978-0{numero}'))
+    
+    def test_lecturas_de_otro_hilo_esperan_a_la_transaccion(self):
+        """Prueba que otro hilo no lea los cambios de una transacción sin confirmar"""
+        leidos = []
+        lector = threading.Thread(
+            target=lambda: leidos.append(self.db.buscar('libros', 'isbn', '978-070')))
+        
+        with self.assertRaises(ValueError):
+            with self.db.transaction():
+                self.gestor.agregar_libro('978-070', 'Libro', 'Autor')
+                lector.start()
+                lector.join(0.2)
+                self.assertTrue(lector.is_alive())
+                raise ValueError("deshacer")
+        lector.join(5)
+        self.assertEqual(leidos, [[]])
+    
+    def test_fallo_al_confirmar_deshace_la_transaccion(self):
+        """Prueba que un COMMIT fallido deshaga la transacción y no notifique eventos"""
+        eventos = []
+        self.db.suscribir(eventos.append)
+        # Una clave foránea diferida solo se comprueba al confirmar
+        self.db.conexion.execute('PRAGMA foreign_keys = ON')
+        self.db.conexion.execute('CREATE TEMP TABLE padre (id INTEGER PRIMARY KEY)')
+        self.db.conexion.execute("""CREATE TEMP TABLE hijo (id_padre INTEGER
+            REFERENCES padre(id) DEFERRABLE INITIALLY DEFERRED)""")
+        version = self.db.version('libros')
+        
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.db.transaction():
+                self.gestor.agregar_libro('978-080', 'Libro', 'Autor')
+                self.db.conexion.execute('INSERT INTO hijo VALUES (1)')
+        
+        self.assertFalse(self.db.conexion.in_transaction)
+        self.assertEqual(eventos, [])
+        self.assertNotEqual(self.db.version('libros'), version)
+        self.assertIsNone(self.gestor.buscar_libro_por_isbn('978-080'))
+        # La conexión sigue sirviendo para nuevas transacciones
+        self.gestor.agregar_libro('978-081', 'Libro', 'Autor')
+        self.assertEqual(len(eventos), 1)
+    
+    def test_error_de_sqlite_deshace_la_transaccion(self):
+        """Prueba que un INSERT fallido no deje confirmado el resto de la transacción"""
+        self.gestor.agregar_libro('978-060', 'Libro', 'Autor')
+        self.gestor.registrar_usuario('U060', 'Usuario', 'u060@email.com')
+        self.db.conexion.execute("""CREATE TEMP TRIGGER fallo_prestamo BEFORE INSERT ON prestamos
+            BEGIN SELECT RAISE(ABORT, 'fallo simulado'); END""")
+        
+        with self.assertRaises(sqlite3.Error):
+            self.gestor.prestar_libro('978-060', 'U060')
+        self.assertTrue(self.gestor.buscar_libro_por_isbn('978-060').disponible)
+        self.assertIsNone(self.db.prestamo_activo('978-060'))
+        
+        # Fuera de una transacción el error se registra y se devuelve False
+        with self.assertLogs('database_sqlite', 'ERROR'):
+            self.assertFalse(self.db.agregar('prestamos', {
+                'id_prestamo': 'P1', 'isbn_libro': '978-060', 'id_usuario': 'U060',
+                'fecha_prestamo': '2025-01-01T00:00:00'}))
+    
+    def test_base_anterior_recibe_columnas_nuevas(self):
+        """Prueba que una base creada sin vencimientos se amplíe al abrirla"""
+        archivo = 'test_anterior.db'
+        conexion = sqlite3.connect(archivo)
+        conexion.execute("""CREATE TABLE prestamos (id_prestamo TEXT NOT NULL,
+            isbn_libro TEXT NOT NULL, id_usuario TEXT NOT NULL,
+            fecha_prestamo TEXT NOT NULL, fecha_devolucion TEXT)""")
+        conexion.execute("INSERT INTO prestamos VALUES ('P1', '978-1', 'U1', '2024-01-01', NULL)")
+        conexion.commit()
+        conexion.close()
+        
+        db = SQLiteDatabase(archivo)
+        try:
+            self.assertIsNone(db.prestamo_activo('978-1')['fecha_vencimiento'])
+            self.assertEqual(db.prestamos_por_vencer('2100-01-01'), [])
+        finally:
+            db.cerrar()
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(archivo + sufijo):
+                    os.remove(archivo + sufijo)
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,25 +2,68 @@
 import unittest
 import sys
 import os
+import asyncio
+import http.client
+import json
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database import Database
+from database import Database, DatabaseDiario, DatabaseHistorial
+from database_sqlite import SQLiteDatabase
 from biblioteca import GestorBiblioteca
+from servidor import ServicioBiblioteca, abrir_base
+import metricas
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Proceso que intenta prestar todos los libros a un usuario y escribe
+# cuántos consiguió; recibe el nombre de la base en ``BASES``
+PRESTAR_EN_PROCESO = """
+import sys
+from functools import partial
+from database import Database, DatabaseDiario, DatabaseHistorial
+from database_sqlite import SQLiteDatabase
+from biblioteca import GestorBiblioteca
+BASES = {
+    'Database': Database,
+    'DatabaseDiario': DatabaseDiario,
+    'DatabasePerezosa': partial(Database, perezoso=True),
+    'DatabaseHistorial': DatabaseHistorial,
+    'SQLiteDatabase': SQLiteDatabase,
+}
+gestor = GestorBiblioteca(BASES[sys.argv[1]](sys.argv[2]))
+prestados = 0
+for i in range(int(sys.argv[4])):
+    try:
+        gestor.prestar_libro(f'978-{i}', sys.argv[3])
+        prestados += 1
+    except ValueError:
+        pass
+print(prestados)
+"""
 
 class TestSistema(unittest.TestCase):
     """Pruebas de sistema que verifican el funcionamiento completo"""
     
+    crear_db = Database
+    crear_db_en_proceso = 'Database'
+    archivo_test = 'test_sistema.json'
+    
     def setUp(self):
         """Configuración antes de cada prueba"""
-        self.archivo_test = 'test_sistema.json'
-        self.db = Database(self.archivo_test)
+        self.db = self.crear_db(self.archivo_test)
         self.gestor = GestorBiblioteca(self.db)
     
     def tearDown(self):
         """Limpieza después de cada prueba"""
-        if os.path.exists(self.archivo_test):
-            os.remove(self.archivo_test)
+        self.db.cerrar()
+        for sufijo in ('', '.log', '.lock', '-wal', '-shm', '.historial', '.historial.textos'):
+            if os.path.exists(self.archivo_test + sufijo):
+                os.remove(self.archivo_test + sufijo)
     
     def test_escenario_biblioteca_completo(self):
         """Prueba un escenario completo de uso de la biblioteca"""
@@ -69,7 +112,8 @@ class TestSistema(unittest.TestCase):
         self.gestor.registrar_usuario('U-PERSIST', 'Usuario Persistente', 'persist@email.com')
         
         # Crear nueva instancia de base de datos (simula reinicio)
-        db_nueva = Database(self.archivo_test)
+        db_nueva = self.crear_db(self.archivo_test)
+        self.addCleanup(db_nueva.cerrar)
         gestor_nuevo = GestorBiblioteca(db_nueva)
         
         # Verificar que los datos persisten
@@ -95,6 +139,259 @@ class TestSistema(unittest.TestCase):
         # Error: devolver libro no prestado
         with self.assertRaises(ValueError):
             self.gestor.devolver_libro('978-301')
+    
+    def preparar_libros_y_usuarios(self, libros: int, usuarios: int):
+        """Da de alta los libros 978-<i> y los usuarios U<i>"""
+        for i in range(libros):
+            self.gestor.agregar_libro(f'978-{i}', f'Libro {i}', 'Autor')
+        for i in range(usuarios):
+            self.gestor.registrar_usuario(f'U{i}', f'Usuario {i}', f'u{i}@email.com')
+    
+    def comprobar_un_prestamo_por_libro(self, libros: int):
+        """Verifica en disco que cada libro se prestó exactamente una vez"""
+        db = self.crear_db(self.archivo_test)
+        try:
+            prestamos = db.obtener_todos('prestamos')
+            self.assertEqual(sorted(p['isbn_libro'] for p in prestamos),
+                             sorted(f'978-{i}' for i in range(libros)))
+            for i in range(libros):
+                self.assertFalse(db.buscar('libros', 'isbn', f'978-{i}')[0]['disponible'])
+        finally:
+            db.cerrar()
+    
+    def test_hilos_no_prestan_dos_veces(self):
+        """Prueba que varios hilos sobre el mismo archivo no presten un libro dos veces"""
+        libros, hilos = 10, 8
+        self.preparar_libros_y_usuarios(libros, hilos)
+        
+        def prestar_todos(numero: int) -> int:
+            # Cada hilo abre su propia base, como lo haría otra interfaz
+            gestor = GestorBiblioteca(self.crear_db(self.archivo_test))
+            prestados = 0
+            try:
+                for i in range(libros):
+                    try:
+                        gestor.prestar_libro(f'978-{i}', f'U{numero}')
+                        prestados += 1
+                    except ValueError:
+                        pass
+            finally:
+                gestor.db.cerrar()
+            return prestados
+        
+        with ThreadPoolExecutor(hilos) as ejecutor:
+            prestados = list(ejecutor.map(prestar_todos, range(hilos)))
+        
+        self.assertEqual(sum(prestados), libros)
+        self.comprobar_un_prestamo_por_libro(libros)
+    
+    def test_procesos_no_prestan_dos_veces(self):
+        """Prueba que varios procesos sobre el mismo archivo no presten un libro dos veces"""
+        libros, procesos = 10, 4
+        self.preparar_libros_y_usuarios(libros, procesos)
+        self.db.cerrar()
+        
+        lanzados = [subprocess.Popen(
+            [sys.executable, '-c', PRESTAR_EN_PROCESO, self.crear_db_en_proceso,
+             os.path.abspath(self.archivo_test), f'U{i}', str(libros)],
+            cwd=RAIZ, stdout=subprocess.PIPE, text=True) for i in range(procesos)]
+        prestados = [int(p.communicate(timeout=60)[0]) for p in lanzados]
+        
+        self.assertEqual(sum(prestados), libros)
+        self.comprobar_un_prestamo_por_libro(libros)
+
+class TestSistemaDiario(TestSistema):
+    """Repite las pruebas de sistema con el almacenamiento por diario"""
+    
+    crear_db = DatabaseDiario
+    crear_db_en_proceso = 'DatabaseDiario'
+    
+    def test_compactacion_y_reinicio(self):
+        """Prueba que el estado sobreviva a compactaciones y reinicios"""
+        self.db.umbral_compactacion = 3
+        self.gestor.agregar_libro('978-401', 'Libro A', 'Autor A')
+        self.gestor.agregar_libro('978-402', 'Libro B', 'Autor B')
+        self.gestor.registrar_usuario('U401', 'Usuario', 'u401@email.com')
+        self.gestor.prestar_libro('978-401', 'U401')
+        
+        gestor_nuevo = GestorBiblioteca(DatabaseDiario(self.archivo_test))
+        self.assertEqual(len(gestor_nuevo.obtener_libros()), 2)
+        self.assertFalse(gestor_nuevo.buscar_libro_por_isbn('978-401').disponible)
+        self.assertEqual(len(gestor_nuevo.obtener_prestamos_activos()), 1)
+
+class TestSistemaPerezoso(TestSistema):
+    """Repite las pruebas de sistema con la carga perezosa de colecciones"""
+    
+    crear_db = partial(Database, perezoso=True)
+    crear_db_en_proceso = 'DatabasePerezosa'
+
+class TestSistemaHistorial(TestSistema):
+    """Repite las pruebas de sistema con el historial de préstamos aparte"""
+    
+    crear_db = DatabaseHistorial
+    crear_db_en_proceso = 'DatabaseHistorial'
+
+class TestSistemaSQLite(TestSistema):
+    """Repite las pruebas de sistema con el almacenamiento SQLite"""
+    
+    crear_db = SQLiteDatabase
+    crear_db_en_proceso = 'SQLiteDatabase'
+    archivo_test = 'test_sistema.db'
+
+class TestServidor(unittest.TestCase):
+    """Pruebas de sistema del servicio HTTP"""
+    
+    archivo_test = 'test_servidor.json'
+    
+    def setUp(self):
+        """Arranca el servicio en un puerto libre en segundo plano"""
+        self.db = Database(self.archivo_test)
+        self.servicio = ServicioBiblioteca(GestorBiblioteca(self.db))
+        self.loop = asyncio.new_event_loop()
+        self.hilo = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.hilo.start()
+        self.servidor = asyncio.run_coroutine_threadsafe(
+            self.servicio.iniciar('127.0.0.1', 0), self.loop).result()
+        self.puerto = self.servidor.sockets[0].getsockname()[1]
+    
+    def tearDown(self):
+        """Detiene el servicio y limpia los archivos"""
+        async def detener():
+            self.servidor.close()
+            await self.servidor.wait_closed()
+            await self.servicio.detener()
+        asyncio.run_coroutine_threadsafe(detener(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.hilo.join()
+        self.loop.close()
+        self.db.cerrar()
+        for archivo in (self.archivo_test, self.archivo_test + '.lock'):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+    
+    def pedir(self, metodo, ruta, cuerpo=None):
+        """Hace una petición y devuelve el estado y el JSON de la respuesta"""
+        conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=10)
+        try:
+            datos = cuerpo if isinstance(cuerpo, (str, type(None))) else json.dumps(cuerpo)
+            conexion.request(metodo, ruta, body=datos)
+            respuesta = conexion.getresponse()
+            return respuesta.status, json.loads(respuesta.read())
+        finally:
+            conexion.close()
+    
+    def test_flujo_prestamo_por_http(self):
+        """Prueba el préstamo y la devolución a través de la API"""
+        self.assertEqual(self.pedir('POST', '/libros', {
+            'isbn': '978-201', 'titulo': 'Cálculo', 'autor': 'Autor'})[0], 201)
+        self.assertEqual(self.pedir('POST', '/usuarios', {
+            'id_usuario': 'U201', 'nombre': 'Ana', 'email': 'ana@email.com'})[0], 201)
+        
+        estado, prestamo = self.pedir('POST', '/prestamos',
+                                      {'isbn': '978-201', 'id_usuario': 'U201'})
+        self.assertEqual(estado, 201)
+        self.assertEqual(prestamo['isbn_libro'], '978-201')
+        self.assertFalse(self.pedir('GET', '/libros/978-201')[1]['disponible'])
+        self.assertEqual(self.pedir('GET', '/prestamos?id_usuario=U201')[1]['total'], 1)
+        self.assertEqual(self.pedir('GET', '/libros/buscar?q=calc')[1][0]['isbn'], '978-201')
+        
+        self.assertEqual(self.pedir('POST', '/devoluciones', {'isbn': '978-201'})[0], 200)
+        self.assertEqual(self.pedir('GET', '/libros?disponible=true')[1]['total'], 1)
+        # Los cambios quedan guardados en el archivo
+        self.assertEqual(len(Database(self.archivo_test).obtener_todos('prestamos')), 1)
+    
+    def test_prestamo_se_lee_en_la_misma_escritura(self):
+        """Prueba que la respuesta de un préstamo se lea sin soltar el acceso exclusivo"""
+        self.pedir('POST', '/libros', {'isbn': '978-210', 'titulo': 'Libro', 'autor': 'Autor'})
+        self.pedir('POST', '/usuarios', {
+            'id_usuario': 'U210', 'nombre': 'Ana', 'email': 'ana@email.com'})
+        prestamo_activo = self.db.prestamo_activo
+        escribiendo = []
+        def leer_prestamo(isbn):
+            escribiendo.append(self.servicio._cerrojo._escribiendo)
+            return prestamo_activo(isbn)
+        self.db.prestamo_activo = leer_prestamo
+        
+        estado, prestamo = self.pedir('POST', '/prestamos',
+                                      {'isbn': '978-210', 'id_usuario': 'U210'})
+        self.assertEqual((estado, prestamo['id_usuario']), (201, 'U210'))
+        self.assertTrue(escribiendo[-1])
+    
+    def test_errores_http(self):
+        """Prueba los códigos de estado de las peticiones erróneas"""
+        estado, cuerpo = self.pedir('POST', '/prestamos', {'isbn': 'X', 'id_usuario': 'U'})
+        self.assertEqual((estado, cuerpo['error']), (400, "Libro no encontrado"))
+        self.assertEqual(self.pedir('GET', '/libros/no-existe')[0], 404)
+        self.assertEqual(self.pedir('GET', '/nada')[0], 404)
+        self.assertEqual(self.pedir('DELETE', '/libros')[0], 405)
+        self.assertEqual(self.pedir('POST', '/libros', '{roto')[0], 400)
+        self.assertEqual(self.pedir('GET', '/libros?limite=-1')[0], 400)
+    
+    def test_durabilidad_grupo_no_admitida(self):
+        """Prueba que el servidor rechace el modo de durabilidad por grupos"""
+        with self.assertRaises(ValueError):
+            abrir_base('test_grupo.json', 'grupo')
+        self.assertFalse(os.path.exists('test_grupo.json.lock'))
+    
+    def test_content_length_invalido(self):
+        """Prueba que un Content-Length no numérico o negativo reciba un 400"""
+        for longitud in ('abc', '-5'):
+            with self.subTest(longitud=longitud):
+                conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=10)
+                try:
+                    conexion.putrequest('POST', '/libros')
+                    conexion.putheader('Content-Length', longitud)
+                    conexion.endheaders()
+                    respuesta = conexion.getresponse()
+                    cuerpo = json.loads(respuesta.read())
+                finally:
+                    conexion.close()
+                self.assertEqual((respuesta.status, cuerpo['error']),
+                                 (400, "Content-Length inválido"))
+    
+    def test_metricas_en_formato_prometheus(self):
+        """Prueba que el servicio exponga las métricas de las operaciones"""
+        metricas.registro.activar()
+        self.addCleanup(metricas.registro.reiniciar)
+        self.addCleanup(metricas.registro.activar, False)
+        self.pedir('POST', '/libros', {'isbn': '978-1', 'titulo': 'Libro', 'autor': 'Autor'})
+        
+        conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=10)
+        try:
+            conexion.request('GET', '/metricas')
+            respuesta = conexion.getresponse()
+            texto = respuesta.read().decode('utf-8')
+        finally:
+            conexion.close()
+        self.assertEqual(respuesta.status, 200)
+        self.assertTrue(respuesta.getheader('Content-Type').startswith('text/plain'))
+        self.assertIn('biblioteca_operaciones_total{operacion="agregar_libro"} 1', texto)
+        self.assertIn('# TYPE biblioteca_duracion_segundos histogram', texto)
+    
+    def test_lecturas_se_atienden_a_la_vez(self):
+        """Prueba que dos lecturas lentas se solapen en lugar de esperarse"""
+        # Cada lectura solo termina si la otra llega a la barrera a la vez
+        barrera = threading.Barrier(2, timeout=5)
+        def buscar_lento(isbn):
+            barrera.wait()
+            return None
+        self.servicio.gestor.buscar_libro_por_isbn = buscar_lento
+        
+        with ThreadPoolExecutor(max_workers=2) as hilos:
+            estados = list(hilos.map(lambda isbn: self.pedir('GET', f'/libros/{isbn}')[0],
+                                     ('978-1', '978-2')))
+        self.assertEqual(estados, [404, 404])
+    
+    def test_escrituras_concurrentes(self):
+        """Prueba que las escrituras simultáneas se apliquen todas"""
+        def agregar(i):
+            return self.pedir('POST', '/libros', {
+                'isbn': f'978-3{i:02d}', 'titulo': f'Libro {i}', 'autor': 'Autor'})[0]
+        with ThreadPoolExecutor(max_workers=8) as hilos:
+            estados = list(hilos.map(agregar, range(40)))
+        self.assertEqual(estados, [201] * 40)
+        self.assertEqual(self.pedir('GET', '/libros?limite=1')[1]['total'], 40)
+        self.assertEqual(len(Database(self.archivo_test).obtener_todos('libros')), 40)
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,26 @@
 import unittest
 import sys
 import os
+import io
+import struct
+import threading
+from datetime import datetime, timezone
 
 # Agregar el directorio padre al path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from models import Libro, Usuario, Prestamo
+import formatos
+from database import Database, DatabaseDiario, DatabaseHistorial
+from almacen_prestamos import AlmacenPrestamos
+from importacion import leer_csv, leer_jsonl
+from ejecutor import Ejecutor
+from busqueda import IndiceTexto, palabras
+from identificadores import GeneradorIds, fecha_de
+from metricas import Histograma, instrumentar, registro
+from cache import CacheLRU
+import reportes
+from reportes import Reportes
 
 class TestModels(unittest.TestCase):
     """Pruebas unitarias para los modelos de datos"""
@@ -45,6 +60,764 @@ class TestModels(unittest.TestCase):
         self.assertEqual(prestamo.id_prestamo, 'P001')
         self.assertEqual(prestamo.isbn_libro, '978-123')
         self.assertIsNone(prestamo.fecha_devolucion)
+    
+    def test_modelos_sin_diccionario_por_instancia(self):
+        """Prueba que los modelos usen __slots__ para ahorrar memoria"""
+        for modelo in (Libro('978-1', 'A', 'X'), Usuario('U1', 'A', 'a@email.com'),
+                       Prestamo('P1', '978-1', 'U1', '2025-10-12')):
+            self.assertFalse(hasattr(modelo, '__dict__'))
+
+class TestDatabase(unittest.TestCase):
+    """Pruebas unitarias para la capa de persistencia"""
+    
+    def setUp(self):
+        """Configuración antes de cada prueba"""
+        self.archivo_test = 'test_unitarias.json'
+        self.db = Database(self.archivo_test)
+    
+    def tearDown(self):
+        """Limpieza después de cada prueba"""
+        for archivo in (self.archivo_test, self.archivo_test + '.lock'):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+    
+    def test_buscar_por_clave_usa_indice(self):
+        """Prueba que la búsqueda por clave primaria use el índice"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        self.db.agregar('libros', {'isbn': '978-2', 'titulo': 'B', 'autor': 'X'})
+        
+        self.assertIn('978-2', self.db.indices['libros'])
+        resultados = self.db.buscar('libros', 'isbn', '978-2')
+        self.assertEqual(len(resultados), 1)
+        self.assertEqual(resultados[0]['titulo'], 'B')
+        self.assertEqual(self.db.buscar('libros', 'isbn', '978-9'), [])
+    
+    def test_buscar_por_campo_sin_indice(self):
+        """Prueba que los campos no indexados sigan funcionando"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        self.db.agregar('libros', {'isbn': '978-2', 'titulo': 'B', 'autor': 'X'})
+        
+        self.assertEqual(len(self.db.buscar('libros', 'autor', 'X')), 2)
+    
+    def test_actualizar_cambio_de_clave(self):
+        """Prueba que el índice se mantenga al cambiar la clave primaria"""
+        self.db.agregar('usuarios', {'id_usuario': 'U1', 'nombre': 'Ana'})
+        self.db.actualizar('usuarios', 'id_usuario', 'U1', {'id_usuario': 'U2'})
+        
+        self.assertEqual(self.db.buscar('usuarios', 'id_usuario', 'U1'), [])
+        self.assertEqual(self.db.buscar('usuarios', 'id_usuario', 'U2')[0]['nombre'], 'Ana')
+    
+    def test_indices_se_reconstruyen_al_cargar(self):
+        """Prueba que los índices se reconstruyan al abrir el archivo"""
+        self.db.agregar('prestamos', {'id_prestamo': 'P1', 'isbn_libro': '978-1'})
+        
+        db_nueva = Database(self.archivo_test)
+        self.assertEqual(db_nueva.buscar('prestamos', 'id_prestamo', 'P1')[0]['isbn_libro'], '978-1')
+    
+    def test_indice_prestamos_activos(self):
+        """Prueba el índice de préstamos activos por ISBN y por usuario"""
+        self.db.agregar('prestamos', {'id_prestamo': 'P1', 'isbn_libro': '978-1',
+                                      'id_usuario': 'U1', 'fecha_devolucion': None})
+        self.db.agregar('prestamos', {'id_prestamo': 'P2', 'isbn_libro': '978-2',
+                                      'id_usuario': 'U1', 'fecha_devolucion': None})
+        
+        self.assertEqual(self.db.prestamo_activo('978-1')['id_prestamo'], 'P1')
+        self.assertEqual(len(self.db.prestamos_activos('U1')), 2)
+        
+        self.db.actualizar('prestamos', 'id_prestamo', 'P1',
+                           {'fecha_devolucion': '2025-10-13T10:00:00'})
+        
+        self.assertIsNone(self.db.prestamo_activo('978-1'))
+        self.assertEqual([p['id_prestamo'] for p in self.db.prestamos_activos()], ['P2'])
+        
+        db_nueva = Database(self.archivo_test)
+        self.assertEqual([p['id_prestamo'] for p in db_nueva.prestamos_activos('U1')], ['P2'])
+    
+    def test_prestamos_activos_repetidos_de_un_libro(self):
+        """Prueba que datos antiguos con dos préstamos activos de un libro sigan siendo coherentes"""
+        self.db.agregar('prestamos', {'id_prestamo': 'P1', 'isbn_libro': '978-1',
+                                      'id_usuario': 'U1', 'fecha_devolucion': None})
+        with self.assertLogs('database', 'WARNING'):
+            self.db.agregar('prestamos', {'id_prestamo': 'P2', 'isbn_libro': '978-1',
+                                          'id_usuario': 'U2', 'fecha_devolucion': None})
+        
+        self.assertEqual(self.db.prestamo_activo('978-1')['id_prestamo'], 'P1')
+        self.assertEqual(len(self.db.prestamos_activos()), 2)
+        
+        # Al cerrar el primero, el otro pasa a ser el activo del libro
+        self.db.actualizar('prestamos', 'id_prestamo', 'P1',
+                           {'fecha_devolucion': '2025-10-13T10:00:00'})
+        self.assertEqual(self.db.prestamo_activo('978-1')['id_prestamo'], 'P2')
+        self.db.actualizar('prestamos', 'id_prestamo', 'P2',
+                           {'fecha_devolucion': '2025-10-13T11:00:00'})
+        self.assertIsNone(self.db.prestamo_activo('978-1'))
+        self.assertEqual(self.db.prestamos_activos(), [])
+    
+    def test_transaccion_escribe_una_vez(self):
+        """Prueba que una transacción persista todos sus cambios juntos"""
+        escrituras = []
+        guardar_original = self.db.guardar_datos
+        self.db.guardar_datos = lambda: escrituras.append(1) or guardar_original()
+        
+        with self.db.transaction():
+            self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+            self.db.actualizar('libros', 'isbn', '978-1', {'disponible': False})
+            self.assertEqual(escrituras, [])
+        
+        self.assertEqual(len(escrituras), 1)
+        self.assertFalse(Database(self.archivo_test).buscar('libros', 'isbn', '978-1')[0]['disponible'])
+    
+    def test_transaccion_revierte_si_falla(self):
+        """Prueba que una excepción descarte los cambios de la transacción"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.actualizar('libros', 'isbn', '978-1', {'titulo': 'B'})
+                self.db.agregar('libros', {'isbn': '978-2', 'titulo': 'C', 'autor': 'X'})
+                raise RuntimeError("fallo simulado")
+        
+        self.assertEqual(self.db.buscar('libros', 'isbn', '978-1')[0]['titulo'], 'A')
+        self.assertEqual(self.db.buscar('libros', 'isbn', '978-2'), [])
+    
+    def test_modo_perezoso_carga_bajo_demanda(self):
+        """Prueba que el modo perezoso lea cada colección al usarla"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        self.db.agregar('prestamos', {'id_prestamo': 'P1', 'isbn_libro': '978-1',
+                                      'id_usuario': 'U1', 'fecha_devolucion': None})
+        self.db.agregar('notas', {'texto': 'colección sin índice'})
+        
+        db_perezosa = Database(self.archivo_test, perezoso=True)
+        self.assertEqual(db_perezosa.datos, {})
+        
+        self.assertEqual(len(db_perezosa.obtener_todos('libros')), 1)
+        self.assertEqual(list(db_perezosa.datos), ['libros'])
+        
+        historial = list(db_perezosa.iterar('prestamos'))
+        self.assertEqual(historial[0]['id_prestamo'], 'P1')
+        self.assertNotIn('prestamos', db_perezosa.datos)
+        
+        self.assertEqual(db_perezosa.prestamo_activo('978-1')['id_prestamo'], 'P1')
+    
+    def test_modo_perezoso_conserva_colecciones_al_guardar(self):
+        """Prueba que guardar en modo perezoso no pierda colecciones sin usar"""
+        self.db.agregar('usuarios', {'id_usuario': 'U1', 'nombre': 'Ana'})
+        self.db.agregar('notas', {'texto': 'colección sin índice'})
+        
+        db_perezosa = Database(self.archivo_test, perezoso=True)
+        db_perezosa.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        
+        db_nueva = Database(self.archivo_test)
+        self.assertEqual(len(db_nueva.obtener_todos('usuarios')), 1)
+        self.assertEqual(len(db_nueva.obtener_todos('notas')), 1)
+        self.assertEqual(len(db_nueva.obtener_todos('libros')), 1)
+    
+    def test_formatos_se_detectan_al_cargar(self):
+        """Prueba guardar en cada formato y volver a abrir sin indicarlo"""
+        for formato in ('json', 'json-legible', 'jsonl', 'gzip'):
+            with self.subTest(formato=formato):
+                db = Database(self.archivo_test, formato=formato)
+                db.agregar('libros', {'isbn': formato, 'titulo': 'Cálculo', 'autor': 'X'})
+                
+                db_nueva = Database(self.archivo_test)
+                self.assertEqual(db_nueva.formato, formato if formato != 'json-legible' else 'json')
+                libros = db_nueva.buscar('libros', 'isbn', formato)
+                self.assertEqual(libros[0]['titulo'], 'Cálculo')
+                
+                db_perezosa = Database(self.archivo_test, perezoso=True)
+                self.assertEqual(len(list(db_perezosa.iterar('libros'))),
+                                 len(db_nueva.obtener_todos('libros')))
+    
+    def test_gzip_corrupto_se_trata_como_vacio(self):
+        """Prueba que un gzip dañado se abra como un archivo corrupto más"""
+        Database(self.archivo_test, formato='gzip').agregar(
+            'libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        with open(self.archivo_test, 'rb') as f:
+            original = f.read()
+        danados = {'crc': original[:-8] + b'\x00' * 8,
+                   'datos': original[:10] + b'\x00' * 8 + original[18:]}
+        for nombre, datos in danados.items():
+            with self.subTest(dano=nombre):
+                with open(self.archivo_test, 'wb') as f:
+                    f.write(datos)
+                self.assertEqual(Database(self.archivo_test).obtener_todos('libros'), [])
+                self.assertEqual(list(Database(self.archivo_test, perezoso=True)
+                                      .obtener_todos('libros')), [])
+    
+    def test_jsonl_truncado_se_trata_como_vacio(self):
+        """Prueba que una colección jsonl con menos filas de las anunciadas se abra como corrupta"""
+        with open(self.archivo_test, 'w', encoding='utf-8') as f:
+            f.write('{"coleccion":"libros","total":3}\n'
+                    '{"isbn":"978-1","titulo":"A","autor":"X"}\n')
+        with self.assertRaisesRegex(ValueError, 'truncado'):
+            formatos.leer(self.archivo_test, 'jsonl')
+        self.assertEqual(Database(self.archivo_test).obtener_todos('libros'), [])
+        self.assertEqual(list(Database(self.archivo_test, perezoso=True)
+                              .obtener_todos('libros')), [])
+    
+    @unittest.skipIf(formatos.msgpack is None, "msgpack no está instalado")
+    def test_formato_msgpack(self):
+        """Prueba la instantánea binaria MessagePack"""
+        db = Database(self.archivo_test, formato='msgpack')
+        db.agregar('libros', {'isbn': '978-1', 'titulo': 'Cálculo', 'autor': 'X'})
+        
+        db_nueva = Database(self.archivo_test, perezoso=True)
+        self.assertEqual(db_nueva.buscar('libros', 'isbn', '978-1')[0]['titulo'], 'Cálculo')
+        self.assertEqual(db_nueva.formato, 'msgpack')
+    
+    def test_json_compacto_por_defecto(self):
+        """Prueba que por defecto se guarde JSON sin sangría"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        with open(self.archivo_test, encoding='utf-8') as f:
+            self.assertNotIn('\n', f.read())
+    
+    def test_formato_desconocido(self):
+        """Prueba que un formato no soportado se rechace"""
+        with self.assertRaises(ValueError):
+            Database(self.archivo_test, formato='xml')
+    
+    def test_modo_grupo_junta_escrituras(self):
+        """Prueba que en modo grupo varias escrituras simultáneas se guarden juntas"""
+        db = Database(self.archivo_test, durabilidad='grupo', ventana_grupo=0.05)
+        escrituras = []
+        guardar_original = db.guardar_datos
+        db.guardar_datos = lambda: escrituras.append(1) or guardar_original()
+        resultados = []
+        
+        def agregar(i):
+            resultados.append(db.agregar('libros', {'isbn': f'978-{i}', 'titulo': 'A',
+                                                    'autor': 'X'}))
+        hilos = [threading.Thread(target=agregar, args=(i,)) for i in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        
+        self.assertEqual(resultados, [True] * 8)
+        self.assertLess(len(escrituras), 8)
+        self.assertEqual(len(Database(self.archivo_test).obtener_todos('libros')), 8)
+    
+    def test_modo_periodico_guarda_al_volcar(self):
+        """Prueba que en modo periódico los cambios esperen a flush o cerrar"""
+        with self.assertRaises(ValueError):
+            Database(self.archivo_test, durabilidad='nunca')
+        db = Database(self.archivo_test, durabilidad='periodico', intervalo_volcado=60)
+        db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        self.assertFalse(os.path.exists(self.archivo_test))
+        
+        # Revertir una transacción no descarta lo pendiente de guardar
+        with self.assertRaises(RuntimeError):
+            with db.transaction():
+                db.agregar('libros', {'isbn': '978-2', 'titulo': 'B', 'autor': 'X'})
+                raise RuntimeError("fallo simulado")
+        self.assertEqual([l['isbn'] for l in db.obtener_todos('libros')], ['978-1'])
+        
+        self.assertTrue(db.flush())
+        self.assertEqual(len(Database(self.archivo_test).obtener_todos('libros')), 1)
+        db.agregar('libros', {'isbn': '978-3', 'titulo': 'C', 'autor': 'X'})
+        db.cerrar()
+        self.assertEqual([l['isbn'] for l in Database(self.archivo_test).obtener_todos('libros')],
+                         ['978-1', '978-3'])
+
+class TestDatabaseDiario(unittest.TestCase):
+    """Pruebas unitarias para el almacenamiento por diario"""
+    
+    def setUp(self):
+        """Configuración antes de cada prueba"""
+        self.archivo_test = 'test_unitarias_diario.json'
+        self.db = DatabaseDiario(self.archivo_test)
+    
+    def tearDown(self):
+        """Limpieza después de cada prueba"""
+        for archivo in (self.archivo_test, self.archivo_test + '.log',
+                        self.archivo_test + '.lock'):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+    
+    def test_cambios_se_anaden_al_diario(self):
+        """Prueba que los cambios no reescriban la instantánea"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        self.db.actualizar('libros', 'isbn', '978-1', {'titulo': 'B'})
+        
+        self.assertFalse(os.path.exists(self.archivo_test))
+        with open(self.archivo_test + '.log', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+        
+        db_nueva = DatabaseDiario(self.archivo_test)
+        self.assertEqual(db_nueva.buscar('libros', 'isbn', '978-1')[0]['titulo'], 'B')
+    
+    def test_linea_incompleta_se_descarta(self):
+        """Prueba que una escritura interrumpida no impida abrir la base"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        with open(self.archivo_test + '.log', 'a', encoding='utf-8') as f:
+            f.write('{"n": 2, "op": "agre')
+        
+        db_nueva = DatabaseDiario(self.archivo_test)
+        self.assertEqual(len(db_nueva.obtener_todos('libros')), 1)
+        db_nueva.agregar('libros', {'isbn': '978-2', 'titulo': 'B', 'autor': 'X'})
+        self.assertEqual(len(DatabaseDiario(self.archivo_test).obtener_todos('libros')), 2)
+    
+    def test_compactacion_interrumpida_no_duplica(self):
+        """Prueba que los registros ya compactados no se apliquen dos veces"""
+        self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        # Instantánea escrita pero diario sin vaciar
+        self.db.guardar_datos()
+        
+        db_nueva = DatabaseDiario(self.archivo_test)
+        self.assertEqual(len(db_nueva.obtener_todos('libros')), 1)
+    
+    def test_transaccion_anade_un_bloque(self):
+        """Prueba que una transacción se escriba en el diario de una vez"""
+        with self.db.transaction():
+            self.db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+            self.db.agregar('libros', {'isbn': '978-2', 'titulo': 'B', 'autor': 'X'})
+            self.assertFalse(os.path.exists(self.archivo_test + '.log'))
+        
+        self.assertEqual(len(DatabaseDiario(self.archivo_test).obtener_todos('libros')), 2)
+
+class TestDatabaseHistorial(unittest.TestCase):
+    """Pruebas unitarias para el historial de préstamos en registros fijos"""
+    
+    def setUp(self):
+        """Configuración antes de cada prueba"""
+        self.archivo_test = 'test_unitarias_historial.json'
+        self.db = DatabaseHistorial(self.archivo_test)
+    
+    def tearDown(self):
+        """Limpieza después de cada prueba"""
+        self.db.cerrar()
+        for sufijo in ('', '.lock', '.historial', '.historial.textos'):
+            if os.path.exists(self.archivo_test + sufijo):
+                os.remove(self.archivo_test + sufijo)
+    
+    def prestamo(self, numero: int, **campos):
+        """Préstamo cerrado de ejemplo"""
+        return {'id_prestamo': f'P{numero}', 'isbn_libro': f'978-{numero % 3}',
+                'id_usuario': 'U1', 'fecha_prestamo': '2024-01-01T10:00:00',
+                'fecha_devolucion': '2024-01-15T10:00:00',
+                'fecha_vencimiento': '2024-01-15T10:00:00', **campos}
+    
+    def test_almacen_conserva_los_valores(self):
+        """Prueba que los registros se lean igual que se escribieron"""
+        prestamos = [self.prestamo(1), self.prestamo(2, id_usuario=None),
+                     self.prestamo(3, id_prestamo='P-' + 'x' * 40, fecha_prestamo=''),
+                     self.prestamo(4, id_usuario='Usuario ñandú', notas='frágil')]
+        almacen = self.db.historial
+        self.assertTrue(almacen.anadir(prestamos))
+        
+        self.assertEqual(list(almacen), prestamos)
+        self.assertEqual([p['id_prestamo'] for p in almacen.buscar('isbn_libro', '978-1')],
+                         ['P1', 'P4'])
+        self.assertEqual(list(almacen.buscar('id_prestamo', 'P-' + 'x' * 40)), [prestamos[2]])
+        self.assertEqual(list(almacen.buscar('notas', 'frágil')), [prestamos[3]])
+        self.assertEqual(list(almacen.buscar('id_usuario', 'U9')), [])
+        
+        # Otro lector del mismo archivo ve lo mismo
+        lector = AlmacenPrestamos(almacen.ruta)
+        lector.abrir(len(almacen))
+        self.assertEqual(list(lector), prestamos)
+    
+    def test_almacen_de_la_version_anterior(self):
+        """Prueba que un historial sin vencimientos se siga leyendo y ampliando"""
+        self.db.cerrar()
+        with open(self.db.historial.ruta, 'wb') as f:
+            f.write(struct.pack('<8sII', b'HISTPRST', 1, 32 * 3 + 4 * 3))
+        almacen = AlmacenPrestamos(self.db.historial.ruta)
+        almacen.abrir(0)
+        self.assertEqual(almacen.version, 1)
+        
+        self.assertTrue(almacen.anadir([self.prestamo(1)]))
+        self.assertEqual(list(almacen), [self.prestamo(1)])
+        self.assertEqual(list(almacen.buscar('fecha_vencimiento', '2024-01-15T10:00:00')),
+                         [self.prestamo(1)])
+        almacen.cerrar()
+    
+    def test_prestamos_cerrados_pasan_al_historial(self):
+        """Prueba que al cerrar un préstamo salga del JSON y de la memoria"""
+        self.db.agregar('prestamos', {**self.prestamo(1), 'fecha_devolucion': None})
+        self.db.agregar('prestamos', self.prestamo(2))
+        self.assertEqual(len(self.db.historial), 1)
+        self.db.actualizar('prestamos', 'id_prestamo', 'P1',
+                           {'fecha_devolucion': '2024-02-01T10:00:00'})
+        
+        self.assertEqual(self.db.datos['prestamos'], [])
+        self.assertEqual(len(self.db.historial), 2)
+        self.assertFalse(self.db.actualizar('prestamos', 'id_prestamo', 'P1', {'id_usuario': 'U2'}))
+        with open(self.archivo_test, encoding='utf-8') as f:
+            self.assertNotIn('P1', f.read())
+        
+        db_nueva = DatabaseHistorial(self.archivo_test)
+        self.assertEqual([p['id_prestamo'] for p in db_nueva.iterar('prestamos')], ['P2', 'P1'])
+        self.assertEqual(db_nueva.buscar('prestamos', 'id_prestamo', 'P1')[0]['fecha_devolucion'],
+                         '2024-02-01T10:00:00')
+        db_nueva.cerrar()
+    
+    def test_guardado_interrumpido_se_descarta(self):
+        """Prueba que el historial no incluya lo que el JSON no llegó a registrar"""
+        self.db.agregar('prestamos', self.prestamo(1))
+        # Caída entre añadir al historial y guardar el JSON
+        self.db.historial.anadir([self.prestamo(2)])
+        
+        db_nueva = DatabaseHistorial(self.archivo_test)
+        self.assertEqual([p['id_prestamo'] for p in db_nueva.obtener_todos('prestamos')], ['P1'])
+        db_nueva.agregar('prestamos', self.prestamo(3))
+        db_nueva.cerrar()
+        self.assertEqual([p['id_prestamo'] for p in
+                          DatabaseHistorial(self.archivo_test).obtener_todos('prestamos')],
+                         ['P1', 'P3'])
+    
+    def test_traslada_los_cerrados_de_un_json_existente(self):
+        """Prueba que los préstamos cerrados de un JSON normal pasen al historial"""
+        db_json = Database(self.archivo_test)
+        db_json.agregar('prestamos', self.prestamo(1))
+        db_json.agregar('prestamos', {**self.prestamo(2), 'fecha_devolucion': None})
+        
+        db = DatabaseHistorial(self.archivo_test)
+        self.assertEqual(len(db.obtener_todos('prestamos')), 2)
+        self.assertTrue(db.guardar_datos())
+        self.assertEqual(len(db.historial), 1)
+        self.assertEqual([p['id_prestamo'] for p in db.datos['prestamos']], ['P2'])
+        db.cerrar()
+
+class TestImportacion(unittest.TestCase):
+    """Pruebas unitarias para los lectores de importación"""
+    
+    def test_leer_csv(self):
+        """Prueba la lectura de filas desde un CSV con encabezado"""
+        archivo = io.StringIO('isbn,titulo,autor\n978-1,Cálculo,Baldor\n978-2,Álgebra,Baldor\n')
+        filas = list(leer_csv(archivo))
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[0], {'isbn': '978-1', 'titulo': 'Cálculo', 'autor': 'Baldor'})
+    
+    def test_leer_jsonl_con_linea_invalida(self):
+        """Prueba que una línea inválida no detenga la lectura"""
+        archivo = io.StringIO('{"isbn": "978-1"}\n{roto\n\n{"isbn": "978-2"}\n')
+        filas = list(leer_jsonl(archivo))
+        self.assertEqual(filas, [{'isbn': '978-1'}, None, {'isbn': '978-2'}])
+
+class TestEjecutor(unittest.TestCase):
+    """Pruebas unitarias para el ejecutor en segundo plano"""
+    
+    def setUp(self):
+        self.ejecutor = Ejecutor()
+    
+    def test_resultados_y_errores_vuelven_al_procesar(self):
+        """Prueba que los avisos solo se ejecuten al llamar a procesar"""
+        resultados, errores = [], []
+        self.ejecutor.enviar(sum, [1, 2], al_terminar=resultados.append)
+        self.ejecutor.enviar(int, 'x', al_fallar=errores.append)
+        self.ejecutor.cerrar()
+        
+        self.assertTrue(self.ejecutor.ocupado)
+        self.assertEqual(resultados, [])
+        self.assertEqual(self.ejecutor.procesar(), 2)
+        self.assertEqual(resultados, [3])
+        self.assertIsInstance(errores[0], ValueError)
+        self.assertFalse(self.ejecutor.ocupado)
+    
+    def test_aviso_que_falla_no_detiene_los_demas(self):
+        """Prueba que un aviso que lanza una excepción se registre sin perder el resto"""
+        resultados = []
+        self.ejecutor.enviar(sum, [1, 2], al_terminar=lambda _: 1 / 0)
+        self.ejecutor.enviar(sum, [3, 4], al_terminar=resultados.append)
+        self.ejecutor.cerrar()
+        
+        with self.assertLogs('ejecutor', 'ERROR'):
+            self.assertEqual(self.ejecutor.procesar(), 2)
+        self.assertEqual(resultados, [7])
+        self.assertFalse(self.ejecutor.ocupado)
+    
+    def test_agrupa_tareas_con_la_misma_clave(self):
+        """Prueba que las peticiones repetidas en cola se ejecuten una vez"""
+        liberar = threading.Event()
+        llamadas = []
+        self.ejecutor.enviar(liberar.wait)
+        for i in range(3):
+            self.ejecutor.enviar(llamadas.append, i, clave='refrescar')
+        liberar.set()
+        self.ejecutor.cerrar()
+        self.ejecutor.procesar()
+        
+        self.assertEqual(llamadas, [2])
+
+class TestBusqueda(unittest.TestCase):
+    """Pruebas unitarias para el índice de búsqueda de texto"""
+    
+    def setUp(self):
+        self.indice = IndiceTexto()
+        self.indice.agregar('1', {'titulo': 'Cálculo Diferencial', 'autor': 'Baldor'})
+        self.indice.agregar('2', {'titulo': 'Álgebra', 'autor': 'Aurelio Baldor'})
+        self.indice.agregar('3', {'titulo': 'Historia del cálculo', 'autor': 'Boyer'})
+    
+    def test_palabras_sin_tildes_ni_palabras_vacias(self):
+        """Prueba la normalización de un texto en palabras"""
+        self.assertEqual(palabras('Historia DEL Cálculo, cálculo'), ['historia', 'calculo'])
+    
+    def test_busqueda_sin_tildes_y_por_prefijo(self):
+        """Prueba que la búsqueda ignore tildes y admita prefijos"""
+        self.assertEqual(sorted(self.indice.buscar('calculo')), ['1', '3'])
+        self.assertEqual(sorted(self.indice.buscar('CÁLC')), ['1', '3'])
+        self.assertEqual(self.indice.buscar('calc dif'), ['1'])
+        self.assertEqual(self.indice.buscar('calculo newton'), [])
+    
+    def test_ranking_por_campo(self):
+        """Prueba que una coincidencia en el título pese más que en el autor"""
+        self.indice.agregar('4', {'titulo': 'Ejercicios', 'autor': 'Álgebra Pérez'})
+        self.assertEqual(self.indice.buscar('algebra'), ['2', '4'])
+        self.assertEqual(self.indice.buscar('baldor', limite=1), ['1'])
+    
+    def test_reindexar_y_quitar(self):
+        """Prueba que reemplazar o quitar un documento actualice el índice"""
+        self.indice.agregar('1', {'titulo': 'Geometría', 'autor': 'Baldor'})
+        self.assertEqual(self.indice.buscar('calculo'), ['3'])
+        self.assertEqual(self.indice.buscar('geometria'), ['1'])
+        self.indice.quitar('3')
+        self.assertEqual(self.indice.buscar('calculo'), [])
+        self.assertEqual(len(self.indice), 2)
+
+class TestIdentificadores(unittest.TestCase):
+    """Pruebas unitarias para el generador de identificadores"""
+    
+    def test_un_millon_sin_repetir_y_en_orden(self):
+        """Prueba que los identificadores no se repitan y salgan ordenados"""
+        generador = GeneradorIds('P-')
+        ids = [generador.nuevo() for _ in range(1_000_000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertTrue(all(len(i) == 28 and i.startswith('P-') for i in ids[:10]))
+    
+    def test_fecha_codificada(self):
+        """Prueba que el identificador lleve su momento de creación"""
+        antes = datetime.now(timezone.utc).replace(microsecond=0)
+        fecha = fecha_de(GeneradorIds('P-').nuevo())
+        self.assertLessEqual(antes, fecha)
+        self.assertLess((fecha - antes).total_seconds(), 5)
+    
+    def test_hilos_no_repiten(self):
+        """Prueba que varios hilos con el mismo generador no repitan"""
+        generador = GeneradorIds()
+        por_hilo = [[] for _ in range(8)]
+        
+        def generar(ids):
+            for _ in range(50_000):
+                ids.append(generador.nuevo())
+        
+        hilos = [threading.Thread(target=generar, args=(ids,)) for ids in por_hilo]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        
+        todos = [i for ids in por_hilo for i in ids]
+        self.assertEqual(len(set(todos)), len(todos))
+        for ids in por_hilo:
+            self.assertEqual(ids, sorted(ids))
+    
+    @unittest.skipUnless(hasattr(os, 'fork'), "requiere fork")
+    def test_procesos_hijos_no_repiten(self):
+        """Prueba que un proceso hijo no continúe la secuencia de su padre"""
+        generador = GeneradorIds()
+        generador.nuevo()
+        lectura, escritura = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(lectura)
+            with os.fdopen(escritura, 'w') as f:
+                f.write('\n'.join(generador.nuevo() for _ in range(50_000)))
+            os._exit(0)
+        os.close(escritura)
+        del_padre = [generador.nuevo() for _ in range(50_000)]
+        with os.fdopen(lectura) as f:
+            del_hijo = f.read().split('\n')
+        os.waitpid(pid, 0)
+        self.assertEqual(len(del_hijo), 50_000)
+        self.assertFalse(set(del_padre) & set(del_hijo))
+
+class TestMetricas(unittest.TestCase):
+    """Pruebas unitarias para el registro de métricas"""
+    
+    def setUp(self):
+        registro.reiniciar()
+        registro.activar()
+        self.archivo_test = 'test_metricas.json'
+    
+    def tearDown(self):
+        registro.activar(False)
+        registro.perfilar('operacion', False)
+        registro.reiniciar()
+        for archivo in (self.archivo_test, self.archivo_test + '.lock'):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+    
+    def test_cuenta_llamadas_errores_y_duracion(self):
+        """Prueba que una operación instrumentada se registre"""
+        @instrumentar('operacion')
+        def operacion(fallar):
+            if fallar:
+                raise ValueError("fallo")
+            return 42
+        
+        self.assertEqual(operacion(False), 42)
+        with self.assertRaises(ValueError):
+            operacion(True)
+        
+        estadisticas = registro.estadisticas()
+        self.assertEqual(estadisticas['operaciones_total']['operacion'], 2)
+        self.assertEqual(estadisticas['errores_total']['operacion'], 1)
+        self.assertEqual(estadisticas['duracion_segundos']['operacion']['cuenta'], 2)
+    
+    def test_desactivado_no_registra(self):
+        """Prueba que con el registro desactivado no se anote nada"""
+        registro.activar(False)
+        db = Database(self.archivo_test)
+        db.agregar('libros', {'isbn': '978-1', 'titulo': 'A', 'autor': 'X'})
+        db.buscar('libros', 'autor', 'X')
+        self.assertEqual(registro.estadisticas(), {})
+    
+    def test_bytes_guardados_y_elementos_recorridos(self):
+        """Prueba las métricas propias de Database"""
+        db = Database(self.archivo_test)
+        for i in range(3):
+            db.agregar('libros', {'isbn': f'978-{i}', 'titulo': 'A', 'autor': 'X'})
+        db.buscar('libros', 'autor', 'X')
+        db.buscar('libros', 'isbn', '978-1')
+        
+        estadisticas = registro.estadisticas()
+        guardados = estadisticas['bytes_guardados']['guardar_datos']
+        self.assertEqual(guardados['cuenta'], 3)
+        self.assertGreater(guardados['suma'], 0)
+        recorridos = estadisticas['elementos_recorridos']['libros']
+        self.assertEqual((recorridos['cuenta'], recorridos['suma']), (2, 4))
+    
+    def test_prometheus(self):
+        """Prueba el volcado en formato de texto de Prometheus"""
+        registro.contar('operaciones_total', 'prestar_libro', 3)
+        registro.observar('duracion_segundos', 'prestar_libro', 0.003)
+        texto = registro.prometheus()
+        self.assertIn('# TYPE biblioteca_operaciones_total counter', texto)
+        self.assertIn('biblioteca_operaciones_total{operacion="prestar_libro"} 3', texto)
+        self.assertIn('biblioteca_duracion_segundos_bucket'
+                      '{operacion="prestar_libro",le="0.0025"} 0', texto)
+        self.assertIn('biblioteca_duracion_segundos_bucket'
+                      '{operacion="prestar_libro",le="0.005"} 1', texto)
+        self.assertIn('biblioteca_duracion_segundos_count{operacion="prestar_libro"} 1', texto)
+    
+    def test_percentiles_del_histograma(self):
+        """Prueba la estimación de percentiles por cubetas"""
+        histograma = Histograma([1, 10, 100])
+        for valor in [0.5] * 90 + [50] * 10:
+            histograma.observar(valor)
+        self.assertEqual(histograma.percentil(0.5), 1)
+        self.assertEqual(histograma.percentil(0.99), 100)
+    
+    def test_perfilar_una_operacion(self):
+        """Prueba que cProfile se active solo alrededor de la operación elegida"""
+        def calculo_lento():
+            return sum(range(1000))
+        
+        @instrumentar('operacion')
+        def operacion():
+            return calculo_lento()
+        
+        registro.perfilar('operacion')
+        operacion()
+        self.assertIn('calculo_lento', registro.informe_perfil('operacion'))
+        self.assertEqual(registro.informe_perfil('otra'), '')
+
+class TestCacheLRU(unittest.TestCase):
+    """Pruebas unitarias para la caché LRU"""
+    
+    def test_expulsa_el_menos_usado(self):
+        """Prueba que al llenarse se expulse lo usado hace más tiempo"""
+        cache = CacheLRU(2)
+        cache.guardar('a', 1)
+        cache.guardar('b', 2)
+        cache.obtener('a')
+        cache.guardar('c', 3)
+        self.assertIsNone(cache.obtener('b'))
+        self.assertEqual((cache.obtener('a'), cache.obtener('c')), (1, 3))
+        self.assertEqual(len(cache), 2)
+    
+    def test_cuenta_aciertos_y_fallos(self):
+        """Prueba los contadores y el descarte de claves"""
+        cache = CacheLRU(10)
+        cache.guardar('a', 1)
+        cache.obtener('a')
+        cache.descartar('a')
+        cache.obtener('a')
+        self.assertEqual(cache.estadisticas(),
+                         {'elementos': 0, 'capacidad': 10, 'aciertos': 1, 'fallos': 1})
+        with self.assertRaises(ValueError):
+            CacheLRU(0)
+
+@unittest.skipIf(reportes.np is None, "numpy no está instalado")
+class TestReportes(unittest.TestCase):
+    """Pruebas unitarias para los informes del historial de préstamos"""
+    
+    def setUp(self):
+        """Configuración antes de cada prueba"""
+        self.archivo_test = 'test_unitarias_reportes.json'
+        self.db = Database(self.archivo_test)
+        for isbn, autor in (('978-1', 'Ana'), ('978-2', 'Ana'), ('978-3', 'Beto')):
+            self.db.agregar('libros', {'isbn': isbn, 'titulo': isbn, 'autor': autor})
+        for numero, (isbn, usuario, inicio, fin) in enumerate([
+                ('978-1', 'U1', '2024-01-05T10:00:00', '2024-01-10T10:00:00'),
+                ('978-3', 'U2', '2024-01-20T10:00:00', '2024-02-19T10:00:00'),
+                ('978-1', 'U1', '2024-02-01T10:00:00', '2024-02-03T10:00:00'),
+                ('978-2', 'U1', '2024-03-01T10:00:00', None)]):
+            self.db.agregar('prestamos', {'id_prestamo': f'P{numero}', 'isbn_libro': isbn,
+                                          'id_usuario': usuario, 'fecha_prestamo': inicio,
+                                          'fecha_devolucion': fin})
+        self.reportes = Reportes(self.db)
+    
+    def tearDown(self):
+        """Limpieza después de cada prueba"""
+        for archivo in (self.archivo_test, self.archivo_test + '.lock'):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+    
+    def test_agregados_del_historial(self):
+        """Prueba los informes agrupados por libro, autor, mes y usuario"""
+        self.assertEqual(self.reportes.prestamos_por_libro(),
+                         [('978-1', 2), ('978-3', 1), ('978-2', 1)])
+        self.assertEqual(self.reportes.prestamos_por_autor(limite=1), [('Ana', 3)])
+        self.assertEqual(self.reportes.prestamos_por_mes(),
+                         [('2024-01', 2), ('2024-02', 1), ('2024-03', 1)])
+        self.assertEqual(self.reportes.usuarios_mas_activos(), [('U1', 3), ('U2', 1)])
+        self.assertAlmostEqual(self.reportes.duracion_media(), (5 + 30 + 2) / 3)
+        self.assertEqual(self.reportes.vencidos(ahora=datetime(2024, 3, 20)),
+                         {'activos': 1, 'devueltos': 1})
+    
+    def test_fecha_mal_formada_se_descarta(self):
+        """Prueba que un préstamo con una fecha inválida no impida el informe"""
+        self.db.agregar('prestamos', {'id_prestamo': 'P9', 'isbn_libro': '978-3',
+                                      'id_usuario': 'U3', 'fecha_prestamo': 'ayer'})
+        with self.assertLogs('reportes', 'WARNING'):
+            columnas = self.reportes.columnas()
+        self.assertEqual((len(columnas), columnas.descartados), (4, 1))
+        # Por tramos el resultado es el mismo
+        with self.assertLogs('reportes', 'WARNING'):
+            por_tramos = reportes.Columnas(self.db.iterar('prestamos'), tramo=2)
+        self.assertEqual(por_tramos.usuarios, columnas.usuarios)
+        self.assertTrue((por_tramos.prestamo == columnas.prestamo).all())
+        self.assertEqual(self.reportes.usuarios_mas_activos(), [('U1', 3), ('U2', 1)])
+    
+    def test_resultados_se_reutilizan_hasta_un_cambio(self):
+        """Prueba que columnas e informes se recalculen solo tras una modificación"""
+        columnas = self.reportes.columnas()
+        self.assertEqual(self.reportes.usuarios_mas_activos(1), [('U1', 3)])
+        self.assertIs(self.reportes.columnas(), columnas)
+        
+        self.db.actualizar('libros', 'isbn', '978-3', {'autor': 'Ana'})
+        self.assertIs(self.reportes.columnas(), columnas)
+        self.assertEqual(self.reportes.prestamos_por_autor(), [('Ana', 4)])
+        
+        for numero in range(4, 8):
+            self.db.agregar('prestamos', {'id_prestamo': f'P{numero}', 'isbn_libro': '978-3',
+                                          'id_usuario': 'U2', 'fecha_prestamo': '2024-04-01',
+                                          'fecha_devolucion': '2024-04-02'})
+        self.assertIsNot(self.reportes.columnas(), columnas)
+        self.assertEqual(self.reportes.usuarios_mas_activos(1), [('U2', 5)])
 
 if __name__ == '__main__':
     unittest.main()